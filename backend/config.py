@@ -9,7 +9,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Корень проекта: при запуске из exe — папка с exe (там лежит .env и history.json)
+# Корень проекта: при запуске из exe — папка с exe (там лежит .env и history.db)
 if getattr(sys, "frozen", False):
     PROJECT_ROOT = Path(sys.executable).resolve().parent
 else:
@@ -29,13 +29,50 @@ class Settings:
     deepseek_base_url: str = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     deepseek_model: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
+    # Пул соединений к LLM (один клиент на base_url, переиспользуется между запросами)
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    llm_pool_max_connections: int = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+    llm_pool_max_keepalive: int = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+    llm_keepalive_expiry: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    # Таймауты по провайдерам (по умолчанию LLM_TIMEOUT) и отдельный короткий — на установку соединения
+    deepseek_timeout: float = float(os.getenv("DEEPSEEK_TIMEOUT", os.getenv("LLM_TIMEOUT", "60")))
+    openai_timeout: float = float(os.getenv("OPENAI_TIMEOUT", os.getenv("LLM_TIMEOUT", "60")))
+    llm_connect_timeout: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    # Circuit breaker: после скольких ошибок подряд эндпоинт отключается и на сколько секунд
+    llm_breaker_failures: int = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+    llm_breaker_cooldown: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+    # Максимум одновременных запросов к LLM из async-эндпоинтов
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Пакетный анализ страниц (пакетный парсинг, мониторинг): до LLM_BATCH_SIZE страниц в одном запросе,
+    # пакет ждёт добора не дольше LLM_BATCH_MAX_WAIT сек; страницы длиннее LLM_BATCH_MAX_CHARS — по одной
+    llm_batch_size: int = int(os.getenv("LLM_BATCH_SIZE", "5"))
+    llm_batch_max_wait: float = float(os.getenv("LLM_BATCH_MAX_WAIT", "0.5"))
+    llm_batch_max_chars: int = int(os.getenv("LLM_BATCH_MAX_CHARS", "3000"))
+    # Бюджет токенов: max_tokens считается по схеме ответа, но не больше LLM_MAX_OUTPUT_TOKENS
+    # и не больше места, оставшегося в окне контекста модели (LLM_CONTEXT_TOKENS) после промпта
+    llm_max_output_tokens: int = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "8000"))
+    llm_context_tokens: int = int(os.getenv("LLM_CONTEXT_TOKENS", "64000"))
+    # JSON-режим ответа (response_format json_object); повторный запрос, если JSON не разобрался и после починки
+    llm_json_mode: bool = os.getenv("LLM_JSON_MODE", "true").lower() in ("true", "1", "yes")
+    llm_json_retry: bool = os.getenv("LLM_JSON_RETRY", "true").lower() in ("true", "1", "yes")
+
+    # Кэш ответов LLM (память LRU + TTL, опционально диск в data/)
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+    llm_cache_max_items: int = int(os.getenv("LLM_CACHE_MAX_ITEMS", "512"))
+    llm_cache_ttl: int = int(os.getenv("LLM_CACHE_TTL", "86400"))
+    llm_cache_disk: bool = os.getenv("LLM_CACHE_DISK", "false").lower() in ("true", "1", "yes")
+    llm_cache_dir: str = os.getenv("LLM_CACHE_DIR", "data/llm_cache")
+
     # API
     api_host: str = os.getenv("API_HOST", "0.0.0.0")
     api_port: int = int(os.getenv("API_PORT", "8000"))
 
-    # История
+    # История (SQLite; history.json старых версий импортируется при первом запуске)
     history_file: str = os.getenv("HISTORY_FILE", "history.json")
-    max_history_items: int = int(os.getenv("MAX_HISTORY_ITEMS", "10"))
+    history_db_file: str = os.getenv("HISTORY_DB_FILE", "history.db")
+    max_history_items: int = int(os.getenv("MAX_HISTORY_ITEMS", "20000"))
+    # Уплотнение (удаление записей сверх лимита) раз в N вставок, в фоне
+    history_compact_every: int = int(os.getenv("HISTORY_COMPACT_EVERY", "50"))
 
     # Парсер
     parser_timeout: int = int(os.getenv("PARSER_TIMEOUT", "10"))
@@ -43,13 +80,95 @@ class Settings:
         "PARSER_USER_AGENT",
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
     )
+    # Общий HTTP-клиент парсера: HTTP/2, пул соединений, время жизни keep-alive (сек)
+    parser_http2: bool = os.getenv("PARSER_HTTP2", "true").lower() in ("true", "1", "yes")
+    parser_max_connections: int = int(os.getenv("PARSER_MAX_CONNECTIONS", "100"))
+    parser_max_keepalive: int = int(os.getenv("PARSER_MAX_KEEPALIVE", "20"))
+    parser_keepalive_expiry: float = float(os.getenv("PARSER_KEEPALIVE_EXPIRY", "30"))
+    # Сколько байт страницы читать максимум (чтение и так прекращается, как только поля найдены)
+    parser_max_bytes: int = int(os.getenv("PARSER_MAX_BYTES", str(5 * 1024 * 1024)))
+    # Условный GET и пропуск анализа неизменившихся страниц (состояние — в data/page_state.db)
+    parser_change_detection: bool = os.getenv("PARSER_CHANGE_DETECTION", "true").lower() in ("true", "1", "yes")
+    page_state_file: str = os.getenv("PAGE_STATE_FILE", "data/page_state.db")
     use_selenium: bool = os.getenv("USE_SELENIUM", "false").lower() in ("true", "1", "yes")
+    # Максимум секунд ожидания h1 и абзаца после загрузки (готовая страница отдаётся сразу)
     parser_selenium_wait: int = int(os.getenv("PARSER_SELENIUM_WAIT", "5"))
+    # Пул браузеров: сколько Chrome держать открытыми и после скольких страниц пересоздавать
+    parser_selenium_pool_size: int = int(os.getenv("PARSER_SELENIUM_POOL_SIZE", "2"))
+    parser_selenium_max_pages: int = int(os.getenv("PARSER_SELENIUM_MAX_PAGES", "50"))
+    # Одновременных загрузок страниц всего и на один хост (для всех запросов, не только /parse_batch)
+    parser_batch_concurrency: int = int(os.getenv("PARSER_BATCH_CONCURRENCY", "20"))
+    parser_per_host_concurrency: int = int(os.getenv("PARSER_PER_HOST_CONCURRENCY", "2"))
+    # Максимум URL в одном запросе /parse_batch
+    parser_batch_max_urls: int = int(os.getenv("PARSER_BATCH_MAX_URLS", "500"))
+    # Вежливость к сайтам: темп запросов к одному хосту (запросов/сек и запас), robots.txt, 429/503
+    parser_host_rate: float = float(os.getenv("PARSER_HOST_RATE", "2"))
+    parser_host_burst: int = int(os.getenv("PARSER_HOST_BURST", "4"))
+    parser_respect_robots: bool = os.getenv("PARSER_RESPECT_ROBOTS", "true").lower() in ("true", "1", "yes")
+    parser_robots_ttl: int = int(os.getenv("PARSER_ROBOTS_TTL", "3600"))
+    parser_throttle_retries: int = int(os.getenv("PARSER_THROTTLE_RETRIES", "2"))
+    parser_max_retry_after: float = float(os.getenv("PARSER_MAX_RETRY_AFTER", "60"))
+    # Мониторинг: список URL (data/watch.db), интервал по умолчанию (мин), разброс интервала (±доля),
+    # одновременных проверок, такт планировщика (сек)
+    watch_enabled: bool = os.getenv("WATCH_ENABLED", "true").lower() in ("true", "1", "yes")
+    watch_db_file: str = os.getenv("WATCH_DB_FILE", "data/watch.db")
+    watch_default_interval: int = int(os.getenv("WATCH_DEFAULT_INTERVAL", "60"))
+    watch_jitter: float = float(os.getenv("WATCH_JITTER", "0.1"))
+    watch_concurrency: int = int(os.getenv("WATCH_CONCURRENCY", "4"))
+    watch_tick: float = float(os.getenv("WATCH_TICK", "30"))
+    # Фоновые задачи (POST /jobs): база (data/jobs.db), одновременно выполняемых задач, попыток на задачу,
+    # пауза перед повтором после ошибки провайдера (сек, удваивается с каждой попыткой, не больше
+    # JOB_RETRY_MAX_DELAY), сколько часов хранить завершённые задачи
+    job_db_file: str = os.getenv("JOB_DB_FILE", "data/jobs.db")
+    job_workers: int = int(os.getenv("JOB_WORKERS", "4"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+    job_retry_delay: float = float(os.getenv("JOB_RETRY_DELAY", "5"))
+    job_retry_max_delay: float = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+    job_ttl_hours: float = float(os.getenv("JOB_TTL_HOURS", "168"))
+
+    # Изображения: максимум байт загрузки (больше — 413), уменьшение до разрешения vision-модели
+    # (длинная сторона / короткая сторона, px), формат и качество пересжатия (webp или jpeg)
+    image_max_bytes: int = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+    image_max_side: int = int(os.getenv("IMAGE_MAX_SIDE", "2048"))
+    image_max_short_side: int = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+    image_format: str = os.getenv("IMAGE_FORMAT", "webp").lower()
+    image_quality: int = int(os.getenv("IMAGE_QUALITY", "80"))
+    # Почти одинаковые изображения (перцептивный хеш отличается не больше чем на N бит из 64)
+    # получают прошлый анализ; 0 — только точное совпадение
+    image_hash_distance: int = int(os.getenv("IMAGE_HASH_DISTANCE", "4"))
+    # /analyze_images: одновременно анализируемых изображений и максимум файлов в одном запросе
+    image_batch_concurrency: int = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+    image_batch_max_files: int = int(os.getenv("IMAGE_BATCH_MAX_FILES", "20"))
 
     @property
     def history_path(self) -> Path:
-        """Путь к файлу истории (в корне проекта)."""
+        """Путь к JSON-файлу истории старых версий (в корне проекта)."""
         return PROJECT_ROOT / self.history_file
 
+    @property
+    def history_db_path(self) -> Path:
+        """Путь к базе истории SQLite (в корне проекта)."""
+        return PROJECT_ROOT / self.history_db_file
+
+    @property
+    def page_state_path(self) -> Path:
+        """База состояния отслеживаемых страниц (ETag, хеш контента, последний анализ)."""
+        return PROJECT_ROOT / self.page_state_file
+
+    @property
+    def watch_db_path(self) -> Path:
+        """База списка мониторинга."""
+        return PROJECT_ROOT / self.watch_db_file
+
+    @property
+    def job_db_path(self) -> Path:
+        """База фоновых задач."""
+        return PROJECT_ROOT / self.job_db_file
+
+    @property
+    def llm_cache_path(self) -> Path:
+        """Папка дискового кэша ответов LLM."""
+        return PROJECT_ROOT / self.llm_cache_dir
+
 
 settings = Settings()
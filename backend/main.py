@@ -1,28 +1,62 @@
 """
 Главный модуль FastAPI. Мониторинг конкурентов — MVP ассистент.
 """
-import base64
+import asyncio
+import json
 import sys
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
+from typing import List, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.datastructures import MutableHeaders
 
 from backend.config import settings
 from backend.models.schemas import (
     TextAnalysisRequest,
     TextAnalysisResponse,
     ImageAnalysisResponse,
+    ImageBatchResponse,
     ParseDemoRequest,
     ParseDemoResponse,
-    ParsedContent,
+    ParseBatchRequest,
+    HistoryItem,
     HistoryResponse,
+    HistorySearchResponse,
+    WatchCreateRequest,
+    WatchUpdateRequest,
+    WatchItem,
+    WatchListResponse,
+    JobCreateRequest,
+    JobItem,
+    JobListResponse,
 )
 from backend.services.openai_service import openai_service
 from backend.services.parser_service import parser_service
 from backend.services.history_service import history_service
+from backend.services.cache_service import analysis_cache
+from backend.services.pipeline import (
+    analyze_and_record_text,
+    parse_and_analyze,
+    parse_and_analyze_many,
+    parse_and_analyze_stream,
+    record_text,
+)
+from backend.services import llm_usage
+from backend.services.llm_clients import llm_clients
+from backend.services.llm_router import llm_router
+from backend.services.metrics import metrics
+from backend.services.selenium_pool import selenium_pool
+from backend.services.host_scheduler import host_scheduler
+from backend.services.parser_service import normalize_url
+from backend.services.watch_service import watch_monitor, watch_store
+from backend.services import job_service
+from backend.services.job_service import job_runner, job_store
+from backend.services.image_service import ALLOWED_IMAGE_TYPES, ImageTooLarge, image_service, visual_style_stats
 
 # Путь к frontend: при запуске из exe — из упакованной папки _MEIPASS
 if getattr(sys, "frozen", False) and getattr(sys, "_MEIPASS", None):
@@ -31,12 +65,38 @@ else:
     PROJECT_ROOT = Path(__file__).resolve().parent.parent
     FRONTEND_DIR = (PROJECT_ROOT / "frontend").resolve()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Жизненный цикл приложения: общий HTTP-клиент парсера, пул браузеров, планировщик мониторинга,
+    воркеры фоновых задач; при остановке — останавливаем мониторинг и задачи, закрываем пулы.
+    """
+    await parser_service.start()
+    if settings.use_selenium:
+        try:
+            await asyncio.to_thread(selenium_pool.start)
+        except Exception:
+            # Нет Chrome/драйвера — приложение всё равно стартует, ошибка вернётся в ответе парсинга
+            pass
+    if settings.watch_enabled:
+        watch_monitor.start()
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    await watch_monitor.stop()
+    await parser_service.aclose()
+    await asyncio.to_thread(selenium_pool.close)
+    await llm_clients.aclose()
+
+
 app = FastAPI(
     title="Мониторинг конкурентов",
     description="MVP ассистент для анализа конкурентов (текст и изображения)",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -48,6 +108,41 @@ app.add_middleware(
 )
 
 
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing с длительностью этапов запроса (fetch, extract, llm_<провайдер>, parse_json,
+    history_write, ...) и метрики запросов по эндпоинтам. Чистый ASGI — потоковые ответы не буферизуются;
+    для них в заголовок попадают этапы до начала ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request, token = metrics.begin_request()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", request.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            metrics.end_request(request, token, endpoint, scope["method"], status)
+
+
+app.add_middleware(ServerTimingMiddleware)
+
+
 @app.get("/")
 async def root():
     """Главная страница — фронтенд."""
@@ -65,91 +160,357 @@ async def favicon():
         return FileResponse(path, media_type="image/svg+xml")
     return Response(status_code=204)
 
+def _sse(event: str, data: dict) -> str:
+    """Одно событие Server-Sent Events."""
+    if event == "error":
+        metrics.mark_failed()
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    # X-Accel-Buffering: nginx и подобные прокси не должны копить поток
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/analyze_text", response_model=TextAnalysisResponse)
-def analyze_text(request: TextAnalysisRequest):
+async def analyze_text(request: TextAnalysisRequest):
     """Анализ текста конкурента."""
     try:
-        analysis = openai_service.analyze_text(request.text)
-        history_service.add_entry(
-            request_type="text",
-            request_summary=request.text[:100] + "..." if len(request.text) > 100 else request.text,
-            response_summary=analysis.summary,
-            details={"analysis": analysis.model_dump()},
-        )
+        analysis = await analyze_and_record_text(request.text, bypass_cache=request.bypass_cache)
         return TextAnalysisResponse(success=True, analysis=analysis)
     except Exception as e:
+        metrics.mark_failed()
         return TextAnalysisResponse(success=False, error=str(e))
 
 
+@app.post("/analyze_text/stream")
+async def analyze_text_stream(request: TextAnalysisRequest):
+    """
+    Анализ текста с потоковой выдачей (SSE). События: delta — кусок ответа модели, item — элемент
+    массива, field — готовое поле, result — итоговый анализ (записан в историю), error — ошибка.
+    """
+
+    async def events():
+        try:
+            with llm_usage.track() as usage:
+                async for event, data in openai_service.analyze_text_stream(
+                    request.text, bypass_cache=request.bypass_cache
+                ):
+                    if event == "result":
+                        analysis = data["analysis"]
+                        await record_text(request.text, analysis, usage)
+                        data = {"analysis": analysis.model_dump(), "cached": data["cached"]}
+                    yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    return _sse_response(events())
+
+
 @app.post("/analyze_image", response_model=ImageAnalysisResponse)
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(file: UploadFile = File(...), bypass_cache: bool = Form(False)):
     """Анализ изображения конкурента."""
-    allowed = ["image/jpeg", "image/png", "image/gif", "image/webp"]
-    if file.content_type not in allowed:
+    if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"Неподдерживаемый тип файла. Разрешены: {', '.join(allowed)}",
+            detail=f"Неподдерживаемый тип файла. Разрешены: {', '.join(ALLOWED_IMAGE_TYPES)}",
         )
     try:
-        content = await file.read()
-        image_base64 = base64.b64encode(content).decode("utf-8")
-        analysis = openai_service.analyze_image(
-            image_base64=image_base64,
-            mime_type=file.content_type or "image/jpeg",
-        )
-        history_service.add_entry(
+        content = await image_service.read_upload(file)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        with llm_usage.track() as usage:
+            analysis, info = await image_service.analyze(
+                content, mime_type=file.content_type or "image/jpeg", bypass_cache=bypass_cache
+            )
+        await asyncio.to_thread(
+            history_service.add_entry,
             request_type="image",
             request_summary=f"Изображение: {file.filename}",
             response_summary=(analysis.description or "Анализ изображения")[:200],
-            details={"analysis": analysis.model_dump()},
+            details={"analysis": analysis.model_dump(), "image": info.model_dump(), "llm_usage": usage.as_dict()},
         )
-        return ImageAnalysisResponse(success=True, analysis=analysis)
+        return ImageAnalysisResponse(success=True, analysis=analysis, image=info)
     except Exception as e:
+        metrics.mark_failed()
         return ImageAnalysisResponse(success=False, error=str(e))
 
 
+@app.post("/analyze_images", response_model=ImageBatchResponse)
+async def analyze_images(files: List[UploadFile] = File(...), bypass_cache: bool = Form(False)):
+    """
+    Пакетный анализ изображений (например, все баннеры рекламной кампании): файлы анализируются
+    параллельно (IMAGE_BATCH_CONCURRENCY), в ответе — результат по каждому файлу и распределение
+    visual_style_score. В историю пишется одна общая запись.
+    """
+    if len(files) > settings.image_batch_max_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много файлов: максимум {settings.image_batch_max_files}",
+        )
+    try:
+        with llm_usage.track() as usage:
+            results = await image_service.analyze_uploads(files, bypass_cache=bypass_cache)
+        visual_style = visual_style_stats([r.analysis for r in results if r.success])
+        await asyncio.to_thread(
+            history_service.add_entry,
+            request_type="image",
+            request_summary=f"Изображения ({len(results)}): " + ", ".join(r.filename for r in results),
+            response_summary=(
+                f"Проанализировано {visual_style.count} из {len(results)}"
+                + (f", средняя оценка стиля {visual_style.mean}/10" if visual_style.count else "")
+            ),
+            details={
+                "images": [r.model_dump() for r in results],
+                "visual_style": visual_style.model_dump(),
+                "llm_usage": usage.as_dict(),
+            },
+        )
+        return ImageBatchResponse(success=visual_style.count > 0, results=results, visual_style=visual_style)
+    except Exception as e:
+        metrics.mark_failed()
+        return ImageBatchResponse(success=False, error=str(e))
+
+
 @app.post("/parse_demo", response_model=ParseDemoResponse)
 async def parse_demo(request: ParseDemoRequest):
     """Парсинг и анализ сайта конкурента (демо)."""
     try:
-        title, h1, first_paragraph, error = await parser_service.parse_url(request.url)
-        if error:
-            return ParseDemoResponse(success=False, error=error)
-        analysis = openai_service.analyze_parsed_content(
-            title=title, h1=h1, paragraph=first_paragraph
-        )
-        parsed_content = ParsedContent(
-            url=request.url,
-            title=title,
-            h1=h1,
-            first_paragraph=first_paragraph,
-            analysis=analysis,
-        )
-        history_service.add_entry(
-            request_type="parse",
-            request_summary=f"URL: {request.url}",
-            response_summary=title or "N/A",
-            details=parsed_content.model_dump(),
-        )
+        parsed_content = await parse_and_analyze(request.url, bypass_cache=request.bypass_cache)
+        if parsed_content.error:
+            metrics.mark_failed()
+            return ParseDemoResponse(success=False, error=parsed_content.error)
         return ParseDemoResponse(success=True, data=parsed_content)
     except Exception as e:
+        metrics.mark_failed()
         return ParseDemoResponse(success=False, error=str(e))
 
 
+@app.post("/parse_demo/stream")
+async def parse_demo_stream(request: ParseDemoRequest):
+    """
+    Парсинг и анализ с потоковой выдачей (SSE): page — извлечённые title/h1/абзац, затем
+    delta/item/field по мере генерации анализа, result — ParsedContent (записан в историю), error — ошибка.
+    """
+
+    async def events():
+        try:
+            async for event, data in parse_and_analyze_stream(request.url, bypass_cache=request.bypass_cache):
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    return _sse_response(events())
+
+
+@app.post("/parse_batch")
+async def parse_batch(request: ParseBatchRequest):
+    """
+    Пакетный парсинг и анализ списка URL. Ответ — NDJSON: по строке ParsedContent на каждый URL,
+    в порядке готовности. Ошибка по одному URL приходит в поле error и не прерывает остальные.
+    """
+    if len(request.urls) > settings.parser_batch_max_urls:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много URL: максимум {settings.parser_batch_max_urls}",
+        )
+
+    async def lines():
+        async for content in parse_and_analyze_many(request.urls, bypass_cache=request.bypass_cache):
+            yield content.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/watch", response_model=WatchListResponse)
+async def list_watch():
+    """Список URL на мониторинге с результатом последней проверки."""
+    items = await asyncio.to_thread(watch_store.list)
+    return WatchListResponse(items=items)
+
+
+@app.post("/watch", response_model=WatchItem, status_code=201)
+async def add_watch(request: WatchCreateRequest):
+    """Добавить URL в мониторинг. Первая проверка — сразу, дальше — раз в interval_minutes (± разброс)."""
+    url = normalize_url(request.url)
+    item = await asyncio.to_thread(
+        watch_store.add, url, request.interval_minutes or settings.watch_default_interval
+    )
+    if item is None:
+        raise HTTPException(status_code=409, detail="URL уже на мониторинге")
+    watch_monitor.wake()
+    return item
+
+
+@app.get("/watch/{watch_id}", response_model=WatchItem)
+async def get_watch(watch_id: str):
+    """Один URL мониторинга."""
+    item = await asyncio.to_thread(watch_store.get, watch_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="URL не найден в мониторинге")
+    return item
+
+
+@app.patch("/watch/{watch_id}", response_model=WatchItem)
+async def update_watch(watch_id: str, request: WatchUpdateRequest):
+    """Изменить интервал или включить/выключить проверку."""
+    item = await asyncio.to_thread(watch_store.update, watch_id, request.interval_minutes, request.enabled)
+    if item is None:
+        raise HTTPException(status_code=404, detail="URL не найден в мониторинге")
+    watch_monitor.wake()
+    return item
+
+
+@app.post("/watch/{watch_id}/check", response_model=WatchItem)
+async def check_watch_now(watch_id: str):
+    """Проверить URL вне расписания (как можно скорее)."""
+    item = await asyncio.to_thread(watch_store.check_now, watch_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="URL не найден в мониторинге")
+    watch_monitor.wake()
+    return item
+
+
+@app.delete("/watch/{watch_id}")
+async def delete_watch(watch_id: str):
+    """Убрать URL из мониторинга (история проверок остаётся)."""
+    if not await asyncio.to_thread(watch_store.delete, watch_id):
+        raise HTTPException(status_code=404, detail="URL не найден в мониторинге")
+    watch_monitor.wake()
+    return {"success": True}
+
+
+@app.post("/jobs", response_model=JobItem, status_code=202)
+async def create_job(request: JobCreateRequest):
+    """
+    Поставить анализ в очередь: kind=text (text), parse (url) или parse_batch (urls). Ответ — сразу,
+    с id задачи; состояние — GET /jobs/{id} или websocket /jobs/{id}/ws.
+    """
+    try:
+        payload, total = job_service.validate(request.kind, request.text, request.url, request.urls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await asyncio.to_thread(job_store.add, request.kind, payload, total, request.bypass_cache)
+    job_runner.wake()
+    return job
+
+
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs(
+    status: Optional[str] = Query(None, description="queued, running, done или failed"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Фоновые задачи, новые первыми (без результатов)."""
+    items = await asyncio.to_thread(job_store.list, status, limit)
+    return JobListResponse(items=items)
+
+
+@app.get("/jobs/{job_id}", response_model=JobItem)
+async def get_job(job_id: str):
+    """Состояние задачи, прогресс и результат (для parse_batch — готовые URL, пока задача идёт)."""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Удалить задачу; выполняющаяся прерывается (уже записанное в историю остаётся)."""
+    if not await asyncio.to_thread(job_store.delete, job_id):
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    job_runner.discard(job_id)
+    return {"success": True}
+
+
+@app.websocket("/jobs/{job_id}/ws")
+async def job_updates(websocket: WebSocket, job_id: str):
+    """
+    Ход задачи: сообщения {"event": ..., "data": ...} — status (состояние задачи; последнее — с результатом),
+    item (готовый URL пакета), deleted. После завершения задачи соединение закрывается.
+    """
+    await websocket.accept()
+    queue = job_runner.subscribe(job_id)
+    try:
+        job = await asyncio.to_thread(job_store.get, job_id)
+        if job is None:
+            await websocket.send_json({"event": "error", "data": {"error": "Задача не найдена"}})
+            await websocket.close(code=4404)
+            return
+        await websocket.send_json({"event": "status", "data": job.model_dump(mode="json")})
+        finished = job.status in job_service.FINISHED
+        while not finished:
+            event, data = await queue.get()
+            await websocket.send_json({"event": event, "data": data})
+            finished = event == "deleted" or (event == "status" and data["status"] in job_service.FINISHED)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job_runner.unsubscribe(job_id, queue)
+
+
 @app.get("/history", response_model=HistoryResponse)
-async def get_history():
-    """Получить историю последних запросов."""
-    items = history_service.get_history()
-    return HistoryResponse(items=items, total=len(items))
+async def get_history(
+    limit: int = Query(50, ge=1, le=500, description="Записей на странице"),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    request_type: Optional[str] = Query(None, description="text, image или parse"),
+    since: Optional[datetime] = Query(None, description="Не раньше (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Не позже (ISO 8601)"),
+):
+    """История запросов: краткие записи, новые первыми, с курсорной пагинацией."""
+    try:
+        items, next_cursor, total = await asyncio.to_thread(
+            history_service.get_page,
+            limit=limit,
+            cursor=cursor,
+            request_type=request_type,
+            since=since,
+            until=until,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return HistoryResponse(items=items, total=total, next_cursor=next_cursor)
+
+
+@app.get("/history/search", response_model=HistorySearchResponse)
+async def search_history(
+    q: str = Query(..., min_length=1, description="Слова для поиска: тема, конкурент, URL"),
+    limit: int = Query(20, ge=1, le=100),
+    request_type: Optional[str] = Query(None, description="text, image или parse"),
+):
+    """Полнотекстовый поиск по истории (с учётом русской морфологии)."""
+    items = await asyncio.to_thread(history_service.search, q, limit, request_type)
+    return HistorySearchResponse(query=q, items=items)
+
+
+@app.get("/history/{item_id}", response_model=HistoryItem)
+async def get_history_item(item_id: str):
+    """Полная запись истории (с details) — загружается по клику."""
+    item = await asyncio.to_thread(history_service.get_entry, item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    return item
 
 
 @app.delete("/history")
 async def clear_history():
     """Очистить историю."""
-    history_service.clear_history()
+    await asyncio.to_thread(history_service.clear_history)
     return {"success": True, "message": "История очищена"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus: длительность этапов, запросы и ошибки по эндпоинтам, токены, байты."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/health")
 async def health_check():
     """Проверка работоспособности сервиса."""
@@ -157,6 +518,18 @@ async def health_check():
         "status": "healthy",
         "service": "Competitor Monitor",
         "version": "1.0.0",
+        "cache": analysis_cache.stats(),
+        "inflight": {
+            "llm": openai_service.inflight.stats(),
+            "parser": parser_service.inflight.stats(),
+        },
+        "selenium": selenium_pool.stats() if settings.use_selenium else None,
+        "llm": llm_router.stats(),
+        "llm_batch": openai_service.batch_stats(),
+        "images": image_service.stats(),
+        "crawler": host_scheduler.stats(),
+        "monitor": await watch_monitor.stats(),
+        "jobs": await job_runner.stats(),
     }
 
 
@@ -2,7 +2,7 @@
 Pydantic-схемы для API (запросы и ответы).
 """
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from pydantic import BaseModel, Field
 
 
@@ -11,11 +11,40 @@ from pydantic import BaseModel, Field
 class TextAnalysisRequest(BaseModel):
     """Запрос на анализ текста."""
     text: str = Field(..., min_length=10, description="Текст для анализа")
+    bypass_cache: bool = Field(False, description="Не брать ответ из кэша")
 
 
 class ParseDemoRequest(BaseModel):
     """Запрос на парсинг URL."""
     url: str = Field(..., description="URL для парсинга")
+    bypass_cache: bool = Field(False, description="Не брать ответ из кэша")
+
+
+class ParseBatchRequest(BaseModel):
+    """Запрос на пакетный парсинг списка URL."""
+    urls: List[str] = Field(..., min_length=1, description="Список URL для парсинга")
+    bypass_cache: bool = Field(False, description="Не брать ответ из кэша")
+
+
+class WatchCreateRequest(BaseModel):
+    """Добавить URL в мониторинг."""
+    url: str = Field(..., description="URL страницы конкурента")
+    interval_minutes: Optional[int] = Field(None, ge=1, description="Интервал проверки, минут (по умолчанию WATCH_DEFAULT_INTERVAL)")
+
+
+class WatchUpdateRequest(BaseModel):
+    """Изменить интервал или включить/выключить проверку."""
+    interval_minutes: Optional[int] = Field(None, ge=1, description="Интервал проверки, минут")
+    enabled: Optional[bool] = Field(None, description="Проверять ли URL")
+
+
+class JobCreateRequest(BaseModel):
+    """Поставить анализ в очередь фоновых задач."""
+    kind: str = Field(..., description="text, parse или parse_batch")
+    text: Optional[str] = Field(None, description="Текст для анализа (kind=text)")
+    url: Optional[str] = Field(None, description="URL (kind=parse)")
+    urls: Optional[List[str]] = Field(None, description="Список URL (kind=parse_batch)")
+    bypass_cache: bool = Field(False, description="Не брать ответ из кэша")
 
 
 # === Ответы ===
@@ -50,6 +79,7 @@ class ParsedContent(BaseModel):
     first_paragraph: Optional[str] = None
     analysis: Optional[CompetitorAnalysis] = None
     error: Optional[str] = None
+    not_modified: bool = False  # страница не изменилась с прошлой проверки
 
 
 class TextAnalysisResponse(BaseModel):
@@ -59,10 +89,48 @@ class TextAnalysisResponse(BaseModel):
     error: Optional[str] = None
 
 
+class ImageInfo(BaseModel):
+    """Что отправлено в модель после подготовки изображения."""
+    original_bytes: int
+    sent_bytes: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mime_type: str
+    similar: bool = False  # анализ взят у почти такого же изображения, модель не вызывалась
+
+
 class ImageAnalysisResponse(BaseModel):
     """Ответ на анализ изображения."""
     success: bool
     analysis: Optional[ImageAnalysis] = None
+    image: Optional[ImageInfo] = None
+    error: Optional[str] = None
+
+
+class ImageBatchItem(BaseModel):
+    """Результат по одному файлу из /analyze_images."""
+    filename: str
+    success: bool
+    analysis: Optional[ImageAnalysis] = None
+    image: Optional[ImageInfo] = None
+    error: Optional[str] = None
+
+
+class VisualStyleStats(BaseModel):
+    """Распределение visual_style_score по успешно проанализированным изображениям."""
+    count: int = 0
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    min: Optional[int] = None
+    max: Optional[int] = None
+    histogram: Dict[int, int] = Field(default_factory=dict, description="Оценка (0-10) → число изображений")
+
+
+class ImageBatchResponse(BaseModel):
+    """Ответ на пакетный анализ изображений."""
+    success: bool
+    results: List[ImageBatchItem] = Field(default_factory=list)
+    visual_style: VisualStyleStats = Field(default_factory=VisualStyleStats)
     error: Optional[str] = None
 
 
@@ -85,7 +153,71 @@ class HistoryItem(BaseModel):
     details: Optional[dict] = None  # полные данные для просмотра по клику
 
 
+class HistorySummary(BaseModel):
+    """Краткая запись истории для списка (без details — они по /history/{id})."""
+    id: str
+    timestamp: datetime
+    request_type: str
+    request_summary: str
+    response_summary: str
+
+
+class HistorySearchResponse(BaseModel):
+    """Результаты поиска по истории (лучшие совпадения первыми)."""
+    query: str
+    items: List[HistorySummary]
+
+
 class HistoryResponse(BaseModel):
-    """Ответ со списком истории."""
-    items: List[HistoryItem]
+    """Страница истории: краткие записи, общее число по фильтру и курсор следующей страницы."""
+    items: List[HistorySummary]
     total: int
+    next_cursor: Optional[str] = None
+
+
+# === Мониторинг ===
+
+class WatchItem(BaseModel):
+    """Отслеживаемый URL и результат последней проверки."""
+    id: str
+    url: str
+    interval_minutes: int
+    enabled: bool
+    created_at: datetime
+    next_check: Optional[datetime] = None
+    last_checked: Optional[datetime] = None
+    last_status: Optional[str] = None  # "changed", "unchanged", "error"
+    last_error: Optional[str] = None
+    last_changed: Optional[datetime] = None
+    checks: int = 0
+    changes: int = 0
+
+
+class WatchListResponse(BaseModel):
+    """Список отслеживаемых URL."""
+    items: List[WatchItem]
+
+
+# === Фоновые задачи ===
+
+class JobItem(BaseModel):
+    """Фоновая задача: состояние, прогресс и (по /jobs/{id}) результат."""
+    id: str
+    kind: str  # "text", "parse", "parse_batch"
+    status: str  # "queued", "running", "done", "failed"
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    next_attempt_at: Optional[datetime] = None  # когда повтор после ошибки провайдера
+    attempts: int = 0
+    max_attempts: int = 1
+    progress_done: int = 0
+    progress_total: int = 1
+    error: Optional[str] = None
+    # text — CompetitorAnalysis, parse — ParsedContent, parse_batch — список ParsedContent
+    result: Optional[Any] = None
+
+
+class JobListResponse(BaseModel):
+    """Список фоновых задач (без результатов)."""
+    items: List[JobItem]
@@ -1,3 +1,5 @@
 from .openai_service import openai_service
 from .parser_service import parser_service
 from .history_service import history_service
+from .llm_clients import llm_clients
+from .cache_service import analysis_cache
@@ -0,0 +1,88 @@
+"""
+Микропакеты: одиночные вызовы копятся и выполняются одним пакетом — когда набралось max_size
+или прошло max_wait секунд с первого вызова в пакете.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+# run_batch(items) → результат (или исключение) для каждого элемента в том же порядке
+BatchRunner = Callable[[List[Any]], Awaitable[Sequence[Any]]]
+
+
+class MicroBatcher:
+    """Сбор одиночных вызовов в пакеты для run_batch. Ошибка пакета целиком пробрасывается каждому вызову."""
+
+    def __init__(self, run_batch: BatchRunner, max_size: int, max_wait: float):
+        self.run_batch = run_batch
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: set = set()
+        self.batches = 0
+        self.items = 0
+        self.max_batch = 0
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        """Очередь привязана к циклу событий; при смене цикла (тесты, скрипты) начинаем заново."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._tasks = set()
+        return loop
+
+    async def submit(self, item: Any) -> Any:
+        """Поставить элемент в текущий пакет и дождаться его результата."""
+        loop = self._bind_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Отменённые вызовы в пакет не берём
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        task = self._loop.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        for _, future in batch[len(results):]:
+            if not future.done():
+                future.set_exception(RuntimeError("Пакет вернул меньше результатов, чем элементов"))
+
+    def stats(self) -> dict:
+        """Счётчики: пакетов, элементов, средний и максимальный размер пакета, ожидают сейчас."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+        }
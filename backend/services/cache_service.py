@@ -0,0 +1,161 @@
+"""
+Кэш ответов LLM: ключ — хеш модели, системного промпта, температуры и нормализованного входа.
+Память (LRU + TTL) и опционально диск (data/llm_cache).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from backend.config import settings
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Нормализация текста для ключа: пробелы схлопываются, регистр не трогаем."""
+    return " ".join((text or "").split())
+
+
+class AnalysisCache:
+    """LRU-кэш проанализированных ответов с TTL и дисковым уровнем."""
+
+    def __init__(self):
+        self.enabled = settings.llm_cache_enabled
+        self.max_items = max(1, settings.llm_cache_max_items)
+        self.ttl = settings.llm_cache_ttl
+        self.disk_dir: Optional[Path] = settings.llm_cache_path if settings.llm_cache_disk else None
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, temperature: float, payload: Union[str, bytes]) -> str:
+        """Ключ кэша. payload — нормализованный текст или байты изображения."""
+        h = hashlib.sha256()
+        for part in (model, system_prompt, repr(temperature)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        h.update(payload if isinstance(payload, bytes) else payload.encode("utf-8"))
+        return h.hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        """Прочитать запись с диска: (created, value) или None."""
+        path = self._disk_path(key)
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+            return record["created"], record["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: str, created: float, value: dict):
+        """Записать на диск атомарно (через временный файл)."""
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"created": created, "value": value}, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+        except OSError:
+            pass
+
+    def _get_memory(self, key: str, now: float) -> Optional[dict]:
+        """Значение из памяти или None; просроченная запись удаляется."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._items[key]
+        return None
+
+    def _from_disk(self, key: str, entry: Optional[tuple], now: float) -> Optional[dict]:
+        """Учесть результат чтения с диска: свежую запись поднять в память, иначе — промах."""
+        if entry is not None and now - entry[0] <= self.ttl:
+            with self._lock:
+                self._put(key, entry)
+                self.disk_hits += 1
+            return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Значение по ключу или None (промах, истёк TTL, кэш выключен)."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        entry = self._read_disk(key) if self.disk_dir is not None else None
+        return self._from_disk(key, entry, now)
+
+    async def get_async(self, key: str) -> Optional[dict]:
+        """Как get, но чтение с диска — в потоке, чтобы не блокировать цикл событий. Память — сразу."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        entry = await asyncio.to_thread(self._read_disk, key) if self.disk_dir is not None else None
+        return self._from_disk(key, entry, now)
+
+    def _put(self, key: str, entry: tuple):
+        """Положить в память с вытеснением самых старых (вызывать под _lock)."""
+        self._items[key] = entry
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def set(self, key: str, value: dict):
+        """Сохранить значение в памяти и (если включено) на диске."""
+        if not self.enabled:
+            return
+        entry = (time.time(), value)
+        with self._lock:
+            self._put(key, entry)
+        if self.disk_dir is not None:
+            self._write_disk(key, *entry)
+
+    async def set_async(self, key: str, value: dict):
+        """Как set, но запись на диск — в потоке."""
+        if not self.enabled:
+            return
+        entry = (time.time(), value)
+        with self._lock:
+            self._put(key, entry)
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._write_disk, key, *entry)
+
+    def clear(self):
+        """Очистить память (диск не трогаем — записи отсеются по TTL)."""
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        """Счётчики для /health."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk": self.disk_dir is not None,
+            }
+
+
+analysis_cache = AnalysisCache()
@@ -1,42 +1,183 @@
 """
-Сервис управления историей запросов (последние N записей в JSON).
+Сервис управления историей запросов: SQLite (WAL), запись — одна вставка, чтение — по индексу.
 """
+import base64
 import json
+import sqlite3
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 from backend.config import settings
-from backend.models.schemas import HistoryItem
+from backend.models.schemas import HistoryItem, HistorySummary
+from backend.services.metrics import metrics
+from backend.services.text_search import collect_strings, fts_query, tokenize
+
+SUMMARY_COLUMNS = "seq, id, timestamp, request_type, request_summary, response_summary"
+# seq — INTEGER PRIMARY KEY: от 1 до предела знакового 64-битного целого SQLite
+MAX_SEQ = 2 ** 63 - 1
+
+
+def _encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(str(seq).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    """Курсор → seq последней выданной записи. ValueError, если курсор испорчен."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        seq = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    # Вне диапазона seq sqlite3 бросил бы OverflowError при подстановке параметра
+    if not 1 <= seq <= MAX_SEQ:
+        raise ValueError("Некорректный курсор")
+    return seq
+
+
+def _iso(value: datetime) -> str:
+    """Граница диапазона в формате хранения (локальное время без зоны)."""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
 
 
 class HistoryService:
     """Управление историей запросов."""
 
     def __init__(self):
-        self.history_path: Path = settings.history_path
+        self.db_path: Path = settings.history_db_path
+        self.legacy_path: Path = settings.history_path
         self.max_items = settings.max_history_items
-        self._ensure_file_exists()
+        self.compact_every = max(1, settings.history_compact_every)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inserts_since_compact = 0
+        self._compacting = False
+        self.search_enabled = False
+        self._init_db()
+        self._migrate_legacy_json()
+        self._init_search()
 
-    def _ensure_file_exists(self):
-        """Создать файл истории, если его нет."""
-        if not self.history_path.exists():
-            self.history_path.write_text("[]", encoding="utf-8")
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение для текущего потока (sqlite3 не делит соединения между потоками)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
 
-    def _load_history(self) -> List[dict]:
-        """Загрузить историю из файла."""
+    def _init_db(self):
+        """Создать таблицу и индексы, если их нет."""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    timestamp TEXT NOT NULL,
+                    request_type TEXT NOT NULL,
+                    request_summary TEXT NOT NULL,
+                    response_summary TEXT NOT NULL,
+                    details TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_type ON history(request_type, seq)")
+
+    def _init_search(self):
+        """Полнотекстовый индекс (FTS5, rowid = seq записи). Для старых записей строится один раз."""
+        conn = self._conn()
         try:
-            content = self.history_path.read_text(encoding="utf-8")
-            return json.loads(content)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
+            with conn:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                    "summary, body, tokenize='unicode61 remove_diacritics 0')"
+                )
+        except sqlite3.OperationalError:
+            # SQLite без FTS5 — поиск недоступен, остальная история работает
+            return
+        self.search_enabled = True
+        indexed = conn.execute("SELECT COUNT(*) FROM history_fts").fetchone()[0]
+        if indexed:
+            return
+        rows = conn.execute(
+            "SELECT seq, request_summary, response_summary, details FROM history"
+        ).fetchall()
+        with conn:
+            for row in rows:
+                details = json.loads(row["details"]) if row["details"] else None
+                self._index(conn, row["seq"], row["request_summary"], row["response_summary"], details)
+
+    def _index(self, conn: sqlite3.Connection, seq: int, request_summary: str, response_summary: str, details):
+        """Добавить запись в полнотекстовый индекс: основы слов резюме и всех строк details."""
+        if not self.search_enabled:
+            return
+        summary = " ".join(tokenize(f"{request_summary} {response_summary}"))
+        body = " ".join(tokenize(" ".join(collect_strings(details))))
+        conn.execute("INSERT INTO history_fts (rowid, summary, body) VALUES (?, ?, ?)", (seq, summary, body))
+
+    def _migrate_legacy_json(self):
+        """Перенести записи из старого history.json (один раз, файл переименовывается в *.migrated)."""
+        if not self.legacy_path.exists():
+            return
+        try:
+            items = json.loads(self.legacy_path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            items = []
+        with self._conn() as conn:
+            # В JSON новые записи были в начале — вставляем с конца, чтобы порядок seq сохранился
+            for it in reversed(items if isinstance(items, list) else []):
+                conn.execute(
+                    "INSERT OR IGNORE INTO history (id, timestamp, request_type, request_summary, response_summary, details)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        it.get("id") or str(uuid.uuid4()),
+                        it.get("timestamp") or datetime.now().isoformat(),
+                        it.get("request_type", ""),
+                        it.get("request_summary", ""),
+                        it.get("response_summary", ""),
+                        self._dump_details(it.get("details")),
+                    ),
+                )
+        try:
+            self.legacy_path.replace(self.legacy_path.with_name(self.legacy_path.name + ".migrated"))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _dump_details(details) -> str | None:
+        if details is None:
+            return None
+        return json.dumps(details, ensure_ascii=False, default=str)
 
-    def _save_history(self, history: List[dict]):
-        """Сохранить историю в файл."""
-        self.history_path.write_text(
-            json.dumps(history, ensure_ascii=False, indent=2, default=str),
-            encoding="utf-8"
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> HistoryItem:
+        details = row["details"]
+        return HistoryItem(
+            id=row["id"],
+            timestamp=row["timestamp"],
+            request_type=row["request_type"],
+            request_summary=row["request_summary"],
+            response_summary=row["response_summary"],
+            details=json.loads(details) if details else None,
+        )
+
+    @staticmethod
+    def _row_to_summary(row: sqlite3.Row) -> HistorySummary:
+        return HistorySummary(
+            id=row["id"],
+            timestamp=row["timestamp"],
+            request_type=row["request_type"],
+            request_summary=row["request_summary"],
+            response_summary=row["response_summary"],
         )
 
     def add_entry(
@@ -47,7 +188,6 @@ class HistoryService:
         details: dict | None = None,
     ) -> HistoryItem:
         """Добавить запись в историю. details — полные данные для просмотра по клику."""
-        history = self._load_history()
         item = {
             "id": str(uuid.uuid4()),
             "timestamp": datetime.now().isoformat(),
@@ -56,19 +196,139 @@ class HistoryService:
             "response_summary": (response_summary or "")[:500],
             "details": details,
         }
-        history.insert(0, item)
-        history = history[: self.max_items]
-        self._save_history(history)
+        with metrics.stage("history_write"), self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO history (id, timestamp, request_type, request_summary, response_summary, details)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    item["id"],
+                    item["timestamp"],
+                    item["request_type"],
+                    item["request_summary"],
+                    item["response_summary"],
+                    self._dump_details(details),
+                ),
+            )
+            self._index(conn, cur.lastrowid, item["request_summary"], item["response_summary"], details)
+        self._maybe_compact()
         return HistoryItem(**item)
 
+    def _maybe_compact(self):
+        """Раз в compact_every вставок запустить уплотнение в фоновом потоке."""
+        with self._lock:
+            self._inserts_since_compact += 1
+            if self._compacting or self._inserts_since_compact < self.compact_every:
+                return
+            self._inserts_since_compact = 0
+            self._compacting = True
+        threading.Thread(target=self._compact_background, daemon=True).start()
+
+    def _compact_background(self):
+        try:
+            self.compact()
+        except sqlite3.Error:
+            pass
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """Удалить записи сверх MAX_HISTORY_ITEMS и сбросить WAL в основной файл."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT seq FROM history ORDER BY seq DESC LIMIT 1 OFFSET ?", (self.max_items,)
+        ).fetchone()
+        if row is None:
+            return
+        with conn:
+            conn.execute("DELETE FROM history WHERE seq <= ?", (row["seq"],))
+            if self.search_enabled:
+                conn.execute("DELETE FROM history_fts WHERE rowid <= ?", (row["seq"],))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @staticmethod
+    def _filters(
+        request_type: Optional[str],
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ) -> Tuple[List[str], list]:
+        """Условия WHERE и параметры для фильтров по типу и времени."""
+        where, params = [], []
+        if request_type:
+            where.append("request_type = ?")
+            params.append(request_type)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(_iso(since))
+        if until is not None:
+            where.append("timestamp <= ?")
+            params.append(_iso(until))
+        return where, params
+
+    def get_page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        request_type: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Tuple[List[HistorySummary], Optional[str], int]:
+        """
+        Страница истории (новые первыми) без details — keyset-пагинация по seq.
+        Returns: (items, next_cursor, total) — total по фильтру без учёта курсора.
+        """
+        where, params = self._filters(request_type, since, until)
+        conn = self._conn()
+        total_sql = "SELECT COUNT(*) FROM history" + (" WHERE " + " AND ".join(where) if where else "")
+        total = conn.execute(total_sql, params).fetchone()[0]
+        if cursor:
+            where = where + ["seq < ?"]
+            params = params + [_decode_cursor(cursor)]
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM history"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq DESC LIMIT ?"
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = _encode_cursor(rows[limit - 1]["seq"]) if len(rows) > limit else None
+        items = [self._row_to_summary(row) for row in rows[:limit]]
+        return items, next_cursor, total
+
+    def search(self, query: str, limit: int = 20, request_type: Optional[str] = None) -> List[HistorySummary]:
+        """Полнотекстовый поиск (русская морфология), лучшие совпадения первыми (BM25, резюме весомее)."""
+        match = fts_query(query)
+        if not self.search_enabled or not match:
+            return []
+        sql = (
+            "SELECT h.seq, h.id, h.timestamp, h.request_type, h.request_summary, h.response_summary"
+            " FROM history_fts JOIN history h ON h.seq = history_fts.rowid"
+            " WHERE history_fts MATCH ?"
+        )
+        params: list = [match]
+        if request_type:
+            sql += " AND h.request_type = ?"
+            params.append(request_type)
+        sql += " ORDER BY bm25(history_fts, 2.0, 1.0) LIMIT ?"
+        rows = self._conn().execute(sql, params + [limit]).fetchall()
+        return [self._row_to_summary(row) for row in rows]
+
+    def get_entry(self, item_id: str) -> Optional[HistoryItem]:
+        """Полная запись (с details) по id или None."""
+        row = self._conn().execute("SELECT * FROM history WHERE id = ?", (item_id,)).fetchone()
+        return self._row_to_item(row) if row else None
+
     def get_history(self) -> List[HistoryItem]:
-        """Получить всю историю."""
-        history = self._load_history()
-        return [HistoryItem(**it) for it in history]
+        """Получить историю (последние MAX_HISTORY_ITEMS записей, новые первыми)."""
+        rows = self._conn().execute(
+            "SELECT * FROM history ORDER BY seq DESC LIMIT ?", (self.max_items,)
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
 
     def clear_history(self):
         """Очистить историю."""
-        self._save_history([])
+        with self._conn() as conn:
+            conn.execute("DELETE FROM history")
+            if self.search_enabled:
+                conn.execute("DELETE FROM history_fts")
 
 
 history_service = HistoryService()
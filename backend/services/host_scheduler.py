@@ -0,0 +1,304 @@
+"""
+Вежливый обход сайтов: очередь на каждый хост, token bucket, пауза по Retry-After (429/503),
+Crawl-delay и Disallow из robots.txt, справедливая выдача слотов хостам по кругу.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from backend.config import settings
+from backend.services.singleflight import SingleFlight
+
+# Как часто (сек) искать простаивающие хосты для удаления из памяти
+HOST_SWEEP_INTERVAL = 60.0
+
+
+def host_key(url: str) -> str:
+    """Ключ очереди — хост с портом (URL уже нормализован)."""
+    return urlsplit(url).netloc
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After: секунды или HTTP-дата. None — заголовка нет или он не разобран."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class _Host:
+    """Состояние одного хоста: token bucket, пауза после 429/503, очередь ожидающих и метрики."""
+    name: str
+    rate: float
+    burst: float
+    tokens: float
+    updated: float
+    crawl_delay: Optional[float] = None
+    active: int = 0
+    blocked_until: float = 0.0
+    throttle_streak: int = 0
+    waiters: Deque[Tuple[asyncio.Future, float]] = field(default_factory=deque)
+    requests: int = 0
+    throttled: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    max_depth: int = 0
+    last_used: float = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float, per_host: int) -> float:
+        """Когда хосту можно выдать следующий слот (inf — ждём освобождения активного запроса)."""
+        if self.active >= per_host:
+            return float("inf")
+        self.refill(now)
+        token_at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(token_at, self.blocked_until)
+
+    def drop_cancelled(self):
+        while self.waiters and self.waiters[0][0].done():
+            self.waiters.popleft()
+
+
+class HostScheduler:
+    """
+    Планировщик загрузок перед ParserService: не больше PARSER_BATCH_CONCURRENCY загрузок всего
+    и PARSER_PER_HOST_CONCURRENCY на хост, темп хоста — token bucket (PARSER_HOST_RATE/BURST),
+    замедленный до Crawl-delay из robots.txt. Свободный слот получает следующий по кругу готовый хост.
+    """
+
+    def __init__(self):
+        self.max_total = max(1, settings.parser_batch_concurrency)
+        self.per_host = max(1, settings.parser_per_host_concurrency)
+        self.rate = max(0.01, settings.parser_host_rate)
+        self.burst = max(1.0, float(settings.parser_host_burst))
+        self.respect_robots = settings.parser_respect_robots
+        self.hosts: Dict[str, _Host] = {}
+        self._ring: Deque[str] = deque()
+        self._active = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # robots.txt: хост → (момент устаревания, разобранный файл или None = ограничений нет)
+        self._robots: Dict[str, Tuple[float, Optional[RobotFileParser]]] = {}
+        self._robots_inflight = SingleFlight()
+        # Хост без запросов дольше этого забывается (вместе с robots.txt): к этому времени
+        # bucket всё равно полон, пауза по Retry-After истекла, а robots.txt устарел
+        self.idle_ttl = max(float(settings.parser_robots_ttl), settings.parser_max_retry_after)
+        self._swept = time.monotonic()
+
+    def _bind_loop(self):
+        """Очереди привязаны к циклу событий; при смене цикла (тесты, скрипты) начинаем заново."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.hosts.clear()
+            self._ring.clear()
+            self._active = 0
+            self._timer = None
+            self._robots.clear()
+            self._robots_inflight = SingleFlight()
+        return loop
+
+    def _host(self, name: str) -> _Host:
+        now = time.monotonic()
+        host = self.hosts.get(name)
+        if host is None:
+            self._evict_idle(now)
+            host = _Host(name=name, rate=self.rate, burst=self.burst, tokens=self.burst, updated=now)
+            self.hosts[name] = host
+        host.last_used = now
+        return host
+
+    def _evict_idle(self, now: float):
+        """Забыть хосты без активных и ожидающих запросов, простаивающие дольше idle_ttl (не чаще HOST_SWEEP_INTERVAL)."""
+        if now - self._swept < HOST_SWEEP_INTERVAL:
+            return
+        self._swept = now
+        in_ring = set(self._ring)
+        for name, host in list(self.hosts.items()):
+            if (
+                not host.active
+                and not host.waiters
+                and name not in in_ring
+                and host.blocked_until <= now
+                and now - host.last_used > self.idle_ttl
+            ):
+                del self.hosts[name]
+                self._robots.pop(name, None)
+
+    # --- выдача слотов ---
+
+    def _dispatch(self):
+        """Раздать свободные слоты готовым хостам по кругу; если все ждут — завести таймер."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        wake_at = None
+        skipped = 0
+        while self._ring and self._active < self.max_total and skipped < len(self._ring):
+            host = self.hosts[self._ring.popleft()]
+            host.drop_cancelled()
+            if not host.waiters:
+                continue
+            ready_at = host.ready_at(now, self.per_host)
+            if ready_at > now:
+                self._ring.append(host.name)
+                skipped += 1
+                if ready_at != float("inf"):
+                    wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                continue
+            future, queued_at = host.waiters.popleft()
+            host.tokens -= 1
+            host.active += 1
+            self._active += 1
+            waited = now - queued_at
+            host.requests += 1
+            host.wait_total += waited
+            host.wait_max = max(host.wait_max, waited)
+            future.set_result(None)
+            if host.waiters:
+                self._ring.append(host.name)
+            skipped = 0
+        if wake_at is not None and self._ring:
+            self._timer = self._loop.call_later(max(0.0, wake_at - now), self._dispatch)
+
+    def _release(self, host: _Host, started: float):
+        if self.hosts.get(host.name) is not host:
+            # Слот выдан в прежнем цикле событий — очереди уже сброшены
+            return
+        host.active -= 1
+        self._active -= 1
+        if host.blocked_until <= started:
+            host.throttle_streak = 0
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Дождаться своей очереди на загрузку url; слот держится до выхода из блока."""
+        loop = self._bind_loop()
+        host = self._host(host_key(url))
+        future = loop.create_future()
+        host.waiters.append((future, time.monotonic()))
+        host.max_depth = max(host.max_depth, len(host.waiters))
+        if host.name not in self._ring:
+            self._ring.append(host.name)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот успели выдать, но задачу отменили — вернуть слот
+            if future.done() and not future.cancelled():
+                self._release(host, time.monotonic())
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            host.last_used = time.monotonic()
+            self._release(host, started)
+
+    def backoff(self, url: str, retry_after: Optional[str]):
+        """
+        Сервер ответил 429/503: хост на паузе на Retry-After (не больше PARSER_MAX_RETRY_AFTER),
+        без заголовка — экспоненциально от 1 секунды.
+        """
+        host = self._host(host_key(url))
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = 2.0 ** host.throttle_streak
+        delay = min(delay, settings.parser_max_retry_after)
+        host.blocked_until = max(host.blocked_until, time.monotonic() + delay)
+        host.tokens = min(host.tokens, 0.0)
+        host.throttle_streak += 1
+        host.throttled += 1
+
+    # --- robots.txt ---
+
+    async def allowed(self, url: str, client: httpx.AsyncClient) -> bool:
+        """Разрешён ли URL robots.txt хоста (файл кэшируется на PARSER_ROBOTS_TTL секунд)."""
+        if not self.respect_robots:
+            return True
+        self._bind_loop()
+        name = host_key(url)
+        cached = self._robots.get(name)
+        if cached is None or cached[0] < time.monotonic():
+            robots = await self._robots_inflight.do(name, lambda: self._fetch_robots(url, client))
+            self._robots[name] = (time.monotonic() + settings.parser_robots_ttl, robots)
+            self._apply_crawl_delay(name, robots)
+        else:
+            robots = cached[1]
+        return robots is None or robots.can_fetch(settings.parser_user_agent, url)
+
+    @staticmethod
+    async def _fetch_robots(url: str, client: httpx.AsyncClient) -> Optional[RobotFileParser]:
+        """Скачать и разобрать robots.txt. Нет файла, ошибка или не 200 — ограничений нет."""
+        parts = urlsplit(url)
+        try:
+            response = await client.get(f"{parts.scheme}://{parts.netloc}/robots.txt")
+        except httpx.HTTPError:
+            return None
+        if response.status_code != 200:
+            return None
+        robots = RobotFileParser()
+        robots.parse(response.text.splitlines())
+        return robots
+
+    def _apply_crawl_delay(self, name: str, robots: Optional[RobotFileParser]):
+        """Crawl-delay / Request-rate замедляют token bucket хоста (но не ускоряют его)."""
+        host = self._host(name)
+        delay = None
+        if robots is not None:
+            delay = robots.crawl_delay(settings.parser_user_agent)
+            rate = robots.request_rate(settings.parser_user_agent)
+            if rate is not None and rate.requests:
+                delay = max(delay or 0, rate.seconds / rate.requests)
+        host.crawl_delay = float(delay) if delay else None
+        if host.crawl_delay:
+            host.rate = min(self.rate, 1.0 / host.crawl_delay)
+            host.burst = 1.0
+            host.tokens = min(host.tokens, host.burst)
+        else:
+            host.rate, host.burst = self.rate, self.burst
+
+    def stats(self) -> dict:
+        """Для /health: загрузки в работе и метрики по хостам (очередь, ожидание, 429/503)."""
+        now = time.monotonic()
+        hosts = {}
+        for host in sorted(self.hosts.values(), key=lambda h: (len(h.waiters), h.requests), reverse=True)[:50]:
+            hosts[host.name] = {
+                "queued": len(host.waiters),
+                "max_queued": host.max_depth,
+                "active": host.active,
+                "requests": host.requests,
+                "throttled": host.throttled,
+                "avg_wait": round(host.wait_total / host.requests, 3) if host.requests else 0.0,
+                "max_wait": round(host.wait_max, 3),
+                "rate": round(host.rate, 3),
+                "crawl_delay": host.crawl_delay,
+                "paused_for": round(max(0.0, host.blocked_until - now), 1),
+            }
+        return {"active": self._active, "max_total": self.max_total, "per_host": self.per_host, "hosts": hosts}
+
+
+host_scheduler = HostScheduler()
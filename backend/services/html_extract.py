@@ -0,0 +1,232 @@
+"""
+Потоковое извлечение title, h1 и первого абзаца: HTML подаётся в lxml кусками,
+чтение прекращается, как только все три поля найдены. Семантика — как у _extract_from_soup.
+"""
+import codecs
+import re
+from typing import List, Optional, Tuple
+
+from lxml import etree
+
+# Текст внутри этих тегов BeautifulSoup не включает в get_text (Script, Stylesheet, TemplateString, ruby)
+_SKIP_TEXT_TAGS = frozenset(("script", "style", "template", "rt", "rp"))
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-]+)""", re.IGNORECASE)
+
+
+class _Text:
+    """Накопитель текста одного элемента: строки узлов, как в get_text(strip=True)."""
+
+    __slots__ = ("parts",)
+
+    def __init__(self):
+        self.parts: List[str] = []
+
+    def value(self) -> str:
+        return "".join(self.parts)
+
+
+class _ExtractTarget:
+    """
+    Цель lxml-парсера. title и h1 — первые такие элементы документа. Абзац — первый <p> длиннее
+    50 символов внутри первого <main>/<article>, а если их нет во всём документе — внутри <body>.
+    """
+
+    def __init__(self):
+        self.title: Optional[str] = None
+        self.h1: Optional[str] = None
+        self._title_seen = False
+        self._h1_seen = False
+        self._stack: List[str] = []
+        self._skip = 0
+        self._run: List[str] = []
+        self._collectors: List[Tuple[str, int, _Text]] = []
+        # Область абзаца: main/article (первый в документе) и запасной вариант — body
+        self._main_depth: Optional[int] = None
+        self._main_closed = False
+        self._main_paragraph: Optional[str] = None
+        self._main_found = False
+        self._body_depth: Optional[int] = None
+        self._body_paragraph: Optional[str] = None
+        # Открытые <p>: (порядок открытия, внутри main, внутри body, текст); готовые кандидаты группы
+        self._open_ps: List[Tuple[int, bool, bool, _Text]] = []
+        self._p_counter = 0
+        self._p_group: List[Tuple[int, bool, bool, str]] = []
+
+    # --- события lxml ---
+
+    def start(self, tag, attrib):
+        self._flush()
+        tag = tag.lower() if isinstance(tag, str) else ""
+        self._stack.append(tag)
+        depth = len(self._stack)
+        if tag in _SKIP_TEXT_TAGS:
+            self._skip += 1
+        if tag == "title" and not self._title_seen:
+            self._title_seen = True
+            self._collectors.append(("title", depth, _Text()))
+        elif tag == "h1" and not self._h1_seen:
+            self._h1_seen = True
+            self._collectors.append(("h1", depth, _Text()))
+        elif tag in ("main", "article") and self._main_depth is None:
+            self._main_depth = depth
+        elif tag == "body" and self._body_depth is None:
+            self._body_depth = depth
+        if tag == "p":
+            in_main = self._main_depth is not None and not self._main_closed
+            in_body = self._body_depth is not None
+            if (in_main and not self._main_found) or (in_body and self._body_paragraph is None):
+                text = _Text()
+                self._open_ps.append((self._p_counter, in_main, in_body, text))
+                self._collectors.append(("p", depth, text))
+            self._p_counter += 1
+
+    def end(self, tag):
+        self._flush()
+        if not self._stack:
+            return
+        tag = self._stack.pop()
+        depth = len(self._stack) + 1
+        if tag in _SKIP_TEXT_TAGS:
+            self._skip -= 1
+        if self._collectors and self._collectors[-1][1] == depth:
+            self._close_collector()
+        if self._main_depth == depth and not self._main_closed:
+            self._main_closed = True
+        if self._body_depth == depth:
+            self._body_depth = None
+
+    def data(self, data):
+        if self._collectors and not self._skip:
+            self._run.append(data)
+
+    def comment(self, text):
+        # Комментарий разделяет текстовые узлы и сам в текст не входит
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return None
+
+    # --- внутреннее ---
+
+    def _flush(self):
+        """Закончить текущий текстовый узел: добавить обрезанную строку во все открытые сборщики."""
+        if not self._run:
+            return
+        text = "".join(self._run).strip()
+        self._run = []
+        if text:
+            for _, _, collector in self._collectors:
+                collector.parts.append(text)
+
+    def _close_collector(self):
+        """Закрыть сборщик элемента, который только что закончился (он всегда последний)."""
+        tag, _, collector = self._collectors.pop()
+        if tag == "title":
+            self.title = collector.value()
+        elif tag == "h1":
+            self.h1 = collector.value()
+        else:
+            self._close_paragraph(collector)
+
+    def _close_paragraph(self, collector: _Text):
+        for i, (order, in_main, in_body, text) in enumerate(self._open_ps):
+            if text is collector:
+                del self._open_ps[i]
+                value = text.value()
+                if len(value) > 50:
+                    self._p_group.append((order, in_main, in_body, value[:500]))
+                break
+        if self._open_ps:
+            return
+        # Все вложенные <p> закрыты — первый по порядку открытия кандидат окончательный
+        for order, in_main, in_body, value in sorted(self._p_group):
+            if in_main and not self._main_found:
+                self._main_found = True
+                self._main_paragraph = value
+            if in_body and self._body_paragraph is None:
+                self._body_paragraph = value
+        self._p_group = []
+
+    @property
+    def paragraph(self) -> Optional[str]:
+        if self._main_depth is not None:
+            return self._main_paragraph
+        return self._body_paragraph
+
+    @property
+    def complete(self) -> bool:
+        """Все поля окончательны — дальше документ можно не читать."""
+        if self.title is None or self.h1 is None:
+            return False
+        return self._main_found or self._main_closed
+
+
+class StreamingExtractor:
+    """Инкрементальный разбор: feed() кусками байтов, finish() — результат (title, h1, first_paragraph)."""
+
+    def __init__(self, encoding: Optional[str] = None):
+        self._target = _ExtractTarget()
+        self._parser = etree.HTMLParser(target=self._target, recover=True)
+        self._encoding = encoding
+        self._decoder = None
+        self._head = b""
+        self.bytes_read = 0
+        self._closed = False
+
+    def _start_decoder(self, sniff: bytes):
+        """Кодировка: из заголовка Content-Type, иначе из <meta charset> в начале документа, иначе UTF-8."""
+        encoding = self._encoding
+        if not encoding:
+            match = _META_CHARSET_RE.search(sniff)
+            encoding = match.group(1).decode("ascii") if match else "utf-8"
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = "utf-8"
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    def feed(self, chunk: bytes) -> bool:
+        """Подать очередной кусок. Returns: True, если все поля найдены и чтение можно прекратить."""
+        self.bytes_read += len(chunk)
+        if self._decoder is None:
+            self._head += chunk
+            if len(self._head) < 4096 and not self._encoding:
+                return False
+            chunk, self._head = self._head, b""
+            self._start_decoder(chunk)
+        text = self._decoder.decode(chunk)
+        if text:
+            self._parser.feed(text)
+        return self._target.complete
+
+    def feed_text(self, text: str) -> bool:
+        """Подать уже декодированный текст (Selenium, тесты)."""
+        if text:
+            self._parser.feed(text)
+        return self._target.complete
+
+    def finish(self) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Результат. Если документ дочитан не до конца — поля по прочитанной части."""
+        if not self._closed:
+            self._closed = True
+            if self._decoder is None and self._head:
+                self._start_decoder(self._head)
+                self._parser.feed(self._decoder.decode(self._head))
+            if self._decoder is not None:
+                tail = self._decoder.decode(b"", final=True)
+                if tail:
+                    self._parser.feed(tail)
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                pass
+        t = self._target
+        return t.title, t.h1, t.paragraph
+
+
+def extract_from_html(html: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Извлечь title, h1, первый абзац из строки HTML (потоковый разбор, с ранней остановкой)."""
+    extractor = StreamingExtractor()
+    extractor.feed_text(html)
+    return extractor.finish()
@@ -0,0 +1,282 @@
+"""
+Подготовка изображений перед отправкой в vision-модель: чтение загрузки с лимитом размера,
+уменьшение до рабочего разрешения модели, пересжатие в WebP/JPEG и перцептивный хеш (dHash),
+по которому почти одинаковые картинки получают уже готовый анализ.
+"""
+import asyncio
+import base64
+import io
+import statistics
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from backend.config import settings
+from backend.models.schemas import ImageAnalysis, ImageBatchItem, ImageInfo, VisualStyleStats
+from backend.services import llm_usage
+from backend.services.metrics import metrics
+from backend.services.openai_service import has_content, openai_service
+
+# Загрузка читается кусками, чтобы не держать в памяти файл больше лимита
+READ_CHUNK = 256 * 1024
+ALLOWED_IMAGE_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+
+
+class ImageTooLarge(ValueError):
+    """Загрузка больше IMAGE_MAX_BYTES."""
+
+
+@dataclass
+class PreparedImage:
+    """Изображение, готовое к отправке: байты, их тип, размер в пикселях и перцептивный хеш."""
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    dhash: Optional[int] = None
+
+
+def target_size(width: int, height: int) -> Tuple[int, int]:
+    """
+    Размер, до которого имеет смысл уменьшать: vision-модель сама вписывает картинку
+    в IMAGE_MAX_SIDE по длинной стороне и IMAGE_MAX_SHORT_SIDE по короткой — больше не отправляем.
+    """
+    scale = min(1.0, settings.image_max_side / max(width, height))
+    short = min(width, height) * scale
+    if short > settings.image_max_short_side:
+        scale *= settings.image_max_short_side / short
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def dhash(image) -> int:
+    """64-битный разностный хеш: картинка 9×8 в оттенках серого, бит — «левый пиксель ярче правого»."""
+    from PIL import Image
+
+    pixels = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def prepare_image(data: bytes, mime_type: str) -> PreparedImage:
+    """
+    Уменьшить и пересжать изображение (блокирующая работа — вызывать в потоке).
+    Без Pillow изображение уходит как есть, без хеша. Если пересжатие не уменьшило файл —
+    отправляется оригинал.
+    """
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return PreparedImage(data=data, mime_type=mime_type, original_bytes=len(data))
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG можно декодировать сразу в уменьшенном виде (1/2, 1/4, 1/8) — быстрее и меньше памяти
+        image.draft("RGB", target_size(*image.size))
+        image = ImageOps.exif_transpose(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError("Не удалось прочитать изображение") from e
+
+    resized = False
+    size = target_size(*image.size)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        resized = True
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    fmt = settings.image_format if settings.image_format in ("webp", "jpeg") else "webp"
+    if fmt == "webp" and not features.check("webp"):
+        fmt = "jpeg"
+    if fmt == "webp":
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    elif has_alpha:
+        # В JPEG нет прозрачности — подкладываем белый фон
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    else:
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=settings.image_quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=settings.image_quality, optimize=True)
+    encoded = buffer.getvalue()
+
+    prepared = PreparedImage(
+        data=encoded,
+        mime_type=f"image/{fmt}",
+        original_bytes=len(data),
+        width=image.width,
+        height=image.height,
+        dhash=dhash(image),
+    )
+    if not resized and len(encoded) >= len(data):
+        prepared.data, prepared.mime_type = data, mime_type
+    return prepared
+
+
+def visual_style_stats(analyses: List[ImageAnalysis]) -> VisualStyleStats:
+    """Сводка visual_style_score по набору анализов: среднее, медиана, разброс и гистограмма."""
+    scores = sorted(a.visual_style_score for a in analyses)
+    if not scores:
+        return VisualStyleStats()
+    return VisualStyleStats(
+        count=len(scores),
+        mean=round(statistics.fmean(scores), 2),
+        median=statistics.median(scores),
+        min=scores[0],
+        max=scores[-1],
+        histogram=dict(sorted(Counter(scores).items())),
+    )
+
+
+class ImageHashIndex:
+    """Анализы по перцептивному хешу (LRU + TTL кэша LLM): поиск ближайшего по расстоянию Хэмминга."""
+
+    def __init__(self):
+        self.max_items = max(1, settings.llm_cache_max_items)
+        self.ttl = settings.llm_cache_ttl
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find(self, value: int, max_distance: int) -> Optional[Tuple[dict, int]]:
+        """Ближайший сохранённый анализ не дальше max_distance бит: (анализ, расстояние) или None."""
+        now = time.time()
+        best = None
+        with self._lock:
+            for key, (created, analysis) in list(self._items.items()):
+                if now - created > self.ttl:
+                    del self._items[key]
+                    continue
+                distance = (key ^ value).bit_count()
+                if distance <= max_distance and (best is None or distance < best[2]):
+                    best = (key, analysis, distance)
+            if best is None:
+                return None
+            self._items.move_to_end(best[0])
+            return best[1], best[2]
+
+    def add(self, value: int, analysis: dict):
+        with self._lock:
+            self._items[value] = (time.time(), analysis)
+            self._items.move_to_end(value)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class ImageService:
+    """Загрузка → подготовка (в потоке) → поиск похожего анализа → vision-модель."""
+
+    def __init__(self):
+        self.max_bytes = max(1, settings.image_max_bytes)
+        self.batch_concurrency = max(1, settings.image_batch_concurrency)
+        self.hash_distance = max(0, settings.image_hash_distance)
+        self.index = ImageHashIndex()
+        self.processed = 0
+        self.similar_hits = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+
+    async def read_upload(self, file: UploadFile) -> bytes:
+        """Прочитать загрузку кусками; больше IMAGE_MAX_BYTES — ImageTooLarge."""
+        if file.size is not None and file.size > self.max_bytes:
+            raise ImageTooLarge(self._too_large())
+        buffer = bytearray()
+        while True:
+            chunk = await file.read(READ_CHUNK)
+            if not chunk:
+                break
+            buffer += chunk
+            if len(buffer) > self.max_bytes:
+                raise ImageTooLarge(self._too_large())
+        return bytes(buffer)
+
+    def _too_large(self) -> str:
+        return f"Файл больше {round(self.max_bytes / (1024 * 1024), 1):g} МБ"
+
+    async def analyze(
+        self, data: bytes, mime_type: str, bypass_cache: bool = False
+    ) -> Tuple[ImageAnalysis, ImageInfo]:
+        """
+        Анализ загруженного изображения. Если почти такое же (IMAGE_HASH_DISTANCE) уже анализировалось —
+        возвращается тот анализ без запроса к модели (bypass_cache: true — всегда заново).
+        """
+        with metrics.stage("image_prepare"):
+            prepared = await asyncio.to_thread(prepare_image, data, mime_type)
+        self.processed += 1
+        self.bytes_in += prepared.original_bytes
+        metrics.inc("image_bytes_total", prepared.original_bytes, direction="in")
+        info = ImageInfo(
+            original_bytes=prepared.original_bytes,
+            sent_bytes=len(prepared.data),
+            width=prepared.width,
+            height=prepared.height,
+            mime_type=prepared.mime_type,
+        )
+        use_index = prepared.dhash is not None and settings.llm_cache_enabled
+        if use_index and not bypass_cache:
+            found = self.index.find(prepared.dhash, self.hash_distance)
+            if found is not None:
+                self.similar_hits += 1
+                llm_usage.mark_response_cache()
+                info.sent_bytes = 0
+                info.similar = True
+                return ImageAnalysis(**found[0]), info
+        self.bytes_sent += len(prepared.data)
+        metrics.inc("image_bytes_total", len(prepared.data), direction="sent")
+        analysis = await openai_service.analyze_image_async(
+            image_base64=base64.b64encode(prepared.data).decode("ascii"),
+            mime_type=prepared.mime_type,
+            bypass_cache=bypass_cache,
+        )
+        # Пустой анализ (ошибка модели или разбора) не запоминаем — иначе похожие картинки получали бы его
+        if use_index and has_content(analysis):
+            self.index.add(prepared.dhash, analysis.model_dump())
+        return analysis, info
+
+    async def analyze_uploads(self, files: List[UploadFile], bypass_cache: bool = False) -> List[ImageBatchItem]:
+        """
+        Несколько загрузок параллельно, не больше IMAGE_BATCH_CONCURRENCY одновременно (чтение, подготовка
+        и запрос к модели — под одним слотом, так что в памяти не больше стольких файлов). Порядок — как у files;
+        ошибка по одному файлу не прерывает остальные.
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def one(file: UploadFile) -> ImageBatchItem:
+            filename = file.filename or "image"
+            if file.content_type not in ALLOWED_IMAGE_TYPES:
+                return ImageBatchItem(filename=filename, success=False, error="Неподдерживаемый тип файла")
+            async with semaphore:
+                try:
+                    data = await self.read_upload(file)
+                    analysis, info = await self.analyze(data, mime_type=file.content_type, bypass_cache=bypass_cache)
+                except Exception as e:
+                    return ImageBatchItem(filename=filename, success=False, error=str(e))
+            return ImageBatchItem(filename=filename, success=True, analysis=analysis, image=info)
+
+        return list(await asyncio.gather(*(one(f) for f in files)))
+
+    def stats(self) -> dict:
+        """Для /health: обработано изображений, повторно использовано по хешу, байты до и после сжатия."""
+        return {
+            "processed": self.processed,
+            "similar_hits": self.similar_hits,
+            "indexed": len(self.index),
+            "bytes_in": self.bytes_in,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+image_service = ImageService()
@@ -0,0 +1,466 @@
+"""
+Фоновые задачи: анализ текста, URL или списка URL ставится в очередь (SQLite в data/), сразу
+возвращается id, а выполняют задачи воркеры в фоне. Состояние и прогресс — по GET /jobs/{id}
+или через websocket. Ошибки провайдера LLM (недоступен, 429, 5xx) — повтор с нарастающей паузой;
+задачи, прерванные остановкой или падением процесса, после перезапуска выполняются заново.
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+import openai
+
+from backend.config import settings
+from backend.models.schemas import JobItem
+from backend.services.llm_router import NoProviderAvailable
+from backend.services.metrics import metrics
+from backend.services.parser_service import normalize_url
+from backend.services.pipeline import analyze_and_record_text, parse_and_analyze, parse_and_analyze_many
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+JOB_KINDS = ("text", "parse", "parse_batch")
+# Максимальный такт диспетчера (сек): очередь перечитывается и без wake()
+DISPATCH_TICK = 30.0
+# Событий в очереди одного подписчика websocket; медленный подписчик теряет лишние
+SUBSCRIBER_QUEUE = 1000
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+def validate(kind: str, text: Optional[str], url: Optional[str], urls: Optional[List[str]]) -> Tuple[dict, int]:
+    """Параметры задачи → (payload, сколько единиц работы). Неверные параметры — ValueError."""
+    if kind == "text":
+        if not text or len(text.strip()) < 10:
+            raise ValueError("Для kind=text нужен текст не короче 10 символов")
+        return {"text": text}, 1
+    if kind == "parse":
+        if not url or not url.strip():
+            raise ValueError("Для kind=parse нужен url")
+        return {"url": url}, 1
+    if kind == "parse_batch":
+        unique = list(dict.fromkeys(normalize_url(u) for u in urls or [] if u.strip()))
+        if not unique:
+            raise ValueError("Для kind=parse_batch нужен непустой список urls")
+        if len(unique) > settings.parser_batch_max_urls:
+            raise ValueError(f"Слишком много URL: максимум {settings.parser_batch_max_urls}")
+        return {"urls": unique}, len(unique)
+    raise ValueError(f"Неизвестный вид задачи: {kind} (допустимы {', '.join(JOB_KINDS)})")
+
+
+def _retryable(error: BaseException) -> bool:
+    """Временная ошибка провайдера: все эндпоинты отключены, сеть/таймаут, 408/409/429, 5xx."""
+    if isinstance(error, (NoProviderAvailable, openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class JobStore:
+    """Задачи и готовые элементы пакетных задач (SQLite в data/)."""
+
+    def __init__(self):
+        self.db_path: Path = settings.job_db_path
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    bypass_cache INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    progress_done INTEGER NOT NULL DEFAULT 0,
+                    progress_total INTEGER NOT NULL DEFAULT 1,
+                    result TEXT,
+                    error TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(status, run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at)")
+            # Готовые URL пакетной задачи: после перезапуска обрабатываются только оставшиеся
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (job_id, key)
+                )
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение для текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_item(self, row: sqlite3.Row, with_result: bool) -> JobItem:
+        result = None
+        if with_result:
+            if row["kind"] == "parse_batch":
+                items = self._conn().execute(
+                    "SELECT data FROM job_items WHERE job_id = ? ORDER BY seq", (row["id"],)
+                ).fetchall()
+                result = [json.loads(r["data"]) for r in items]
+            elif row["result"] is not None:
+                result = json.loads(row["result"])
+        return JobItem(
+            id=row["id"],
+            kind=row["kind"],
+            status=row["status"],
+            created_at=_iso(row["created_at"]),
+            started_at=_iso(row["started_at"]),
+            finished_at=_iso(row["finished_at"]),
+            next_attempt_at=_iso(row["run_at"]) if row["status"] == QUEUED and row["attempts"] else None,
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            progress_done=row["progress_done"],
+            progress_total=row["progress_total"],
+            error=row["error"],
+            result=result,
+        )
+
+    def add(self, kind: str, payload: dict, total: int, bypass_cache: bool) -> JobItem:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, bypass_cache, status, max_attempts, run_at, created_at,"
+                " progress_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, kind, json.dumps(payload, ensure_ascii=False), int(bypass_cache), QUEUED,
+                    max(1, settings.job_max_attempts), now, now, total,
+                ),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str, with_result: bool = True) -> Optional[JobItem]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_item(row, with_result) if row else None
+
+    def list(self, status: Optional[str], limit: int) -> List[JobItem]:
+        """Задачи без результатов, новые первыми."""
+        if status:
+            rows = self._conn().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        else:
+            rows = self._conn().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_item(r, with_result=False) for r in rows]
+
+    def delete(self, job_id: str) -> bool:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            return conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def claim(self, now: float, limit: int) -> List[sqlite3.Row]:
+        """Взять в работу до limit задач, чей срок подошёл (самые давние первыми): running, попытка +1."""
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND run_at <= ? ORDER BY run_at LIMIT ?", (QUEUED, now, limit)
+            ).fetchall()
+            ids = [r["id"] for r in rows]
+            if not ids:
+                return []
+            marks = ", ".join("?" * len(ids))
+            conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = COALESCE(started_at, ?)"
+                f" WHERE id IN ({marks})",
+                (RUNNING, now, *ids),
+            )
+            return conn.execute(
+                f"SELECT id, kind, payload, bypass_cache, attempts, max_attempts FROM jobs WHERE id IN ({marks})"
+                " ORDER BY run_at",
+                ids,
+            ).fetchall()
+
+    def next_due(self) -> Optional[float]:
+        row = self._conn().execute("SELECT MIN(run_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+        return row[0]
+
+    def finish(self, job_id: str, status: str, result: Optional[str], error: Optional[str]):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?,"
+                " progress_done = CASE WHEN ? = ? THEN progress_total ELSE progress_done END WHERE id = ?",
+                (status, result, error, time.time(), status, DONE, job_id),
+            )
+
+    def retry(self, job_id: str, error: str, run_at: float):
+        """Ошибка провайдера: обратно в очередь, следующая попытка — не раньше run_at."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, run_at = ? WHERE id = ?", (QUEUED, error, run_at, job_id)
+            )
+
+    def requeue(self, job_ids: List[str]):
+        """Задачи, прерванные остановкой приложения: снова в очередь, прерванная попытка не считается."""
+        if not job_ids:
+            return
+        marks = ", ".join("?" * len(job_ids))
+        with self._conn() as conn:
+            conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), run_at = ?"
+                f" WHERE status = ? AND id IN ({marks})",
+                (QUEUED, time.time(), RUNNING, *job_ids),
+            )
+
+    def recover(self) -> int:
+        """
+        При старте: задачи в running остались от упавшего процесса — снова в очередь (если попытки
+        не исчерпаны); завершённые старше JOB_TTL_HOURS удаляются. Returns сколько задач возвращено.
+        """
+        now = time.time()
+        expired = now - settings.job_ttl_hours * 3600
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE status = ? AND attempts >= max_attempts",
+                (FAILED, now, "Прервано перезапуском, попытки исчерпаны", RUNNING),
+            )
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, run_at = ? WHERE status = ?", (QUEUED, now, RUNNING)
+            ).rowcount
+            conn.execute(
+                "DELETE FROM job_items WHERE job_id IN"
+                " (SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?)",
+                (*FINISHED, expired),
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED, expired))
+        return requeued
+
+    def item_keys(self, job_id: str) -> Set[str]:
+        rows = self._conn().execute("SELECT key FROM job_items WHERE job_id = ?", (job_id,)).fetchall()
+        return {r["key"] for r in rows}
+
+    def add_item(self, job_id: str, key: str, data: str) -> int:
+        """Готовый элемент пакетной задачи. Returns сколько элементов готово."""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_items (job_id, key, seq, data) VALUES"
+                " (?, ?, (SELECT COUNT(*) FROM job_items WHERE job_id = ?), ?)",
+                (job_id, key, job_id, data),
+            )
+            done = conn.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.execute("UPDATE jobs SET progress_done = ? WHERE id = ?", (done, job_id))
+        return done
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobRunner:
+    """
+    Диспетчер задач (запускается в lifespan): берёт из очереди задачи, чей срок подошёл, не больше
+    JOB_WORKERS одновременно. Ошибка провайдера — повтор через JOB_RETRY_DELAY · 2^(попытка-1)
+    (± разброс, не больше JOB_RETRY_MAX_DELAY), пока не исчерпаны JOB_MAX_ATTEMPTS попыток.
+    Подписчики (websocket) получают события status, item (готовый URL пакета) и deleted.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self.workers = max(1, settings.job_workers)
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._recovered = 0
+        self._done = 0
+        self._failed = 0
+        self._retried = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._recovered = self.store.recover()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить диспетчер; выполняющиеся задачи прерываются и при следующем запуске начнутся заново."""
+        interrupted = list(self._running)
+        tasks = [t for t in (self._task, *self._running.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+        await asyncio.to_thread(self.store.requeue, interrupted)
+
+    def wake(self):
+        """Новая задача — проверить очередь сейчас."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def discard(self, job_id: str):
+        """Задача удалена: прервать, если выполняется, и сообщить подписчикам (событие deleted)."""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        self._publish(job_id, "deleted", {"id": job_id})
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[job_id]
+
+    def _publish(self, job_id: str, event: str, data: dict):
+        for queue in self._subscribers.get(job_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass
+
+    async def _publish_status(self, job_id: str, with_result: bool = False):
+        if job_id not in self._subscribers:
+            return
+        job = await asyncio.to_thread(self.store.get, job_id, with_result)
+        if job is not None:
+            self._publish(job_id, "status", job.model_dump(mode="json"))
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self._launch_due()
+                next_due = await asyncio.to_thread(self.store.next_due)
+            except Exception:
+                # Ошибка БД не должна останавливать очередь — повторим на следующем такте
+                next_due = None
+            timeout = DISPATCH_TICK
+            if next_due is not None and len(self._running) < self.workers:
+                timeout = min(timeout, max(0.0, next_due - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _launch_due(self):
+        free = self.workers - len(self._running)
+        if free <= 0:
+            return
+        for row in await asyncio.to_thread(self.store.claim, time.time(), free):
+            job_id = row["id"]
+            task = asyncio.create_task(
+                self._execute(
+                    job_id, row["kind"], json.loads(row["payload"]), bool(row["bypass_cache"]),
+                    row["attempts"], row["max_attempts"],
+                )
+            )
+            self._running[job_id] = task
+
+    def _retry_delay(self, attempt: int) -> float:
+        delay = min(settings.job_retry_max_delay, settings.job_retry_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _execute(self, job_id: str, kind: str, payload: dict, bypass_cache: bool, attempt: int, max_attempts: int):
+        """Одна попытка задачи и её исход: done / failed / снова в очередь."""
+        outcome = None
+        try:
+            await self._publish_status(job_id)
+            try:
+                status, result, error = await self._perform(
+                    job_id, kind, payload, bypass_cache, final=attempt >= max_attempts
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if _retryable(e) and attempt < max_attempts:
+                    outcome = "retried"
+                    await asyncio.to_thread(self.store.retry, job_id, error, time.time() + self._retry_delay(attempt))
+                else:
+                    outcome = FAILED
+                    await asyncio.to_thread(self.store.finish, job_id, FAILED, None, error)
+            else:
+                outcome = status
+                await asyncio.to_thread(self.store.finish, job_id, status, result, error)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Ошибка записи в БД — задача останется в running и после перезапуска выполнится заново
+            pass
+        finally:
+            self._running.pop(job_id, None)
+            self.wake()
+        if outcome is not None:
+            self._done += outcome == DONE
+            self._failed += outcome == FAILED
+            self._retried += outcome == "retried"
+            metrics.inc("jobs_total", kind=kind, outcome=outcome)
+            await self._publish_status(job_id, with_result=outcome in FINISHED)
+
+    async def _perform(
+        self, job_id: str, kind: str, payload: dict, bypass_cache: bool, final: bool
+    ) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Выполнить задачу. Returns (done/failed, результат в JSON, ошибка). В пакете URL с ошибкой
+        провайдера не сохраняются, а ошибка поднимается после остальных — повтор возьмёт только их;
+        в последней попытке (final) такие URL сохраняются с ошибкой, как в /parse_batch.
+        """
+        if kind == "text":
+            analysis = await analyze_and_record_text(payload["text"], bypass_cache=bypass_cache)
+            return DONE, analysis.model_dump_json(), None
+        if kind == "parse":
+            content = await parse_and_analyze(payload["url"], bypass_cache=bypass_cache)
+            # Ошибка загрузки страницы (404, robots.txt) — окончательная; темп и 429 сайта учтены парсером
+            return (FAILED if content.error else DONE), content.model_dump_json(), content.error
+        if kind == "parse_batch":
+            done = await asyncio.to_thread(self.store.item_keys, job_id)
+            remaining = [url for url in payload["urls"] if url not in done]
+            defer_error = None if final else _retryable
+            async for content in parse_and_analyze_many(remaining, bypass_cache=bypass_cache, defer_error=defer_error):
+                done = await asyncio.to_thread(self.store.add_item, job_id, content.url, content.model_dump_json())
+                self._publish(job_id, "item", {"progress_done": done, "data": content.model_dump(mode="json")})
+            return DONE, None, None
+        raise ValueError(f"Неизвестный вид задачи: {kind}")
+
+    async def stats(self) -> dict:
+        """Для /health: задачи по статусам, свободные воркеры, исходы с запуска."""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "workers": self.workers,
+            "active": len(self._running),
+            "by_status": await asyncio.to_thread(self.store.counts),
+            "recovered": self._recovered,
+            "done": self._done,
+            "failed": self._failed,
+            "retried": self._retried,
+        }
+
+
+job_store = JobStore()
+job_runner = JobRunner(job_store)
@@ -0,0 +1,237 @@
+"""
+Извлечение JSON из ответа модели за один проход: поиск начала (сначала внутри ```-блока),
+балансировка скобок с учётом строк и починка типичных ошибок — висячие запятые, «умные» кавычки
+вместо ", обрыв ответа на max_tokens. Затем приведение к схеме ответа (CompetitorAnalysis, ImageAnalysis).
+"""
+import json
+import math
+import re
+from collections import deque
+from typing import Any, Deque, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# Структурные символы: остальной текст (числа, литералы, содержимое строк) проскакивается целиком
+_TOKEN_RE = re.compile(r'[{}\[\],"\\“”]')
+_SMART_QUOTES = "“”"
+_CLOSERS = {"{": "}", "[": "]"}
+# Сколько начал-кандидатов пробовать (пояснения модели вида «{по запросу}» перед самим JSON)
+MAX_CANDIDATES = 4
+# Сколько последних целых элементов перебирать при починке оборванного ответа
+MAX_TRUNCATION_STEPS = 4
+
+
+def _fenced_body(text: str) -> Optional[str]:
+    """Содержимое первого ```-блока (без строки с языком); блок без закрытия — до конца текста."""
+    start = text.find("```")
+    if start < 0:
+        return None
+    newline = text.find("\n", start + 3)
+    if newline < 0:
+        return None
+    end = text.find("```", newline + 1)
+    return text[newline + 1:end if end >= 0 else len(text)]
+
+
+def _loads(text: str) -> Tuple[bool, Any]:
+    try:
+        return True, json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        # RecursionError — вложенность глубже предела интерпретатора: для ответа модели это мусор
+        return False, None
+
+
+# Стек открытых скобок — неизменяемый связный список (закрывающая скобка, родитель): снимок
+# стека для точки обрыва — ссылка на вершину за O(1), а не копия всего стека
+_Stack = Optional[Tuple[str, Any]]
+
+
+def _closers(stack: _Stack) -> str:
+    """Закрывающие скобки для всех открытых уровней, от внутреннего к внешнему."""
+    closers = []
+    while stack is not None:
+        closers.append(stack[0])
+        stack = stack[1]
+    return "".join(closers)
+
+
+def _scan(text: str, start: int) -> Tuple[Optional[Any], bool]:
+    """
+    Разбор значения, начинающегося с text[start] ('{' или '['). Returns (значение или None,
+    была ли починка). Проход один: регулярное выражение переходит от одного структурного
+    символа к другому.
+    """
+    pieces: List[str] = []
+    stack: _Stack = None
+    last = start
+    in_string = False
+    smart_string = False
+    skip_until = -1
+    repaired = False
+    comma_piece: Optional[int] = None
+    comma_end = 0
+    # Последние точки, где можно оборвать документ: (длина pieces, стек на этот момент)
+    safe_points: Deque[Tuple[int, _Stack]] = deque(maxlen=MAX_TRUNCATION_STEPS)
+
+    for match in _TOKEN_RE.finditer(text, start):
+        i = match.start()
+        if i < skip_until:
+            continue
+        ch = match.group()
+        if in_string:
+            if ch == "\\":
+                skip_until = i + 2
+            elif ch == '"' and not smart_string:
+                in_string = False
+            elif ch in _SMART_QUOTES and smart_string:
+                pieces.append(text[last:i])
+                pieces.append('"')
+                last = i + 1
+                in_string = smart_string = False
+            elif ch == '"' and smart_string:
+                # Прямая кавычка внутри строки в «умных» кавычках — часть текста
+                pieces.append(text[last:i])
+                pieces.append('\\"')
+                last = i + 1
+            continue
+
+        pieces.append(text[last:i])
+        last = i + 1
+        if ch == '"' or ch in _SMART_QUOTES:
+            if ch != '"':
+                repaired = True
+                smart_string = True
+            in_string = True
+            pieces.append('"')
+            comma_piece = None
+        elif ch in "{[":
+            stack = (_CLOSERS[ch], stack)
+            pieces.append(ch)
+            safe_points.append((len(pieces), stack))
+            comma_piece = None
+        elif ch in "}]":
+            if comma_piece is not None and not text[comma_end:i].strip():
+                pieces[comma_piece] = ""
+                repaired = True
+            comma_piece = None
+            if stack is None or stack[0] != ch:
+                # Несогласованная скобка — дальше не JSON
+                return None, repaired
+            stack = stack[1]
+            pieces.append(ch)
+            if stack is None:
+                ok, value = _loads("".join(pieces))
+                return (value if ok else None), repaired
+        elif ch == ",":
+            safe_points.append((len(pieces), stack))
+            pieces.append(",")
+            comma_piece = len(pieces) - 1
+            comma_end = i + 1
+        elif ch == "\\":
+            # Обратная косая черта вне строки — мусор, дальше не JSON
+            return None, repaired
+
+    # Текст закончился раньше, чем закрылись скобки: ответ оборван
+    if stack is None:
+        return None, repaired
+    pieces.append(text[last:])
+    body = "".join(pieces).rstrip()
+    if in_string:
+        body += '"'
+    ok, value = _loads(body.rstrip(",") + _closers(stack))
+    if ok:
+        return value, True
+    # Последнее значение недописано (ключ без значения, число на полуслове) — отрезаем
+    # по последним запятым/открывающим скобкам и закрываем то, что было открыто там
+    for length, point_stack in reversed(safe_points):
+        head = "".join(pieces[:length]).rstrip().rstrip(",")
+        ok, value = _loads(head + _closers(point_stack))
+        if ok:
+            return value, True
+    return None, True
+
+
+def _candidates(text: str, openers: str) -> Iterable[int]:
+    index = 0
+    for _ in range(MAX_CANDIDATES):
+        positions = [p for p in (text.find(o, index) for o in openers) if p >= 0]
+        if not positions:
+            return
+        index = min(positions)
+        yield index
+        index += 1
+
+
+def extract_json(text: str, expect: type = dict) -> Tuple[Optional[Any], bool]:
+    """
+    Первый JSON-объект (expect=dict) или массив (expect=list) в ответе модели.
+    Returns (значение или None, была ли починка). Для list объект-обёртка вида {"items": [...]}
+    тоже подходит — массив берётся из его первого поля-списка.
+    """
+    openers = "{" if expect is dict else "[{"
+    fenced = _fenced_body(text)
+    for source in (fenced, text) if fenced is not None else (text,):
+        for start in _candidates(source, openers):
+            value, repaired = _scan(source, start)
+            if expect is list and isinstance(value, dict):
+                value = next((v for v in value.values() if isinstance(v, list)), None)
+            if isinstance(value, expect):
+                return value, repaired
+    return None, False
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (dict, list)):
+        items = value.values() if isinstance(value, dict) else value
+        return "; ".join(text for text in map(_as_text, items) if text)
+    return str(value)
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [text for text in map(_as_text, value) if text]
+    text = _as_text(value)
+    return [text] if text else []
+
+
+def _as_int(value: Any, default: int) -> int:
+    """Число из ответа модели («7», 7.4, «7/10»); нечисло, inf, nan — default."""
+    try:
+        number = float(str(value).split("/")[0].strip())
+    except (TypeError, ValueError):
+        return default
+    return round(number) if math.isfinite(number) else default
+
+
+def coerce(data: dict, model_cls: Type[BaseModel], fields: Optional[Iterable[str]] = None) -> BaseModel:
+    """
+    dict из ответа модели → model_cls: строка вместо списка, список вместо строки, «7/10» вместо 7,
+    объекты вместо строк в списках приводятся к типам схемы; числа зажимаются в границы поля.
+    fields — какие поля брать из data (остальные — по умолчанию).
+    """
+    names = set(fields) if fields is not None else set(model_cls.model_fields)
+    values = {}
+    for name, field in model_cls.model_fields.items():
+        if name not in names or name not in data:
+            continue
+        value = data[name]
+        annotation = str(field.annotation)
+        if "List" in annotation or "list" in annotation:
+            values[name] = _as_list(value)
+        elif field.annotation is int:
+            number = _as_int(value, field.default if isinstance(field.default, int) else 0)
+            for meta in field.metadata:
+                if getattr(meta, "ge", None) is not None:
+                    number = max(meta.ge, number)
+                if getattr(meta, "le", None) is not None:
+                    number = min(meta.le, number)
+            values[name] = number
+        else:
+            values[name] = _as_text(value)
+    return model_cls(**values)
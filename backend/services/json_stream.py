@@ -0,0 +1,121 @@
+"""
+Инкрементальный разбор JSON-объекта из потока токенов LLM: поле верхнего уровня отдаётся,
+как только его значение закончилось, элементы массивов — по одному, не дожидаясь конца ответа.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+# Событие: ("item", поле, элемент массива) или ("field", поле, значение целиком)
+Event = Tuple[str, str, Any]
+
+
+class JsonFieldStream:
+    """
+    feed(delta) → список новых событий. Текст до первой «{» (```json, пояснения модели) пропускается.
+    Разбор только лексический (строки, экранирование, вложенность) — итоговый ответ всё равно
+    проверяется обычным _parse_json_response.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._value_is_array = False
+        self._item_start: Optional[int] = None
+        self.fields: dict = {}
+
+    def feed(self, delta: str) -> List[Event]:
+        events: List[Event] = []
+        if self._done or not delta:
+            return events
+        self._text += delta
+        text = self._text
+        while self._pos < len(text) and not self._done:
+            ch = text[self._pos]
+            pos = self._pos
+            self._pos += 1
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None and self._key_start is not None:
+                        self._key = self._loads(text[self._key_start:pos + 1])
+                        self._key_start = None
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None and self._key is None:
+                    self._key_start = pos
+                elif self._value_start is None and self._key is not None and self._depth == 1:
+                    self._value_start = pos
+                elif self._depth == 2 and self._value_is_array and self._item_start is None:
+                    self._item_start = pos
+                continue
+            if ch.isspace():
+                continue
+            if self._depth == 1:
+                if ch == ":":
+                    continue
+                if ch in ",}":
+                    self._close_field(text, pos, events)
+                    if ch == "}":
+                        self._done = True
+                    continue
+                if self._value_start is None and self._key is not None:
+                    self._value_start = pos
+                    self._value_is_array = ch == "["
+                if ch in "[{":
+                    self._depth += 1
+                continue
+            # Внутри значения-контейнера
+            if self._depth == 2 and self._value_is_array:
+                if ch in ",]":
+                    self._close_item(text, pos, events)
+                elif self._item_start is None:
+                    self._item_start = pos
+            if ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+        return events
+
+    def _close_item(self, text: str, pos: int, events: List[Event]):
+        if self._item_start is None:
+            return
+        value = self._loads(text[self._item_start:pos])
+        self._item_start = None
+        if value is not None:
+            events.append(("item", self._key, value))
+
+    def _close_field(self, text: str, pos: int, events: List[Event]):
+        if self._key is not None and self._value_start is not None:
+            value = self._loads(text[self._value_start:pos])
+            if value is not None:
+                self.fields[self._key] = value
+                events.append(("field", self._key, value))
+        self._key = None
+        self._value_start = None
+        self._value_is_array = False
+        self._item_start = None
+
+    @staticmethod
+    def _loads(fragment: str):
+        try:
+            return json.loads(fragment)
+        except (json.JSONDecodeError, ValueError):
+            return None
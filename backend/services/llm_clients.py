@@ -0,0 +1,92 @@
+"""
+Реестр долгоживущих клиентов OpenAI/DeepSeek: один клиент (и пул соединений httpx) на base_url.
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from backend.config import settings
+
+
+class LLMClientRegistry:
+    """Клиенты OpenAI SDK с общими пулами соединений — TLS и keep-alive переживают запросы."""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str], OpenAI] = {}
+        self._async_clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        """Лимиты пула соединений из настроек."""
+        return httpx.Limits(
+            max_connections=settings.llm_pool_max_connections,
+            max_keepalive_connections=settings.llm_pool_max_keepalive,
+            keepalive_expiry=settings.llm_keepalive_expiry,
+        )
+
+    def get(self, api_key: str, base_url: Optional[str] = None) -> OpenAI:
+        """Клиент для base_url (None — URL OpenAI по умолчанию). Создаётся один раз."""
+        key = (base_url or "", api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url or None,
+                    timeout=settings.llm_timeout,
+                    # Повтор при ошибке — на следующем эндпоинте (llm_router), а не внутри SDK
+                    max_retries=0,
+                    http_client=httpx.Client(limits=self._limits(), timeout=settings.llm_timeout),
+                )
+                self._clients[key] = client
+        return client
+
+    def get_async(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """Асинхронный клиент для base_url (для эндпоинтов, не блокирующих event loop)."""
+        key = (base_url or "", api_key)
+        client = self._async_clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._async_clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url or None,
+                    timeout=settings.llm_timeout,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=settings.llm_timeout),
+                )
+                self._async_clients[key] = client
+        return client
+
+    def close(self):
+        """Закрыть все клиенты и их пулы соединений (при остановке приложения)."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    async def aclose(self):
+        """Закрыть синхронные и асинхронные клиенты."""
+        with self._lock:
+            async_clients = list(self._async_clients.values())
+            self._async_clients.clear()
+        for client in async_clients:
+            try:
+                await client.close()
+            except Exception:
+                pass
+        self.close()
+
+
+llm_clients = LLMClientRegistry()
@@ -0,0 +1,231 @@
+"""
+Маршрутизация запросов к LLM: DeepSeek (свой DEEPSEEK_BASE_URL и стандартный URL) и OpenAI как запасной.
+У каждого эндпоинта — circuit breaker (closed → open → half-open) и скользящая средняя задержки (EWMA).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+import httpx
+
+from backend.config import settings
+from backend.services.metrics import metrics
+
+T = TypeVar("T")
+
+DEEPSEEK_STANDARD_BASE = "https://api.deepseek.com"
+# Вес нового замера в EWMA задержки
+EWMA_ALPHA = 0.3
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class NoProviderAvailable(RuntimeError):
+    """Все подходящие эндпоинты отключены автоматом — ждём окончания паузы."""
+
+
+@dataclass
+class Endpoint:
+    """Эндпоинт LLM и его состояние."""
+    name: str
+    api_key: str
+    base_url: Optional[str]
+    model: str
+    timeout: float
+    # Уровень: 0 — основной провайдер (DeepSeek), 1 — запасной (OpenAI); внутри уровня решает задержка
+    tier: int
+    priority: int
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    trial_inflight: bool = False
+    ewma: Optional[float] = None
+    requests: int = 0
+    errors: int = 0
+    last_error: Optional[str] = None
+
+    @property
+    def request_timeout(self) -> httpx.Timeout:
+        """Таймаут запроса: короткий на соединение (упавший URL отсеивается быстро), длинный на ответ."""
+        return httpx.Timeout(self.timeout, connect=min(self.timeout, settings.llm_connect_timeout))
+
+
+class LLMRouter:
+    """
+    Выбор эндпоинта: сначала доступные (автомат не разомкнут), основной провайдер раньше запасного,
+    среди равных — с меньшей EWMA задержки. После LLM_BREAKER_FAILURES ошибок подряд эндпоинт
+    отключается на LLM_BREAKER_COOLDOWN секунд, затем пропускается один пробный запрос.
+    """
+
+    def __init__(self):
+        self.failure_threshold = max(1, settings.llm_breaker_failures)
+        self.cooldown = max(0.0, settings.llm_breaker_cooldown)
+        self.endpoints: List[Endpoint] = self._build()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build() -> List[Endpoint]:
+        endpoints = []
+        deepseek_key = (settings.deepseek_api_key or "").strip()
+        if deepseek_key:
+            custom = (settings.deepseek_base_url or "").strip() or DEEPSEEK_STANDARD_BASE
+            model = settings.deepseek_model or "deepseek-chat"
+            if custom.rstrip("/") != DEEPSEEK_STANDARD_BASE:
+                endpoints.append(Endpoint(
+                    name="deepseek", api_key=deepseek_key, base_url=custom, model=model,
+                    timeout=settings.deepseek_timeout, tier=0, priority=0,
+                ))
+            endpoints.append(Endpoint(
+                name="deepseek_standard", api_key=deepseek_key, base_url=DEEPSEEK_STANDARD_BASE, model=model,
+                timeout=settings.deepseek_timeout, tier=0, priority=1,
+            ))
+        endpoints.append(Endpoint(
+            name="openai", api_key=settings.openai_api_key, base_url=None, model=settings.openai_model,
+            timeout=settings.openai_timeout, tier=1, priority=2,
+        ))
+        return endpoints
+
+    def _available(self, ep: Endpoint, now: float) -> bool:
+        if ep.state == CLOSED:
+            return True
+        if ep.state == OPEN:
+            return now - ep.opened_at >= self.cooldown
+        return not ep.trial_inflight
+
+    def plan(self, providers: Optional[Sequence[str]] = None) -> List[Endpoint]:
+        """Доступные эндпоинты в порядке попыток. providers — ограничить именами (например, только openai)."""
+        now = time.monotonic()
+        # Эндпоинт без ключа (OpenAI при одном DeepSeek) в общий перебор не берём — только по имени
+        keyed_only = providers is None and any(ep.api_key for ep in self.endpoints)
+        with self._lock:
+            candidates = [
+                ep for ep in self.endpoints
+                if (providers is None or ep.name in providers)
+                and (ep.api_key or not keyed_only)
+                and self._available(ep, now)
+            ]
+        # Эндпоинт без замеров задержки идёт после измеренных (запасной URL пробуется только при сбое),
+        # между собой такие — по приоритету (свой URL раньше стандартного)
+        return sorted(
+            candidates,
+            key=lambda ep: (ep.tier, ep.ewma is None, ep.ewma or 0.0, ep.priority),
+        )
+
+    def _begin(self, ep: Endpoint) -> bool:
+        """Занять эндпоинт для запроса. False — автомат разомкнут или пробный запрос уже идёт."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._available(ep, now):
+                return False
+            if ep.state != CLOSED:
+                ep.state = HALF_OPEN
+                ep.trial_inflight = True
+            ep.requests += 1
+            return True
+
+    def _success(self, ep: Endpoint, latency: float):
+        with self._lock:
+            ep.state = CLOSED
+            ep.failures = 0
+            ep.trial_inflight = False
+            ep.ewma = latency if ep.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * ep.ewma
+
+    def _failure(self, ep: Endpoint, error: BaseException):
+        with self._lock:
+            ep.errors += 1
+            ep.failures += 1
+            ep.last_error = f"{type(error).__name__}: {error}"[:300]
+            if ep.state == HALF_OPEN or ep.failures >= self.failure_threshold:
+                ep.state = OPEN
+                ep.opened_at = time.monotonic()
+            ep.trial_inflight = False
+
+    def _abandon(self, ep: Endpoint):
+        """Запрос отменён (клиент ушёл) — ни успех, ни ошибка; пробный слот освобождается."""
+        with self._lock:
+            ep.trial_inflight = False
+
+    @contextmanager
+    def attempt(self, ep: Endpoint):
+        """Учесть результат запроса к эндпоинту: задержку при успехе, ошибку — в автомат (и в метрики)."""
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            metrics.record_stage("llm", time.monotonic() - started, provider=ep.name)
+            metrics.inc("llm_requests_total", provider=ep.name, result="error")
+            self._failure(ep, e)
+            raise
+        except BaseException:
+            self._abandon(ep)
+            raise
+        latency = time.monotonic() - started
+        metrics.record_stage("llm", latency, provider=ep.name)
+        metrics.inc("llm_requests_total", provider=ep.name, result="ok")
+        self._success(ep, latency)
+
+    def acquire(self, providers: Optional[Sequence[str]] = None):
+        """Эндпоинты по очереди, уже занятые под запрос (для потоковых вызовов, см. attempt)."""
+        for ep in self.plan(providers):
+            if self._begin(ep):
+                yield ep
+
+    async def run(self, call: Callable[[Endpoint], Awaitable[T]], providers: Optional[Sequence[str]] = None) -> T:
+        """
+        Выполнить call(endpoint) на лучшем доступном эндпоинте; при ошибке — на следующем.
+        Пустой ответ — повод попробовать следующий эндпоинт, но не ошибка эндпоинта.
+        """
+        last_error: Optional[BaseException] = None
+        result = None
+        for ep in self.acquire(providers):
+            try:
+                with self.attempt(ep):
+                    result = await call(ep)
+            except Exception as e:
+                last_error, result = e, None
+                continue
+            if result:
+                return result
+        if result is not None:
+            return result
+        raise last_error or NoProviderAvailable("LLM временно недоступен: все провайдеры отключены после ошибок")
+
+    def run_sync(self, call: Callable[[Endpoint], T], providers: Optional[Sequence[str]] = None) -> T:
+        """Синхронный вариант run (для синхронных методов OpenAIService)."""
+        last_error: Optional[BaseException] = None
+        result = None
+        for ep in self.acquire(providers):
+            try:
+                with self.attempt(ep):
+                    result = call(ep)
+            except Exception as e:
+                last_error, result = e, None
+                continue
+            if result:
+                return result
+        if result is not None:
+            return result
+        raise last_error or NoProviderAvailable("LLM временно недоступен: все провайдеры отключены после ошибок")
+
+    def stats(self) -> dict:
+        """Для /health: состояние автомата, задержка (EWMA, мс) и счётчики по эндпоинтам."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                ep.name: {
+                    "state": ep.state,
+                    "ewma_ms": round(ep.ewma * 1000) if ep.ewma is not None else None,
+                    "requests": ep.requests,
+                    "errors": ep.errors,
+                    "consecutive_failures": ep.failures,
+                    "open_for": round(max(0.0, self.cooldown - (now - ep.opened_at)), 1) if ep.state == OPEN else 0.0,
+                    "timeout": ep.timeout,
+                    "last_error": ep.last_error,
+                }
+                for ep in self.endpoints
+            }
+
+
+llm_router = LLMRouter()
@@ -0,0 +1,105 @@
+"""
+Учёт вызовов LLM на одну запись истории: сколько запросов к модели, токены prompt/completion,
+сколько токенов prompt пришло из кэша префикса у провайдера (DeepSeek prompt_cache_hit_tokens,
+OpenAI prompt_tokens_details.cached_tokens), был ли ответ взят из нашего кэша.
+
+Текущий учёт хранится в contextvar: вызовы LLM внутри track() — в т.ч. в asyncio.to_thread
+и в задачах, созданных внутри, — записываются в него.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, List, Optional
+
+
+@dataclass
+class LLMUsage:
+    """Сумма по вызовам LLM. В пакете страниц каждой странице достаётся своя доля токенов (batched=True)."""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    max_tokens: int = 0
+    providers: List[str] = field(default_factory=list)
+    response_cache: bool = False
+    batched: bool = False
+
+    def add(self, provider: str, prompt: int, completion: int, cached: int, max_tokens: int):
+        self.calls += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cached_tokens += cached
+        self.max_tokens += max_tokens
+        if provider not in self.providers:
+            self.providers.append(provider)
+
+    def add_share(self, other: "LLMUsage", share: float):
+        """Доля чужого учёта (общий запрос пакета на n страниц — share = 1/n)."""
+        self.calls += other.calls
+        self.prompt_tokens += round(other.prompt_tokens * share)
+        self.completion_tokens += round(other.completion_tokens * share)
+        self.cached_tokens += round(other.cached_tokens * share)
+        self.max_tokens += round(other.max_tokens * share)
+        for provider in other.providers:
+            if provider not in self.providers:
+                self.providers.append(provider)
+        self.batched = True
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        return round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else None
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "cache_hit_ratio": self.cache_hit_ratio}
+
+
+_current: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+
+def current() -> Optional[LLMUsage]:
+    return _current.get()
+
+
+@contextmanager
+def track(usage: Optional[LLMUsage] = None) -> Iterator[LLMUsage]:
+    """Учитывать вызовы LLM внутри блока в usage (по умолчанию — новый учёт)."""
+    usage = usage if usage is not None else LLMUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Асинхронный генератор закрыт из другого контекста (клиент ушёл посреди потока)
+            pass
+
+
+def record(provider: str, usage, max_tokens: int):
+    """usage из ответа провайдера → текущий учёт (если он есть)."""
+    target = _current.get()
+    if target is None or usage is None:
+        return
+    target.add(
+        provider,
+        usage.prompt_tokens or 0,
+        usage.completion_tokens or 0,
+        cached_prompt_tokens(usage),
+        max_tokens,
+    )
+
+
+def cached_prompt_tokens(usage) -> int:
+    """Токены prompt из кэша префикса: поле DeepSeek или OpenAI, какое есть."""
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", None) if details is not None else None
+    return hit or 0
+
+
+def mark_response_cache():
+    """Ответ взят из кэша ответов (LLM не вызывался)."""
+    target = _current.get()
+    if target is not None:
+        target.response_cache = True
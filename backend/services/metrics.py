@@ -0,0 +1,184 @@
+"""
+Метрики в текстовом формате Prometheus (/metrics) и время этапов текущего запроса
+для заголовка Server-Timing: загрузка страницы, разбор HTML, LLM по провайдерам, разбор JSON, запись истории.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Границы корзин гистограмм длительности, сек (от разбора JSON до долгого ответа LLM)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "competitor_monitor_"
+
+HELP = {
+    "stage_duration_seconds": ("histogram", "Длительность этапа обработки (stage), для LLM — по провайдеру"),
+    "http_request_duration_seconds": ("histogram", "Длительность HTTP-запроса по эндпоинту"),
+    "http_requests_total": ("counter", "HTTP-запросы по эндпоинту, методу и статусу"),
+    "http_request_errors_total": ("counter", "Неуспешные запросы по эндпоинту: статус 5xx или success=false / событие error"),
+    "llm_requests_total": ("counter", "Запросы к LLM по провайдеру и результату"),
+    "llm_tokens_total": ("counter", "Токены LLM по провайдеру и виду (prompt/completion/cached — из кэша префикса)"),
+    "llm_json_total": ("counter", "Разбор JSON из ответа LLM: ok, repaired (после починки), failed"),
+    "llm_json_rerequests_total": ("counter", "Повторные запросы к LLM, когда JSON не разобрался даже после починки"),
+    "jobs_total": ("counter", "Фоновые задачи по виду и исходу: done, failed, retried (отложена после ошибки провайдера)"),
+    "page_bytes_total": ("counter", "Байт страниц прочитано парсером"),
+    "pages_fetched_total": ("counter", "Загрузки страниц по результату"),
+    "image_bytes_total": ("counter", "Байт изображений: получено (in) и отправлено в модель (sent)"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class _Histogram:
+    counts: List[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+    total: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+@dataclass
+class RequestTimings:
+    """Этапы одного HTTP-запроса: имя → [суммарная длительность, сколько раз]."""
+    started: float = field(default_factory=time.perf_counter)
+    stages: Dict[str, List[float]] = field(default_factory=dict)
+    failed: bool = False
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing: этапы и total (до начала ответа), в миллисекундах."""
+        parts = [f"{name};dur={total * 1000:.1f}" for name, (total, _) in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _le(bound) -> str:
+    return f'le="{bound:g}"' if isinstance(bound, float) else f'le="{bound}"'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metrics:
+    """Счётчики и гистограммы процесса. Потокобезопасно: этапы идут и в потоках (asyncio.to_thread)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_stage(self, stage: str, seconds: float, provider: Optional[str] = None):
+        """Учесть этап: в гистограмму и в Server-Timing текущего запроса (если он есть)."""
+        self.observe("stage_duration_seconds", seconds, stage=stage, provider=provider)
+        request = _request.get()
+        if request is not None:
+            name = f"{stage}_{provider}" if provider else stage
+            with self._lock:
+                total = request.stages.setdefault(name, [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+
+    @contextmanager
+    def stage(self, stage: str, provider: Optional[str] = None):
+        """Замер этапа: with metrics.stage("fetch"): ... (в т.ч. вокруг await)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started, provider)
+
+    # --- HTTP-запросы (middleware в main.py) ---
+
+    @staticmethod
+    def begin_request() -> Tuple[RequestTimings, object]:
+        request = RequestTimings()
+        return request, _request.set(request)
+
+    def end_request(self, request: RequestTimings, token, endpoint: str, method: str, status: int):
+        _request.reset(token)
+        self.observe("http_request_duration_seconds", time.perf_counter() - request.started, endpoint=endpoint)
+        self.inc("http_requests_total", endpoint=endpoint, method=method, status=status)
+        if status >= 500 or request.failed:
+            self.inc("http_request_errors_total", endpoint=endpoint)
+
+    @staticmethod
+    def mark_failed():
+        """Запрос завершился ошибкой, хотя статус 200 (success=false в ответе, событие error в потоке)."""
+        request = _request.get()
+        if request is not None:
+            request.failed = True
+
+    # --- экспорт ---
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            histograms = {k: (list(h.counts), h.total, h.count) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines: List[str] = []
+        names = sorted({name for name, _ in histograms} | {name for name, _ in counters})
+        for name in names:
+            kind, text = HELP.get(name, ("counter", name))
+            full = PREFIX + name
+            lines.append(f"# HELP {full} {text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(BUCKETS, counts):
+                    cumulative += n
+                    lines.append(f"{full}_bucket{_format_labels(labels, _le(bound))} {cumulative}")
+                lines.append(f"{full}_bucket{_format_labels(labels, _le('+Inf'))} {count}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {count}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -1,159 +1,436 @@
 """
 Сервис анализа: DeepSeek — текст и распарсенные страницы; OpenAI — изображения (и PDF при появлении).
 """
+import asyncio
 import base64
 import json
-import re
-from typing import Optional
-
-from openai import OpenAI
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 
 from backend.config import settings
 from backend.models.schemas import CompetitorAnalysis, ImageAnalysis
+from backend.services import llm_usage
+from backend.services.batcher import MicroBatcher
+from backend.services.cache_service import analysis_cache, normalize_text
+from backend.services.json_extract import coerce, extract_json
+from backend.services.json_stream import JsonFieldStream
+from backend.services.llm_clients import llm_clients
+from backend.services.llm_router import Endpoint, NoProviderAvailable, llm_router
+from backend.services.metrics import metrics
+from backend.services.prompts import (
+    IMAGE_PROMPT,
+    JSON_RETRY_PROMPT,
+    MIN_OUTPUT_TOKENS,
+    PARSED_BATCH_PROMPT,
+    PARSED_PROMPT,
+    TEXT_PROMPT,
+    PromptTemplate,
+)
+from backend.services.singleflight import SingleFlight
+
+# Изображения понимает только OpenAI (vision-модель)
+VISION_PROVIDERS = ("openai",)
+
+# Поля анализа текста (анализ страницы заполняет ещё поля новостей)
+TEXT_FIELDS = ("strengths", "weaknesses", "unique_offers", "recommendations", "summary")
+
+
+def has_content(analysis) -> bool:
+    """Анализ не пустой: модель вернула разобранный JSON, а не заглушку после ошибки (оценка не в счёт)."""
+    return any(v for k, v in analysis.model_dump().items() if k != "visual_style_score")
 
 
 class OpenAIService:
-    """DeepSeek — текст и парсинг (с повтором на стандартный URL как в лекции); OpenAI — изображения."""
+    """DeepSeek — текст и парсинг (эндпоинт выбирает llm_router); OpenAI — изображения и запасной провайдер."""
 
-    # Стандартный URL для повтора, если кастомный DEEPSEEK_BASE_URL не сработал (как в PEm07 image_cli)
-    DEEPSEEK_STANDARD_BASE = "https://api.deepseek.com"
+    TEMPERATURE = 0.7
 
     def __init__(self):
-        self.openai_client = OpenAI(api_key=settings.openai_api_key)
         self.openai_model = settings.openai_model
         self.vision_model = settings.openai_vision_model
         self.deepseek_api_key = (settings.deepseek_api_key or "").strip()
-        self.deepseek_base_url = (settings.deepseek_base_url or "").strip() or self.DEEPSEEK_STANDARD_BASE
         self.deepseek_model = settings.deepseek_model or "deepseek-chat"
+        # Ограничение одновременных запросов к LLM из async-эндпоинтов
+        self._semaphore = asyncio.Semaphore(max(1, settings.llm_max_concurrency))
+        # Одинаковые одновременные запросы (тот же ключ кэша) идут в LLM один раз
+        self.inflight = SingleFlight()
+        # Пакетный анализ страниц: несколько коротких страниц — один запрос с общим системным промптом
+        self.batcher = MicroBatcher(self._run_parsed_batch, settings.llm_batch_size, settings.llm_batch_max_wait)
+        self.batch_retried = 0
+
+    @property
+    def text_model(self) -> str:
+        """Модель для текста: DeepSeek, если задан ключ, иначе OpenAI."""
+        return self.deepseek_model if self.deepseek_api_key else self.openai_model
+
+    def _cache_key(self, model: str, messages: list, payload) -> str:
+        """Ключ кэша: модель + системный промпт + температура + нормализованный вход."""
+        return analysis_cache.make_key(model, messages[0]["content"], self.TEMPERATURE, payload)
+
+    def _cached(self, key: str, bypass_cache: bool, model_cls):
+        """Ответ из кэша (если не запрошен обход) или None."""
+        if bypass_cache:
+            return None
+        data = analysis_cache.get(key)
+        if data is None:
+            return None
+        llm_usage.mark_response_cache()
+        return model_cls(**data)
+
+    async def _cached_async(self, key: str, bypass_cache: bool, model_cls):
+        """Как _cached, но дисковый уровень кэша читается в потоке."""
+        if bypass_cache:
+            return None
+        data = await analysis_cache.get_async(key)
+        if data is None:
+            return None
+        llm_usage.mark_response_cache()
+        return model_cls(**data)
+
+    @staticmethod
+    def _remember(key: str, analysis) -> None:
+        """Положить анализ в кэш. Пустые ответы (модель вернула не-JSON) не кэшируем."""
+        if has_content(analysis):
+            analysis_cache.set(key, analysis.model_dump())
+
+    @staticmethod
+    async def _remember_async(key: str, analysis) -> None:
+        """Как _remember, но запись на диск — в потоке."""
+        if has_content(analysis):
+            await analysis_cache.set_async(key, analysis.model_dump())
+
+    async def _coalesced(self, key: str, produce):
+        """Выполнить produce() один раз на ключ среди одновременных вызовов и закэшировать результат."""
+        async def run():
+            analysis = await produce()
+            await self._remember_async(key, analysis)
+            return analysis
+
+        return await self.inflight.do(key, run)
+
+    @staticmethod
+    def _response_format() -> dict:
+        """JSON-режим ответа (response_format json_object) — DeepSeek и OpenAI его поддерживают; LLM_JSON_MODE=false — выключить."""
+        return {"response_format": {"type": "json_object"}} if settings.llm_json_mode else {}
+
+    @staticmethod
+    def _max_tokens(template: PromptTemplate, payload, items: int = 1) -> int:
+        """
+        max_tokens запроса: бюджет ответа по схеме (на items страниц пакета), но не больше
+        LLM_MAX_OUTPUT_TOKENS и не больше места, оставшегося в контексте после промпта.
+        """
+        room = settings.llm_context_tokens - template.prompt_tokens(payload)
+        budget = min(template.max_tokens * items, settings.llm_max_output_tokens, room)
+        return max(MIN_OUTPUT_TOKENS, budget)
+
+    @staticmethod
+    def _count_usage(ep: Endpoint, response, max_tokens: int):
+        """Токены ответа — в метрики (по провайдеру) и в учёт текущей записи истории (llm_usage)."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, provider=ep.name, kind="prompt")
+            metrics.inc("llm_tokens_total", usage.completion_tokens or 0, provider=ep.name, kind="completion")
+            metrics.inc("llm_tokens_total", llm_usage.cached_prompt_tokens(usage), provider=ep.name, kind="cached")
+            llm_usage.record(ep.name, usage, max_tokens)
 
-    def _chat_text(self, messages: list) -> str:
-        """Текст: DeepSeek (с повтором на стандартный URL как в лекции) или OpenAI, если нет DEEPSEEK_API_KEY."""
-        if self.deepseek_api_key:
-            for base_url in (self.deepseek_base_url, self.DEEPSEEK_STANDARD_BASE):
+    def _chat_text(self, messages: list, max_tokens: int) -> str:
+        """Текст: лучший доступный эндпоинт из llm_router (DeepSeek свой URL / стандартный, запасной — OpenAI)."""
+
+        def call(ep: Endpoint) -> str:
+            response = llm_clients.get(ep.api_key, ep.base_url).chat.completions.create(
+                model=ep.model,
+                messages=messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens,
+                timeout=ep.request_timeout,
+                **self._response_format(),
+            )
+            self._count_usage(ep, response, max_tokens)
+            return (response.choices[0].message.content or "").strip()
+
+        return llm_router.run_sync(call)
+
+    async def _chat_text_async(self, messages: list, max_tokens: int) -> str:
+        """Асинхронный вариант _chat_text (AsyncOpenAI, не блокирует event loop)."""
+
+        async def call(ep: Endpoint) -> str:
+            response = await llm_clients.get_async(ep.api_key, ep.base_url).chat.completions.create(
+                model=ep.model,
+                messages=messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens,
+                timeout=ep.request_timeout,
+                **self._response_format(),
+            )
+            self._count_usage(ep, response, max_tokens)
+            return (response.choices[0].message.content or "").strip()
+
+        async with self._semaphore:
+            return await llm_router.run(call)
+
+    async def _stream_completion(self, ep: Endpoint, messages: list, max_tokens: int) -> AsyncIterator[str]:
+        """Куски текста ответа (stream=True) по мере генерации. Токены — из последнего куска (include_usage)."""
+        stream = await llm_clients.get_async(ep.api_key, ep.base_url).chat.completions.create(
+            model=ep.model,
+            messages=messages,
+            temperature=self.TEMPERATURE,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=ep.request_timeout,
+            **self._response_format(),
+        )
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self._count_usage(ep, chunk, max_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def _stream_chat_text(self, messages: list, max_tokens: int) -> AsyncIterator[str]:
+        """
+        Потоковый вариант _chat_text_async с тем же выбором эндпоинта. На следующий эндпоинт
+        переключаемся, только пока не отдано ни одного куска.
+        """
+        last_error: Optional[Exception] = None
+        tried = False
+        async with self._semaphore:
+            for ep in llm_router.acquire():
+                tried = True
+                produced = False
                 try:
-                    client = OpenAI(api_key=self.deepseek_api_key, base_url=base_url)
-                    response = client.chat.completions.create(
-                        model=self.deepseek_model,
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=2000,
-                    )
-                    content = (response.choices[0].message.content or "").strip()
-                    if content:
-                        return content
-                except Exception:
-                    if base_url == self.DEEPSEEK_STANDARD_BASE:
+                    with llm_router.attempt(ep):
+                        async for delta in self._stream_completion(ep, messages, max_tokens):
+                            produced = True
+                            yield delta
+                except Exception as e:
+                    if produced:
                         raise
+                    last_error = e
                     continue
-        # Fallback на OpenAI, если DeepSeek не настроен
-        response = self.openai_client.chat.completions.create(
-            model=self.openai_model,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=2000,
-        )
-        return (response.choices[0].message.content or "").strip()
+                if produced:
+                    return
+        if last_error is not None:
+            raise last_error
+        if not tried:
+            raise NoProviderAvailable("LLM временно недоступен: все провайдеры отключены после ошибок")
+
+    async def _stream_analysis(
+        self,
+        messages: list,
+        max_tokens: int,
+        key: str,
+        bypass_cache: bool,
+        to_analysis: Callable[[str], CompetitorAnalysis],
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        События для SSE: delta — кусок ответа модели, item — очередной элемент массива (strengths и т.п.),
+        field — готовое поле, result — итоговый проверенный анализ (тот же, что вернул бы не-потоковый метод).
+        """
+        cached = await self._cached_async(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            for name, value in cached.model_dump().items():
+                yield "field", {"field": name, "value": value}
+            yield "result", {"analysis": cached, "cached": True}
+            return
+        parser = JsonFieldStream()
+        parts = []
+        async for delta in self._stream_chat_text(messages, max_tokens):
+            parts.append(delta)
+            yield "delta", {"text": delta}
+            for kind, name, value in parser.feed(delta):
+                yield kind, {"field": name, "value": value}
+        analysis = to_analysis("".join(parts).strip())
+        await self._remember_async(key, analysis)
+        yield "result", {"analysis": analysis, "cached": False}
+
+    @staticmethod
+    def _extract(content: str, expect: type):
+        """extract_json с учётом в метриках: разобрано сразу, после починки или не разобрано."""
+        with metrics.stage("parse_json"):
+            data, repaired = extract_json(content, expect)
+        outcome = "failed" if data is None else "repaired" if repaired else "ok"
+        metrics.inc("llm_json_total", outcome=outcome)
+        return data
+
+    @classmethod
+    def _parse_json_array(cls, content: str) -> list:
+        """Извлечь JSON-массив из ответа модели (пакетный режим; подходит и {"items": [...]}). Не разобрался — пустой список."""
+        return cls._extract(content, list) or []
 
     def _parse_json_response(self, content: str) -> dict:
-        """Извлечь JSON из ответа модели."""
-        json_match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", content)
-        if json_match:
-            content = json_match.group(1)
-        json_match = re.search(r"\{[\s\S]*\}", content)
-        if json_match:
-            content = json_match.group(0)
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            return {}
+        """Извлечь JSON-объект из ответа модели (с починкой). Не разобрался — пустой dict."""
+        return self._extract(content, dict) or {}
 
-    def analyze_text(self, text: str) -> CompetitorAnalysis:
-        """Анализ текста (юридические услуги, описание конкурента)."""
-        system_prompt = """Ты — эксперт по юриспруденции и конкурентному анализу юридического рынка. Проанализируй текст (описание услуг, лендинг юрфирмы, реклама) и верни структурированный JSON-ответ.
-
-Формат ответа (строго JSON):
-{
-    "strengths": ["сильная сторона 1", "сильная сторона 2", ...],
-    "weaknesses": ["слабая сторона 1", "слабая сторона 2", ...],
-    "unique_offers": ["уникальное предложение 1", ...],
-    "recommendations": ["рекомендация 1", "рекомендация 2", ...],
-    "summary": "Краткое резюме анализа"
-}
-
-Важно:
-- Каждый массив 3-5 пунктов, пиши на русском
-- Оценивай с точки зрения клиента и подачи юридических услуг: понятность, доверие, риски формулировок"""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Проанализируй текст (юридическая сфера):\n\n{text}"},
+    def _json_reply(self, messages: list, chat: Callable[[list, int], str], max_tokens: int) -> dict:
+        """
+        Ответ модели → dict. Если JSON не нашёлся даже после починки — один повторный запрос
+        с просьбой вернуть только JSON (LLM_JSON_RETRY=false — без повтора).
+        """
+        content = chat(messages, max_tokens)
+        data = self._parse_json_response(content)
+        if not data and settings.llm_json_retry:
+            metrics.inc("llm_json_rerequests_total")
+            data = self._parse_json_response(chat(self._retry_messages(messages, content), max_tokens))
+        return data
+
+    async def _json_reply_async(
+        self, messages: list, chat: Callable[[list, int], Awaitable[str]], max_tokens: int
+    ) -> dict:
+        """Асинхронный вариант _json_reply."""
+        content = await chat(messages, max_tokens)
+        data = self._parse_json_response(content)
+        if not data and settings.llm_json_retry:
+            metrics.inc("llm_json_rerequests_total")
+            data = self._parse_json_response(await chat(self._retry_messages(messages, content), max_tokens))
+        return data
+
+    @staticmethod
+    def _retry_messages(messages: list, content: str) -> list:
+        return messages + [
+            {"role": "assistant", "content": content[:4000] or "(пустой ответ)"},
+            {"role": "user", "content": JSON_RETRY_PROMPT},
         ]
-        content = self._chat_text(messages)
-        data = self._parse_json_response(content or "")
-        return CompetitorAnalysis(
-            strengths=data.get("strengths", []),
-            weaknesses=data.get("weaknesses", []),
-            unique_offers=data.get("unique_offers", []),
-            recommendations=data.get("recommendations", []),
-            summary=data.get("summary", ""),
+
+    @staticmethod
+    def _text_messages(text: str) -> list:
+        """Сообщения для анализа текста (юридические услуги, описание конкурента)."""
+        return TEXT_PROMPT.messages(text)
+
+    def _text_analysis(self, content: str) -> CompetitorAnalysis:
+        """Ответ модели на анализ текста → CompetitorAnalysis."""
+        return self._text_from_data(self._parse_json_response(content or ""))
+
+    @staticmethod
+    def _text_from_data(data: dict) -> CompetitorAnalysis:
+        """Разобранный JSON анализа текста → CompetitorAnalysis (без полей новостей)."""
+        return coerce(data, CompetitorAnalysis, TEXT_FIELDS)
+
+    def analyze_text(self, text: str, bypass_cache: bool = False) -> CompetitorAnalysis:
+        """Анализ текста (юридические услуги, описание конкурента)."""
+        messages = self._text_messages(text)
+        key = self._cache_key(self.text_model, messages, normalize_text(text))
+        cached = self._cached(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            return cached
+        analysis = self._text_from_data(
+            self._json_reply(messages, self._chat_text, self._max_tokens(TEXT_PROMPT, text))
         )
+        self._remember(key, analysis)
+        return analysis
 
-    def analyze_image(self, image_base64: str, mime_type: str = "image/jpeg") -> ImageAnalysis:
-        """Анализ изображения (лендинг, баннер юрфирмы, скрин сайта)."""
-        system_prompt = """Ты — эксперт по визуальному маркетингу и дизайну в сфере юриспруденции. Проанализируй изображение (лендинг, баннер, сайт юрфирмы) и верни структурированный JSON-ответ.
-
-Формат ответа (строго JSON):
-{
-    "description": "Детальное описание того, что изображено",
-    "marketing_insights": ["инсайт 1", "инсайт 2", ...],
-    "visual_style_score": 7,
-    "visual_style_analysis": "Анализ визуального стиля: насколько серьёзно и доверительно выглядит",
-    "recommendations": ["рекомендация 1", "рекомендация 2", ...]
-}
-
-Важно:
-- visual_style_score от 0 до 10 (в т.ч. впечатление «доверия» для юридической темы)
-- Каждый массив 3-5 пунктов, пиши на русском
-- Оценивай: подачу для юруслуг, читаемость, цвет, типографику"""
-
-        response = self.openai_client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Проанализируй это изображение (юридическая тема: лендинг, баннер, сайт) с точки зрения маркетинга и доверия:",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:{mime_type};base64,{image_base64}"},
-                        },
-                    ],
-                },
-            ],
-            temperature=0.7,
-            max_tokens=2000,
+    async def analyze_text_async(self, text: str, bypass_cache: bool = False) -> CompetitorAnalysis:
+        """Асинхронный анализ текста."""
+        messages = self._text_messages(text)
+        key = self._cache_key(self.text_model, messages, normalize_text(text))
+        cached = await self._cached_async(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            return cached
+
+        max_tokens = self._max_tokens(TEXT_PROMPT, text)
+
+        async def produce():
+            return self._text_from_data(await self._json_reply_async(messages, self._chat_text_async, max_tokens))
+
+        return await self._coalesced(key, produce)
+
+    async def analyze_text_stream(self, text: str, bypass_cache: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+        """Анализ текста с потоковой выдачей (события — см. _stream_analysis)."""
+        messages = self._text_messages(text)
+        key = self._cache_key(self.text_model, messages, normalize_text(text))
+        max_tokens = self._max_tokens(TEXT_PROMPT, text)
+        async for event in self._stream_analysis(messages, max_tokens, key, bypass_cache, self._text_analysis):
+            yield event
+
+    @staticmethod
+    def _image_messages(image_base64: str, mime_type: str) -> list:
+        """Сообщения для анализа изображения (лендинг, баннер юрфирмы, скрин сайта)."""
+        return IMAGE_PROMPT.messages(
+            [{"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}]
         )
-        content = response.choices[0].message.content
-        data = self._parse_json_response(content or "")
-        return ImageAnalysis(
-            description=data.get("description", ""),
-            marketing_insights=data.get("marketing_insights", []),
-            visual_style_score=min(10, max(0, data.get("visual_style_score", 5))),
-            visual_style_analysis=data.get("visual_style_analysis", ""),
-            recommendations=data.get("recommendations", []),
+
+    @staticmethod
+    def _image_from_data(data: dict) -> ImageAnalysis:
+        """Разобранный JSON анализа изображения → ImageAnalysis (нет оценки — 5, вне 0..10 — к границе)."""
+        return coerce({"visual_style_score": 5, **data}, ImageAnalysis)
+
+    def _vision_text(self, messages: list, max_tokens: int) -> str:
+        """Ответ vision-модели (только провайдеры из VISION_PROVIDERS)."""
+
+        def call(ep: Endpoint) -> str:
+            response = llm_clients.get(ep.api_key, ep.base_url).chat.completions.create(
+                model=self.vision_model,
+                messages=messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens,
+                timeout=ep.request_timeout,
+                **self._response_format(),
+            )
+            self._count_usage(ep, response, max_tokens)
+            return response.choices[0].message.content or ""
+
+        return llm_router.run_sync(call, providers=VISION_PROVIDERS)
+
+    async def _vision_text_async(self, messages: list, max_tokens: int) -> str:
+        """Асинхронный вариант _vision_text."""
+
+        async def call(ep: Endpoint) -> str:
+            response = await llm_clients.get_async(ep.api_key, ep.base_url).chat.completions.create(
+                model=self.vision_model,
+                messages=messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens,
+                timeout=ep.request_timeout,
+                **self._response_format(),
+            )
+            self._count_usage(ep, response, max_tokens)
+            return response.choices[0].message.content or ""
+
+        async with self._semaphore:
+            return await llm_router.run(call, providers=VISION_PROVIDERS)
+
+    def _image_cache_key(self, messages: list, image_base64: str, mime_type: str) -> str:
+        """Ключ кэша для изображения — по байтам картинки, а не по base64-строке."""
+        payload = mime_type.encode("utf-8") + b"\0" + base64.b64decode(image_base64)
+        return self._cache_key(self.vision_model, messages, payload)
+
+    def analyze_image(
+        self, image_base64: str, mime_type: str = "image/jpeg", bypass_cache: bool = False
+    ) -> ImageAnalysis:
+        """Анализ изображения (лендинг, баннер юрфирмы, скрин сайта)."""
+        messages = self._image_messages(image_base64, mime_type)
+        key = self._image_cache_key(messages, image_base64, mime_type)
+        cached = self._cached(key, bypass_cache, ImageAnalysis)
+        if cached is not None:
+            return cached
+
+        analysis = self._image_from_data(
+            self._json_reply(messages, self._vision_text, self._max_tokens(IMAGE_PROMPT, []))
         )
+        self._remember(key, analysis)
+        return analysis
 
-    def analyze_parsed_content(
-        self,
-        title: Optional[str],
-        h1: Optional[str],
-        paragraph: Optional[str],
-    ) -> CompetitorAnalysis:
-        """Анализ распарсенного контента: новости/обновления (КонсультантПлюс и т.п.) или описание конкурента."""
+    async def analyze_image_async(
+        self, image_base64: str, mime_type: str = "image/jpeg", bypass_cache: bool = False
+    ) -> ImageAnalysis:
+        """Асинхронный анализ изображения."""
+        messages = self._image_messages(image_base64, mime_type)
+        key = self._image_cache_key(messages, image_base64, mime_type)
+        cached = await self._cached_async(key, bypass_cache, ImageAnalysis)
+        if cached is not None:
+            return cached
+
+        max_tokens = self._max_tokens(IMAGE_PROMPT, [])
+
+        async def produce():
+            return self._image_from_data(await self._json_reply_async(messages, self._vision_text_async, max_tokens))
+
+        return await self._coalesced(key, produce)
+
+    @staticmethod
+    def _parsed_payload(title: Optional[str], h1: Optional[str], paragraph: Optional[str]) -> str:
+        """Извлечённый контент страницы одним текстом (пустая строка — извлечь нечего)."""
         parts = []
         if title:
             parts.append(f"Заголовок страницы (title): {title}")
@@ -161,50 +438,179 @@ class OpenAIService:
             parts.append(f"Главный заголовок (H1): {h1}")
         if paragraph:
             parts.append(f"Первый абзац / фрагмент контента: {paragraph}")
-        combined = "\n\n".join(parts)
-        if not combined.strip():
-            return CompetitorAnalysis(summary="Не удалось извлечь контент для анализа")
+        return "\n\n".join(parts).strip()
 
-        system_prompt = """Ты — эксперт по юриспруденции. По контенту страницы (заголовки, абзац) определи тип страницы и заполни JSON.
-
-Если это новости, обновления законодательства, анонсы (например КонсультантПлюс, правовые порталы):
-- Заполни: news_highlights (что нового, ключевые изменения), attention_points (на что обратить внимание юристу), key_topics (ключевые темы/рубрики), summary (краткое резюме).
-- Массивы strengths, weaknesses, unique_offers, recommendations оставь пустыми [].
-
-Если это описание юридических услуг, лендинг юрфирмы, реклама:
-- Заполни: strengths, weaknesses, unique_offers, recommendations, summary.
-- Массивы news_highlights, attention_points, key_topics оставь пустыми [].
-
-Формат ответа (строго JSON):
-{
-    "strengths": [],
-    "weaknesses": [],
-    "unique_offers": [],
-    "recommendations": [],
-    "summary": "Краткое резюме",
-    "news_highlights": [],
-    "attention_points": [],
-    "key_topics": []
-}
-
-Заполняй только те массивы, которые подходят под тип страницы. summary заполняй всегда. Пиши на русском, 3-7 пунктов в каждом непустом массиве."""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Проанализируй контент страницы:\n\n{combined}"},
-        ]
-        content = self._chat_text(messages)
-        data = self._parse_json_response(content or "")
-        return CompetitorAnalysis(
-            strengths=data.get("strengths", []),
-            weaknesses=data.get("weaknesses", []),
-            unique_offers=data.get("unique_offers", []),
-            recommendations=data.get("recommendations", []),
-            summary=data.get("summary", ""),
-            news_highlights=data.get("news_highlights") or [],
-            attention_points=data.get("attention_points") or [],
-            key_topics=data.get("key_topics") or [],
+    def _parsed_messages(
+        self,
+        title: Optional[str],
+        h1: Optional[str],
+        paragraph: Optional[str],
+    ) -> Optional[list]:
+        """Сообщения для анализа распарсенной страницы. None — если извлечь нечего."""
+        combined = self._parsed_payload(title, h1, paragraph)
+        if not combined:
+            return None
+        return PARSED_PROMPT.messages(combined)
+
+    @staticmethod
+    def _parsed_batch_payload(contents: List[str]) -> str:
+        """Страницы пакета с номерами — переменная часть запроса после общего системного промпта."""
+        pages = [{"id": str(i), "content": content} for i, content in enumerate(contents)]
+        return json.dumps(pages, ensure_ascii=False)
+
+    def _parsed_analysis(self, content: str) -> CompetitorAnalysis:
+        """Ответ модели на анализ страницы → CompetitorAnalysis (с полями новостей)."""
+        return self._parsed_from_data(self._parse_json_response(content or ""))
+
+    @staticmethod
+    def _parsed_from_data(data: dict) -> CompetitorAnalysis:
+        """Разобранный JSON анализа страницы → CompetitorAnalysis."""
+        return coerce(data, CompetitorAnalysis)
+
+    def analyze_parsed_content(
+        self,
+        title: Optional[str],
+        h1: Optional[str],
+        paragraph: Optional[str],
+        bypass_cache: bool = False,
+    ) -> CompetitorAnalysis:
+        """Анализ распарсенного контента: новости/обновления (КонсультантПлюс и т.п.) или описание конкурента."""
+        messages = self._parsed_messages(title, h1, paragraph)
+        if messages is None:
+            return CompetitorAnalysis(summary="Не удалось извлечь контент для анализа")
+        key = self._cache_key(self.text_model, messages, normalize_text(messages[-1]["content"]))
+        cached = self._cached(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            return cached
+        analysis = self._parsed_from_data(
+            self._json_reply(messages, self._chat_text, self._max_tokens(PARSED_PROMPT, messages[-1]["content"]))
         )
+        self._remember(key, analysis)
+        return analysis
+
+    async def analyze_parsed_content_async(
+        self,
+        title: Optional[str],
+        h1: Optional[str],
+        paragraph: Optional[str],
+        bypass_cache: bool = False,
+    ) -> CompetitorAnalysis:
+        """Асинхронный анализ распарсенного контента."""
+        messages = self._parsed_messages(title, h1, paragraph)
+        if messages is None:
+            return CompetitorAnalysis(summary="Не удалось извлечь контент для анализа")
+        key = self._cache_key(self.text_model, messages, normalize_text(messages[-1]["content"]))
+        cached = await self._cached_async(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            return cached
+
+        max_tokens = self._max_tokens(PARSED_PROMPT, messages[-1]["content"])
+
+        async def produce():
+            return self._parsed_from_data(await self._json_reply_async(messages, self._chat_text_async, max_tokens))
+
+        return await self._coalesced(key, produce)
+
+    async def _run_parsed_batch(
+        self, items: List[Tuple[list, str, Optional[llm_usage.LLMUsage]]]
+    ) -> List[CompetitorAnalysis]:
+        """
+        Пакет (сообщения одиночного запроса, контент страницы, учёт токенов её записи истории) → анализы
+        в том же порядке. Токены общего запроса делятся между страницами поровну. Страницы, которых
+        нет в ответе или чей анализ не разобрался, повторяются по одной.
+        """
+        results: List[Optional[CompetitorAnalysis]] = [None] * len(items)
+        if len(items) > 1:
+            payload = self._parsed_batch_payload([content for _, content, _ in items])
+            with llm_usage.track() as batch_usage:
+                try:
+                    reply = await self._chat_text_async(
+                        PARSED_BATCH_PROMPT.messages(payload),
+                        max_tokens=self._max_tokens(PARSED_BATCH_PROMPT, payload, items=len(items)),
+                    )
+                except Exception:
+                    reply = ""
+            for _, _, usage in items:
+                if usage is not None:
+                    usage.add_share(batch_usage, 1 / len(items))
+            for data in self._parse_json_array(reply) if reply else []:
+                if not isinstance(data, dict):
+                    continue
+                try:
+                    index = int(data.get("id"))
+                except (TypeError, ValueError):
+                    continue
+                if not 0 <= index < len(items) or results[index] is not None or not data.get("summary"):
+                    continue
+                try:
+                    results[index] = self._parsed_from_data(data)
+                except ValueError:
+                    continue
+
+        async def single(messages: list, usage: Optional[llm_usage.LLMUsage]) -> CompetitorAnalysis:
+            max_tokens = self._max_tokens(PARSED_PROMPT, messages[-1]["content"])
+            with llm_usage.track(usage):
+                return self._parsed_from_data(
+                    await self._json_reply_async(messages, self._chat_text_async, max_tokens)
+                )
+
+        missing = [i for i, analysis in enumerate(results) if analysis is None]
+        if len(items) > 1:
+            self.batch_retried += len(missing)
+        retried = await asyncio.gather(*(single(items[i][0], items[i][2]) for i in missing), return_exceptions=True)
+        for i, analysis in zip(missing, retried):
+            results[i] = analysis
+        return results
+
+    async def analyze_parsed_content_batched(
+        self,
+        title: Optional[str],
+        h1: Optional[str],
+        paragraph: Optional[str],
+        bypass_cache: bool = False,
+    ) -> CompetitorAnalysis:
+        """
+        То же, что analyze_parsed_content_async, но короткие страницы копятся в пакет
+        (LLM_BATCH_SIZE страниц или LLM_BATCH_MAX_WAIT сек) и уходят в LLM одним запросом.
+        Для пакетного парсинга и мониторинга, где важнее пропускная способность, чем задержка.
+        """
+        messages = self._parsed_messages(title, h1, paragraph)
+        if messages is None:
+            return CompetitorAnalysis(summary="Не удалось извлечь контент для анализа")
+        content = self._parsed_payload(title, h1, paragraph)
+        if self.batcher.max_size <= 1 or len(content) > settings.llm_batch_max_chars:
+            return await self.analyze_parsed_content_async(title, h1, paragraph, bypass_cache=bypass_cache)
+        key = self._cache_key(self.text_model, messages, normalize_text(messages[-1]["content"]))
+        cached = await self._cached_async(key, bypass_cache, CompetitorAnalysis)
+        if cached is not None:
+            return cached
+
+        async def produce():
+            return await self.batcher.submit((messages, content, llm_usage.current()))
+
+        return await self._coalesced(key, produce)
+
+    def batch_stats(self) -> dict:
+        """Для /health: пакеты к LLM и сколько страниц пришлось повторить по одной."""
+        return {**self.batcher.stats(), "retried_single": self.batch_retried}
+
+    async def analyze_parsed_content_stream(
+        self,
+        title: Optional[str],
+        h1: Optional[str],
+        paragraph: Optional[str],
+        bypass_cache: bool = False,
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """Анализ распарсенного контента с потоковой выдачей (события — см. _stream_analysis)."""
+        messages = self._parsed_messages(title, h1, paragraph)
+        if messages is None:
+            analysis = CompetitorAnalysis(summary="Не удалось извлечь контент для анализа")
+            yield "result", {"analysis": analysis, "cached": False}
+            return
+        key = self._cache_key(self.text_model, messages, normalize_text(messages[-1]["content"]))
+        max_tokens = self._max_tokens(PARSED_PROMPT, messages[-1]["content"])
+        async for event in self._stream_analysis(messages, max_tokens, key, bypass_cache, self._parsed_analysis):
+            yield event
 
 
 openai_service = OpenAIService()
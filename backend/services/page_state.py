@@ -0,0 +1,133 @@
+"""
+Состояние отслеживаемых страниц: ETag/Last-Modified, хеш извлечённого контента и последний анализ.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from backend.config import settings
+
+
+def content_hash(title: Optional[str], h1: Optional[str], first_paragraph: Optional[str]) -> str:
+    """Хеш извлечённых полей — по нему определяется, изменилась ли страница."""
+    h = hashlib.sha256()
+    for part in (title, h1, first_paragraph):
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@dataclass
+class PageState:
+    """Сохранённое состояние URL после прошлой проверки."""
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    title: Optional[str] = None
+    h1: Optional[str] = None
+    first_paragraph: Optional[str] = None
+    analysis: Optional[dict] = None
+    analysis_hash: Optional[str] = None
+
+
+class PageStateStore:
+    """Хранилище состояния страниц (SQLite в data/)."""
+
+    def __init__(self):
+        self.db_path: Path = settings.page_state_path
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS page_state (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    title TEXT,
+                    h1 TEXT,
+                    first_paragraph TEXT,
+                    analysis TEXT,
+                    analysis_hash TEXT,
+                    checked_at TEXT
+                )
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение для текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> Optional[PageState]:
+        """Состояние URL или None, если страница ещё не проверялась."""
+        row = self._conn().execute("SELECT * FROM page_state WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return PageState(
+            url=row["url"],
+            etag=row["etag"],
+            last_modified=row["last_modified"],
+            content_hash=row["content_hash"],
+            title=row["title"],
+            h1=row["h1"],
+            first_paragraph=row["first_paragraph"],
+            analysis=json.loads(row["analysis"]) if row["analysis"] else None,
+            analysis_hash=row["analysis_hash"],
+        )
+
+    def save_fetch(
+        self,
+        url: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        title: Optional[str],
+        h1: Optional[str],
+        first_paragraph: Optional[str],
+        page_hash: str,
+    ):
+        """Запомнить результат загрузки (валидаторы кэша и извлечённые поля). Анализ не трогаем."""
+        with self._conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO page_state (url, etag, last_modified, content_hash, title, h1, first_paragraph, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash,
+                    title = excluded.title,
+                    h1 = excluded.h1,
+                    first_paragraph = excluded.first_paragraph,
+                    checked_at = excluded.checked_at
+                """,
+                (url, etag, last_modified, page_hash, title, h1, first_paragraph, datetime.now().isoformat()),
+            )
+
+    def touch(self, url: str):
+        """Отметить проверку без изменений (ответ 304)."""
+        with self._conn() as conn:
+            conn.execute("UPDATE page_state SET checked_at = ? WHERE url = ?", (datetime.now().isoformat(), url))
+
+    def save_analysis(self, url: str, page_hash: str, analysis: dict):
+        """Запомнить анализ для версии страницы page_hash."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE page_state SET analysis = ?, analysis_hash = ? WHERE url = ?",
+                (json.dumps(analysis, ensure_ascii=False), page_hash, url),
+            )
+
+
+page_state_store = PageStateStore()
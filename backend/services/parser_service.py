@@ -1,18 +1,38 @@
 """
-Сервис парсинга веб-страниц: HTTP + BeautifulSoup или Selenium (USE_SELENIUM=true).
+Сервис парсинга веб-страниц: HTTP + потоковый разбор lxml или Selenium (USE_SELENIUM=true).
 """
 import asyncio
 import time
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
 
 import httpx
 from bs4 import BeautifulSoup
 
 from backend.config import settings
+from backend.services.host_scheduler import host_scheduler
+from backend.services.html_extract import StreamingExtractor, extract_from_html
+from backend.services.metrics import metrics
+from backend.services.page_state import PageState, content_hash, page_state_store
+from backend.services.selenium_pool import selenium_pool
+from backend.services.singleflight import SingleFlight
+
+
+def normalize_url(url: str) -> str:
+    """Нормализация URL: схема по умолчанию https, регистр схемы/хоста, без #фрагмента."""
+    url = url.strip()
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
 
 
 def _extract_from_soup(soup: BeautifulSoup) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    """Извлечь title, h1, первый абзац из BeautifulSoup. Returns (title, h1, first_paragraph)."""
+    """
+    Извлечь title, h1, первый абзац из BeautifulSoup. Returns (title, h1, first_paragraph).
+    Эталонная семантика: html_extract повторяет её без построения полного DOM.
+    """
     title = None
     if soup.find("title"):
         title = soup.find("title").get_text(strip=True)
@@ -30,41 +50,91 @@ def _extract_from_soup(soup: BeautifulSoup) -> Tuple[Optional[str], Optional[str
     return title, h1, first_paragraph
 
 
+@dataclass
+class PageFetch:
+    """Результат загрузки страницы с признаками изменения."""
+    url: str
+    title: Optional[str] = None
+    h1: Optional[str] = None
+    first_paragraph: Optional[str] = None
+    error: Optional[str] = None
+    # Страница не изменилась с прошлой проверки (ответ 304 или тот же хеш title/h1/абзаца)
+    not_modified: bool = False
+    content_hash: Optional[str] = None
+    # Сервер ответил 429/503 — запрос можно повторить после паузы хоста
+    throttled: bool = False
+    # Анализ, сделанный для этой же версии страницы (если был) — повторно в LLM не отправляем
+    previous_analysis: Optional[dict] = None
+
+    def as_tuple(self) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
+        return self.title, self.h1, self.first_paragraph, self.error
+
+
 class ParserService:
     """Парсинг веб-страниц: title, h1, первый абзац. HTTP или Selenium по настройке."""
 
     def __init__(self):
         self.timeout = settings.parser_timeout
         self.user_agent = settings.parser_user_agent
+        self.change_detection = settings.parser_change_detection
+        # Одновременные запросы одного и того же URL скачиваются один раз
+        self.inflight = SingleFlight()
+        # Общий клиент на всё время работы приложения (создаётся в lifespan, см. start/aclose)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _new_client(self) -> httpx.AsyncClient:
+        """httpx-клиент с пулом соединений и HTTP/2 (если установлен пакет h2)."""
+        http2 = settings.parser_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            http2=http2,
+            headers={"User-Agent": self.user_agent},
+            limits=httpx.Limits(
+                max_connections=settings.parser_max_connections,
+                max_keepalive_connections=settings.parser_max_keepalive,
+                keepalive_expiry=settings.parser_keepalive_expiry,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Общий клиент. Если start() не вызывался (скрипты) — создаётся при первом обращении."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = self._new_client()
+            self._client_loop = loop
+        return self._client
 
-    def _parse_with_selenium(
+    async def start(self):
+        """Создать общий клиент (из lifespan приложения)."""
+        await self.aclose()
+        _ = self.client
+
+    async def aclose(self):
+        """Закрыть общий клиент и его соединения."""
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def _parse_with_selenium(
         self, url: str
     ) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
         """
-        Синхронный парсинг через Selenium (для страниц с JavaScript).
+        Парсинг через Selenium (для страниц с JavaScript) — браузер из пула selenium_pool.
         Returns: (title, h1, first_paragraph, error)
         """
         try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.chrome.service import Service
-            from webdriver_manager.chrome import ChromeDriverManager
-
-            opts = Options()
-            opts.add_argument("--headless=new")
-            opts.add_argument("--no-sandbox")
-            opts.add_argument("--disable-dev-shm-usage")
-            opts.add_argument(f"user-agent={self.user_agent}")
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=opts)
-            try:
-                driver.get(url)
-                time.sleep(settings.parser_selenium_wait)
-                html = driver.page_source
-            finally:
-                driver.quit()
-            soup = BeautifulSoup(html, "lxml")
-            title, h1, first_paragraph = _extract_from_soup(soup)
+            html = await selenium_pool.fetch_html(url)
+            metrics.inc("page_bytes_total", len(html))
+            with metrics.stage("extract"):
+                title, h1, first_paragraph = extract_from_html(html)
             return title, h1, first_paragraph, None
         except Exception as e:
             return None, None, None, f"Selenium: {str(e)}"
@@ -75,36 +145,151 @@ class ParserService:
         """
         Парсит URL, извлекает title, h1, первый абзац.
         При USE_SELENIUM=true использует Selenium (для страниц с JS).
+        Одновременные вызовы с одинаковым (нормализованным) URL разделяют один запрос.
         Returns: (title, h1, first_paragraph, error)
         """
-        if not url.startswith(("http://", "https://")):
-            url = "https://" + url
+        return (await self.fetch_page(url)).as_tuple()
+
+    async def fetch_page(self, url: str) -> PageFetch:
+        """
+        Как parse_url, но с признаками изменения: условный GET (If-None-Match/If-Modified-Since)
+        и сравнение хеша извлечённых полей с прошлой проверкой.
+        """
+        url = normalize_url(url)
+        return await self.inflight.do(url, lambda: self._polite_fetch(url))
 
+    async def _polite_fetch(self, url: str) -> PageFetch:
+        """
+        Загрузка через планировщик хостов: robots.txt, темп и очередь хоста; после 429/503
+        запрос повторяется (до PARSER_THROTTLE_RETRIES раз), когда пауза хоста закончится.
+        """
+        if not await host_scheduler.allowed(url, self.client):
+            return PageFetch(url=url, error="Страница закрыта для обхода в robots.txt")
+        for _ in range(max(0, settings.parser_throttle_retries) + 1):
+            async with host_scheduler.slot(url):
+                with metrics.stage("fetch"):
+                    fetch = await self._fetch_and_parse(url)
+            if not fetch.throttled:
+                break
+        metrics.inc("pages_fetched_total", result="error" if fetch.error else "not_modified" if fetch.not_modified else "ok")
+        return fetch
+
+    async def parse_many(self, urls: List[str]) -> AsyncIterator[PageFetch]:
+        """
+        Пакетный парсинг: все URL через общий httpx-клиент; параллельность, темп и очередь
+        каждого хоста — в host_scheduler. Результаты отдаются по мере готовности;
+        ошибка одного URL не мешает остальным.
+        """
+
+        async def one(url: str):
+            try:
+                return await self.fetch_page(url)
+            except Exception as e:
+                return PageFetch(url=url, error=f"Неизвестная ошибка: {str(e)}")
+
+        tasks = [asyncio.ensure_future(one(url)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_and_parse(self, url: str) -> PageFetch:
+        """Скачать и разобрать страницу (URL уже нормализован)."""
+        state = await asyncio.to_thread(page_state_store.get, url) if self.change_detection else None
         if settings.use_selenium:
-            return await asyncio.to_thread(self._parse_with_selenium, url)
+            title, h1, first_paragraph, error = await self._parse_with_selenium(url)
+            if error:
+                return PageFetch(url=url, error=error)
+            etag = last_modified = None
+        else:
+            try:
+                async with self.client.stream("GET", url, headers=self._conditional_headers(state)) as response:
+                    if response.status_code == 304 and state is not None:
+                        await asyncio.to_thread(page_state_store.touch, url)
+                        return self._page_fetch(
+                            url, state.title, state.h1, state.first_paragraph, state.content_hash, state
+                        )
+                    response.raise_for_status()
+                    title, h1, first_paragraph = await self._read_and_extract(response)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+            except httpx.TimeoutException:
+                return PageFetch(url=url, error="Превышено время ожидания запроса")
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status in (429, 503):
+                    host_scheduler.backoff(url, e.response.headers.get("Retry-After"))
+                    return PageFetch(url=url, error=f"HTTP ошибка: {status}", throttled=True)
+                return PageFetch(url=url, error=f"HTTP ошибка: {status}")
+            except httpx.RequestError as e:
+                return PageFetch(url=url, error=f"Ошибка запроса: {str(e)}")
+            except Exception as e:
+                return PageFetch(url=url, error=f"Неизвестная ошибка: {str(e)}")
 
+        page_hash = content_hash(title, h1, first_paragraph)
+        if self.change_detection:
+            await asyncio.to_thread(
+                page_state_store.save_fetch, url, etag, last_modified, title, h1, first_paragraph, page_hash
+            )
+        return self._page_fetch(url, title, h1, first_paragraph, page_hash, state)
+
+    @staticmethod
+    async def _read_and_extract(
+        response: httpx.Response,
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Читать тело кусками и разбирать на лету. Чтение прекращается, как только title, h1
+        и первый абзац найдены, или после PARSER_MAX_BYTES — остаток страницы не скачивается.
+        """
+        extractor = StreamingExtractor(response.charset_encoding)
+        # Разбор идёт вперемешку с чтением — время разбора (stage extract) суммируется по кускам
+        parsing = 0.0
         try:
-            async with httpx.AsyncClient(
-                timeout=self.timeout,
-                follow_redirects=True,
-            ) as client:
-                response = await client.get(
-                    url,
-                    headers={"User-Agent": self.user_agent},
-                )
-                response.raise_for_status()
-                html = response.text
-                soup = BeautifulSoup(html, "lxml")
-                title, h1, first_paragraph = _extract_from_soup(soup)
-                return title, h1, first_paragraph, None
-        except httpx.TimeoutException:
-            return None, None, None, "Превышено время ожидания запроса"
-        except httpx.HTTPStatusError as e:
-            return None, None, None, f"HTTP ошибка: {e.response.status_code}"
-        except httpx.RequestError as e:
-            return None, None, None, f"Ошибка запроса: {str(e)}"
-        except Exception as e:
-            return None, None, None, f"Неизвестная ошибка: {str(e)}"
+            async for chunk in response.aiter_bytes():
+                started = time.perf_counter()
+                done = extractor.feed(chunk)
+                parsing += time.perf_counter() - started
+                if done or extractor.bytes_read >= settings.parser_max_bytes:
+                    break
+            started = time.perf_counter()
+            result = extractor.finish()
+            parsing += time.perf_counter() - started
+            return result
+        finally:
+            metrics.record_stage("extract", parsing)
+            metrics.inc("page_bytes_total", extractor.bytes_read)
+
+    @staticmethod
+    def _conditional_headers(state: Optional[PageState]) -> dict:
+        """If-None-Match / If-Modified-Since — только если от прошлой проверки сохранены извлечённые поля."""
+        headers = {}
+        if state is not None and state.content_hash:
+            if state.etag:
+                headers["If-None-Match"] = state.etag
+            if state.last_modified:
+                headers["If-Modified-Since"] = state.last_modified
+        return headers
 
+    @staticmethod
+    def _page_fetch(
+        url: str,
+        title: Optional[str],
+        h1: Optional[str],
+        first_paragraph: Optional[str],
+        page_hash: Optional[str],
+        state: Optional[PageState],
+    ) -> PageFetch:
+        """PageFetch с признаком «не изменилась» и прошлым анализом этой же версии страницы."""
+        return PageFetch(
+            url=url,
+            title=title,
+            h1=h1,
+            first_paragraph=first_paragraph,
+            not_modified=state is not None and state.content_hash == page_hash,
+            content_hash=page_hash,
+            previous_analysis=state.analysis if state is not None and state.analysis_hash == page_hash else None,
+        )
 
 parser_service = ParserService()
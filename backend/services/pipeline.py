@@ -0,0 +1,199 @@
+"""
+Конвейер «парсинг → анализ → история» для одного URL и для пакета URL; «анализ → история» для текста.
+"""
+import asyncio
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from backend.models.schemas import CompetitorAnalysis, ParsedContent
+from backend.services import llm_usage
+from backend.services.history_service import history_service
+from backend.services.openai_service import openai_service
+from backend.services.page_state import page_state_store
+from backend.services.parser_service import PageFetch, normalize_url, parser_service
+
+
+async def _record(content: ParsedContent, usage: Optional[llm_usage.LLMUsage] = None):
+    """
+    Записать результат парсинга в историю (в потоке — запись в SQLite блокирующая).
+    usage — вызовы LLM для этой страницы (details["llm_usage"]).
+    """
+    details = content.model_dump()
+    if usage is not None:
+        details["llm_usage"] = usage.as_dict()
+    await asyncio.to_thread(
+        history_service.add_entry,
+        request_type="parse",
+        request_summary=f"URL: {content.url}",
+        response_summary=content.title or (f"Ошибка: {content.error}" if content.error else "N/A"),
+        details=details,
+    )
+
+
+async def record_text(text: str, analysis: CompetitorAnalysis, usage: llm_usage.LLMUsage):
+    """Записать анализ текста в историю."""
+    await asyncio.to_thread(
+        history_service.add_entry,
+        request_type="text",
+        request_summary=text[:100] + "..." if len(text) > 100 else text,
+        response_summary=analysis.summary,
+        details={"analysis": analysis.model_dump(), "llm_usage": usage.as_dict()},
+    )
+
+
+async def analyze_and_record_text(text: str, bypass_cache: bool = False) -> CompetitorAnalysis:
+    """Анализ текста и запись в историю."""
+    with llm_usage.track() as usage:
+        analysis = await openai_service.analyze_text_async(text, bypass_cache=bypass_cache)
+    await record_text(text, analysis, usage)
+    return analysis
+
+
+async def _analyze(
+    url: str,
+    fetch: PageFetch,
+    bypass_cache: bool,
+    record_errors: bool,
+    batched: bool = False,
+) -> ParsedContent:
+    """
+    Анализ уже скачанной страницы и запись в историю. Если страница не изменилась
+    и для этой версии уже есть анализ — LLM не вызывается, возвращается прошлый анализ.
+    batched — страница может уйти в LLM в одном запросе с другими (пакетный парсинг, мониторинг).
+    """
+    if fetch.error:
+        content = ParsedContent(url=url, error=fetch.error)
+        if record_errors:
+            await _record(content)
+        return content
+    if fetch.previous_analysis is not None and not bypass_cache:
+        return await _finish(url, fetch, CompetitorAnalysis(**fetch.previous_analysis), fresh=False)
+    analyze = openai_service.analyze_parsed_content_batched if batched else openai_service.analyze_parsed_content_async
+    with llm_usage.track() as usage:
+        analysis = await analyze(title=fetch.title, h1=fetch.h1, paragraph=fetch.first_paragraph, bypass_cache=bypass_cache)
+    return await _finish(url, fetch, analysis, fresh=True, usage=usage)
+
+
+async def _finish(
+    url: str,
+    fetch: PageFetch,
+    analysis: CompetitorAnalysis,
+    fresh: bool,
+    usage: Optional[llm_usage.LLMUsage] = None,
+) -> ParsedContent:
+    """Запомнить новый анализ для этой версии страницы и записать результат в историю."""
+    if fresh and fetch.content_hash and parser_service.change_detection:
+        await asyncio.to_thread(page_state_store.save_analysis, fetch.url, fetch.content_hash, analysis.model_dump())
+    content = ParsedContent(
+        url=url,
+        title=fetch.title,
+        h1=fetch.h1,
+        first_paragraph=fetch.first_paragraph,
+        analysis=analysis,
+        not_modified=fetch.not_modified,
+    )
+    if usage is None:
+        # Прошлый анализ неизменившейся страницы — LLM не вызывался
+        usage = llm_usage.LLMUsage(response_cache=True)
+    await _record(content, usage)
+    return content
+
+
+async def parse_and_analyze(url: str, bypass_cache: bool = False) -> ParsedContent:
+    """Один URL: парсинг, анализ, история. Ошибка парсинга — в поле error (в историю не пишется)."""
+    fetch = await parser_service.fetch_page(url)
+    return await _analyze(url, fetch, bypass_cache, record_errors=False)
+
+
+async def parse_and_analyze_stream(url: str, bypass_cache: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Один URL с потоковой выдачей: page — извлечённые title/h1/абзац сразу после загрузки,
+    затем события анализа (delta/item/field), в конце result — ParsedContent (уже записан в историю).
+    Ошибка парсинга — событие error.
+    """
+    fetch = await parser_service.fetch_page(url)
+    if fetch.error:
+        yield "error", {"error": fetch.error}
+        return
+    yield "page", {
+        "url": url,
+        "title": fetch.title,
+        "h1": fetch.h1,
+        "first_paragraph": fetch.first_paragraph,
+        "not_modified": fetch.not_modified,
+    }
+    if fetch.previous_analysis is not None and not bypass_cache:
+        content = await _finish(url, fetch, CompetitorAnalysis(**fetch.previous_analysis), fresh=False)
+    else:
+        analysis = None
+        with llm_usage.track() as usage:
+            async for event, data in openai_service.analyze_parsed_content_stream(
+                title=fetch.title, h1=fetch.h1, paragraph=fetch.first_paragraph, bypass_cache=bypass_cache
+            ):
+                if event == "result":
+                    analysis = data["analysis"]
+                else:
+                    yield event, data
+        content = await _finish(url, fetch, analysis, fresh=True, usage=usage)
+    yield "result", {"data": content.model_dump()}
+
+
+async def analyze_fetched(fetch: PageFetch, bypass_cache: bool = False) -> ParsedContent:
+    """Анализ страницы, уже скачанной через ParserService.fetch_page (мониторинг), и запись в историю."""
+    return await _analyze(fetch.url, fetch, bypass_cache, record_errors=False, batched=True)
+
+
+async def parse_and_analyze_many(
+    urls: List[str],
+    bypass_cache: bool = False,
+    defer_error: Optional[Callable[[Exception], bool]] = None,
+) -> AsyncIterator[ParsedContent]:
+    """
+    Пакет URL: страницы качаются параллельно (ParserService.parse_many), каждая анализируется
+    сразу после загрузки (короткие страницы — по несколько в одном запросе к LLM, см. LLM_BATCH_SIZE).
+    Результаты (в т.ч. ошибки) отдаются по мере готовности и пишутся в историю.
+    defer_error(e) → True: такой URL не отдаётся и не пишется в историю, а первая такая ошибка
+    поднимается после всех остальных URL (фоновая задача повторит эти URL позже).
+    """
+    unique = list(dict.fromkeys(normalize_url(u) for u in urls if u.strip()))
+    results: asyncio.Queue = asyncio.Queue()
+    # Задачи анализа: при обрыве клиента отменяются вместе с загрузкой, а не дорабатывают впустую
+    analyses: List[asyncio.Future] = []
+
+    async def finish(fetch: PageFetch):
+        content = ParsedContent(url=fetch.url, error="Анализ не выполнен")
+        try:
+            content = await _analyze(fetch.url, fetch, bypass_cache, record_errors=True, batched=True)
+        except Exception as e:
+            if defer_error is not None and defer_error(e):
+                content = e
+                return
+            content = ParsedContent(
+                url=fetch.url, title=fetch.title, h1=fetch.h1, first_paragraph=fetch.first_paragraph, error=str(e)
+            )
+            try:
+                await _record(content)
+            except Exception:
+                pass
+        finally:
+            await results.put(content)
+
+    async def produce():
+        async for fetch in parser_service.parse_many(unique):
+            analyses.append(asyncio.ensure_future(finish(fetch)))
+        await asyncio.gather(*analyses)
+
+    producer = asyncio.ensure_future(produce())
+    deferred: Optional[Exception] = None
+    try:
+        for _ in range(len(unique)):
+            content = await results.get()
+            if isinstance(content, Exception):
+                deferred = deferred or content
+                continue
+            yield content
+    finally:
+        for task in (producer, *analyses):
+            task.cancel()
+        await asyncio.gather(producer, *analyses, return_exceptions=True)
+    if deferred is not None:
+        raise deferred
@@ -0,0 +1,172 @@
+"""
+Промпты анализа — неизменяемые шаблоны, собранные один раз при импорте. Системный промпт и начало
+сообщения пользователя у одного вида запроса всегда побайтно одинаковы и идут первыми, переменная
+часть (текст, страница, картинка) — в конце: так срабатывает кэш префикса у провайдера
+(DeepSeek context caching, OpenAI prompt caching).
+
+Бюджет ответа (max_tokens) считается по схеме ответа: сколько полей, сколько пунктов в списках
+и примерно сколько токенов на пункт — вместо общего лимита 2000 на всё.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Type, Union
+
+from pydantic import BaseModel
+
+from backend.models.schemas import CompetitorAnalysis, ImageAnalysis
+
+# Оценка токенов без токенизатора: кириллица у DeepSeek/OpenAI ≈ 2.5 символа на токен, латиница и цифры ≈ 4
+_CYRILLIC_RE = re.compile(r"[А-Яа-яЁё]")
+# Пункт списка в ответе (одно-два предложения) и развёрнутое текстовое поле, токенов
+TOKENS_PER_ITEM = 45
+TOKENS_PER_TEXT = 160
+# Запас на разметку JSON, имена полей и расхождение оценки с реальным токенизатором
+BUDGET_MARGIN = 1.25
+# Меньше этого max_tokens не ставим, даже если контекст почти заполнен
+MIN_OUTPUT_TOKENS = 256
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов текста (для бюджета, а не для счёта — счёт берётся из usage ответа)."""
+    cyrillic = len(_CYRILLIC_RE.findall(text))
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+
+def schema_budget(model_cls: Type[BaseModel], max_items: int, filled_lists: int = 0) -> int:
+    """
+    max_tokens под ответ по схеме: filled_lists списков (0 — все) по max_items пунктов,
+    все строковые поля, числа; плюс BUDGET_MARGIN.
+    """
+    lists = texts = numbers = 0
+    for info in model_cls.model_fields.values():
+        annotation = str(info.annotation)
+        if "List" in annotation or "list" in annotation:
+            lists += 1
+        elif info.annotation is int:
+            numbers += 1
+        else:
+            texts += 1
+    if filled_lists:
+        lists = min(lists, filled_lists)
+    tokens = lists * max_items * TOKENS_PER_ITEM + texts * TOKENS_PER_TEXT + numbers * 4
+    tokens += 6 * len(model_cls.model_fields)  # имена полей и разметка
+    return int(tokens * BUDGET_MARGIN)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Системный промпт, постоянное начало сообщения пользователя и бюджет ответа."""
+    system: str
+    user_prefix: str
+    max_tokens: int
+    system_tokens: int = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "system_tokens", estimate_tokens(self.system) + estimate_tokens(self.user_prefix))
+
+    def messages(self, payload: Union[str, list]) -> list:
+        """[system, user]: строка — после user_prefix; список частей (картинка) — после текстовой части с user_prefix."""
+        if isinstance(payload, str):
+            user = self.user_prefix + payload
+        else:
+            user = [{"type": "text", "text": self.user_prefix}, *payload]
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": user},
+        ]
+
+    def prompt_tokens(self, payload: Union[str, list]) -> int:
+        """Оценка токенов запроса (картинка не считается — её учитывает провайдер отдельно)."""
+        return self.system_tokens + (estimate_tokens(payload) if isinstance(payload, str) else 0)
+
+
+TEXT_SYSTEM_PROMPT = """Ты — эксперт по юриспруденции и конкурентному анализу юридического рынка. Проанализируй текст (описание услуг, лендинг юрфирмы, реклама) и верни структурированный JSON-ответ.
+
+Формат ответа (строго JSON):
+{
+    "strengths": ["сильная сторона 1", "сильная сторона 2", ...],
+    "weaknesses": ["слабая сторона 1", "слабая сторона 2", ...],
+    "unique_offers": ["уникальное предложение 1", ...],
+    "recommendations": ["рекомендация 1", "рекомендация 2", ...],
+    "summary": "Краткое резюме анализа"
+}
+
+Важно:
+- Каждый массив 3-5 пунктов, пиши на русском
+- Оценивай с точки зрения клиента и подачи юридических услуг: понятность, доверие, риски формулировок"""
+
+IMAGE_SYSTEM_PROMPT = """Ты — эксперт по визуальному маркетингу и дизайну в сфере юриспруденции. Проанализируй изображение (лендинг, баннер, сайт юрфирмы) и верни структурированный JSON-ответ.
+
+Формат ответа (строго JSON):
+{
+    "description": "Детальное описание того, что изображено",
+    "marketing_insights": ["инсайт 1", "инсайт 2", ...],
+    "visual_style_score": 7,
+    "visual_style_analysis": "Анализ визуального стиля: насколько серьёзно и доверительно выглядит",
+    "recommendations": ["рекомендация 1", "рекомендация 2", ...]
+}
+
+Важно:
+- visual_style_score от 0 до 10 (в т.ч. впечатление «доверия» для юридической темы)
+- Каждый массив 3-5 пунктов, пиши на русском
+- Оценивай: подачу для юруслуг, читаемость, цвет, типографику"""
+
+PARSED_SYSTEM_PROMPT = """Ты — эксперт по юриспруденции. По контенту страницы (заголовки, абзац) определи тип страницы и заполни JSON.
+
+Если это новости, обновления законодательства, анонсы (например КонсультантПлюс, правовые порталы):
+- Заполни: news_highlights (что нового, ключевые изменения), attention_points (на что обратить внимание юристу), key_topics (ключевые темы/рубрики), summary (краткое резюме).
+- Массивы strengths, weaknesses, unique_offers, recommendations оставь пустыми [].
+
+Если это описание юридических услуг, лендинг юрфирмы, реклама:
+- Заполни: strengths, weaknesses, unique_offers, recommendations, summary.
+- Массивы news_highlights, attention_points, key_topics оставь пустыми [].
+
+Формат ответа (строго JSON):
+{
+    "strengths": [],
+    "weaknesses": [],
+    "unique_offers": [],
+    "recommendations": [],
+    "summary": "Краткое резюме",
+    "news_highlights": [],
+    "attention_points": [],
+    "key_topics": []
+}
+
+Заполняй только те массивы, которые подходят под тип страницы. summary заполняй всегда. Пиши на русском, 3-7 пунктов в каждом непустом массиве."""
+
+# Пакетный режим: на входе JSON-массив страниц, на выходе — массив анализов с теми же id
+PARSED_BATCH_SUFFIX = """
+
+На входе несколько страниц — JSON-массив объектов {"id": "...", "content": "..."}. Каждую страницу анализируй отдельно.
+Верни строго JSON-объект с полем "items" — массивом: по одному объекту на каждую страницу, с полем "id" (как на входе) и полями формата выше:
+{"items": [{"id": "0", "strengths": [], ..., "key_topics": []}, ...]}"""
+
+# Повторный запрос, если в ответе не нашлось JSON даже после починки
+JSON_RETRY_PROMPT = "Ответ не удалось разобрать как JSON. Верни только JSON строго по формату из инструкции, без пояснений."
+
+TEXT_PROMPT = PromptTemplate(
+    system=TEXT_SYSTEM_PROMPT,
+    user_prefix="Проанализируй текст (юридическая сфера):\n\n",
+    # 4 списка по 3-5 пунктов и summary (поля новостей в анализе текста не заполняются)
+    max_tokens=schema_budget(CompetitorAnalysis, max_items=5, filled_lists=4),
+)
+
+IMAGE_PROMPT = PromptTemplate(
+    system=IMAGE_SYSTEM_PROMPT,
+    user_prefix="Проанализируй это изображение (юридическая тема: лендинг, баннер, сайт) с точки зрения маркетинга и доверия:",
+    max_tokens=schema_budget(ImageAnalysis, max_items=5),
+)
+
+PARSED_PROMPT = PromptTemplate(
+    system=PARSED_SYSTEM_PROMPT,
+    user_prefix="Проанализируй контент страницы:\n\n",
+    # Страница — либо новости (3 списка), либо услуги (4 списка), по 3-7 пунктов
+    max_tokens=schema_budget(CompetitorAnalysis, max_items=7, filled_lists=4),
+)
+
+PARSED_BATCH_PROMPT = PromptTemplate(
+    system=PARSED_SYSTEM_PROMPT + PARSED_BATCH_SUFFIX,
+    user_prefix="Проанализируй каждую страницу из списка:\n\n",
+    max_tokens=PARSED_PROMPT.max_tokens,  # на одну страницу пакета
+)
@@ -0,0 +1,180 @@
+"""
+Пул headless Chrome для режима USE_SELENIUM: браузеры живут между запросами, путь к драйверу
+определяется один раз, число одновременно открытых браузеров ограничено.
+"""
+import asyncio
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from backend.config import settings
+
+# Страница «готова», когда есть h1 и абзац длиннее 50 символов в main/article (или body) —
+# примерно то же условие, по которому html_extract выбирает первый абзац
+_READY_JS = """
+const scope = document.querySelector('main, article') || document.body;
+if (!document.querySelector('h1') || !scope) return false;
+for (const p of scope.querySelectorAll('p')) {
+    if (p.textContent.replace(/\\s+/g, '').length > 50) return true;
+}
+return false;
+"""
+
+
+@dataclass
+class _Worker:
+    """Браузер из пула и число страниц, открытых в нём."""
+    driver: Any
+    pages: int = 0
+
+
+class SeleniumPool:
+    """Ограниченный пул долгоживущих Chrome-драйверов. Браузер пересоздаётся после N страниц или ошибки."""
+
+    def __init__(self):
+        self.size = max(1, settings.parser_selenium_pool_size)
+        self.max_pages = max(1, settings.parser_selenium_max_pages)
+        self._driver_path: Optional[str] = None
+        self._idle: "queue.SimpleQueue[_Worker]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Слоты пула: браузер занимает поток только после получения слота (см. fetch_html)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._launched = 0
+        self._recycled = 0
+        self._alive = 0
+        self._busy = 0
+
+    def _resolve_driver_path(self) -> str:
+        """Путь к chromedriver — скачивается/ищется webdriver-manager'ом один раз за жизнь процесса."""
+        with self._lock:
+            if self._driver_path is None:
+                from webdriver_manager.chrome import ChromeDriverManager
+
+                self._driver_path = ChromeDriverManager().install()
+            return self._driver_path
+
+    def _launch(self) -> Any:
+        """Запустить новый headless Chrome."""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        opts = Options()
+        opts.add_argument("--headless=new")
+        opts.add_argument("--no-sandbox")
+        opts.add_argument("--disable-dev-shm-usage")
+        opts.add_argument(f"user-agent={settings.parser_user_agent}")
+        # driver.get возвращается после DOMContentLoaded — дальше ждём готовности контента сами
+        opts.page_load_strategy = "eager"
+        driver = webdriver.Chrome(service=Service(self._resolve_driver_path()), options=opts)
+        driver.set_page_load_timeout(settings.parser_timeout)
+        with self._lock:
+            self._launched += 1
+            self._alive += 1
+        return driver
+
+    def _quit(self, worker: _Worker):
+        try:
+            worker.driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._alive -= 1
+
+    def start(self):
+        """Определить путь к драйверу и прогреть пул (из lifespan, в потоке — запуск Chrome блокирующий)."""
+        self._closed = False
+        self._resolve_driver_path()
+        for _ in range(self.size - self._idle.qsize()):
+            self._idle.put(_Worker(self._launch()))
+
+    def close(self):
+        """Закрыть простаивающие браузеры; занятые закроются при возврате в пул."""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(worker)
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _Worker(self._launch())
+
+    def _release(self, worker: _Worker, healthy: bool):
+        """Вернуть браузер в пул или закрыть: после ошибки, после max_pages страниц, при остановке."""
+        if healthy and not self._closed and worker.pages < self.max_pages:
+            self._idle.put(worker)
+            return
+        if healthy and worker.pages >= self.max_pages:
+            with self._lock:
+                self._recycled += 1
+        self._quit(worker)
+
+    def _wait_ready(self, driver: Any):
+        """Дождаться h1 и подходящего абзаца, но не дольше PARSER_SELENIUM_WAIT секунд."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        try:
+            WebDriverWait(driver, settings.parser_selenium_wait, poll_frequency=0.2).until(
+                lambda d: d.execute_script(_READY_JS)
+            )
+        except TimeoutException:
+            # Нет h1/абзаца — берём то, что успело отрисоваться
+            pass
+
+    def _fetch_sync(self, url: str) -> str:
+        """Открыть URL в свободном браузере пула и вернуть HTML после готовности страницы."""
+        worker = self._acquire()
+        healthy = False
+        try:
+            worker.pages += 1
+            worker.driver.get(url)
+            self._wait_ready(worker.driver)
+            html = worker.driver.page_source
+            healthy = True
+            return html
+        finally:
+            self._release(worker, healthy)
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.size)
+            self._slots_loop = loop
+        return self._slots
+
+    async def fetch_html(self, url: str) -> str:
+        """HTML страницы после выполнения JS. Не больше size браузеров одновременно."""
+        async with self.slots:
+            with self._lock:
+                self._busy += 1
+            try:
+                return await asyncio.to_thread(self._fetch_sync, url)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def stats(self) -> dict:
+        """Для /health: размер пула, живые/занятые браузеры, запуски и плановые пересоздания."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "alive": self._alive,
+                "busy": self._busy,
+                "idle": self._idle.qsize(),
+                "launched": self._launched,
+                "recycled": self._recycled,
+                "max_pages": self.max_pages,
+            }
+
+
+selenium_pool = SeleniumPool()
@@ -0,0 +1,42 @@
+"""
+Single-flight: одинаковые одновременные вызовы выполняются один раз, остальные ждут общий результат.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов по ключу (URL, хеш текста или изображения)."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Убрать завершённую задачу; исключение помечаем полученным (его уже увидели ожидающие)."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнить fn() или присоединиться к уже идущему вызову с тем же ключом.
+        Ошибка fn() пробрасывается всем ожидающим. Отмена одного ожидающего не отменяет общий вызов.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Счётчики: всего вызовов, сколько получили общий результат, сколько выполняется сейчас."""
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._inflight)}
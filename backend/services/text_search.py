@@ -0,0 +1,137 @@
+"""
+Токенизация для полнотекстового поиска по истории: русский стеммер (Snowball/Портер) + латиница как есть.
+"""
+import re
+from typing import Iterable, List
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+_VOWELS = "аеиоуыэюя"
+
+
+def _longest_first(endings):
+    """Окончания по убыванию длины — чтобы отрезалось самое длинное."""
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND_1 = _longest_first(("вшись", "вши", "в"))  # после а/я
+_PERFECTIVE_GERUND_2 = _longest_first(("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"))
+_REFLEXIVE = _longest_first(("ся", "сь"))
+_ADJECTIVE = _longest_first((
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+    "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+))
+_PARTICIPLE_1 = _longest_first(("ем", "нн", "вш", "ющ", "щ"))  # после а/я
+_PARTICIPLE_2 = _longest_first(("ивш", "ывш", "ующ"))
+_VERB_1 = _longest_first(("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н"))  # после а/я
+_VERB_2 = _longest_first((
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют",
+    "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+))
+_NOUN = _longest_first((
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой",
+    "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у",
+    "ы", "ь", "ю", "я",
+))
+_SUPERLATIVE = _longest_first(("ейше", "ейш"))
+_DERIVATIONAL = _longest_first(("ость", "ост"))
+
+
+def _regions(word: str):
+    """Начала областей RV и R2 (по правилам Snowball для русского)."""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    r1 = len(word)
+    for i in range(1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            r1 = i + 1
+            break
+    r2 = len(word)
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word: str, start: int, endings, after_a: bool = False):
+    """Отрезать самое длинное окончание из endings (отсортированы по длине) в области [start:]. None — не нашлось."""
+    region = word[start:]
+    for ending in endings:
+        if region.endswith(ending):
+            cut = len(word) - len(ending)
+            if after_a:
+                if cut - 1 < start or word[cut - 1] not in "ая":
+                    continue
+            return word[:cut]
+    return None
+
+
+def stem_ru(word: str) -> str:
+    """Основа русского слова (Snowball Russian, упрощённо). Нерусские слова возвращаются как есть."""
+    word = word.lower().replace("ё", "е")
+    if len(word) < 3 or not re.search("[а-я]", word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие; иначе возвратность + прилагательное/причастие, глагол, существительное
+    res = _strip(word, rv, _PERFECTIVE_GERUND_1, after_a=True) or _strip(word, rv, _PERFECTIVE_GERUND_2)
+    if res is not None:
+        word = res
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        res = _strip(word, rv, _ADJECTIVE)
+        if res is not None:
+            word = _strip(res, rv, _PARTICIPLE_1, after_a=True) or _strip(res, rv, _PARTICIPLE_2) or res
+        else:
+            res = _strip(word, rv, _VERB_1, after_a=True) or _strip(word, rv, _VERB_2)
+            if res is None:
+                res = _strip(word, rv, _NOUN)
+            if res is not None:
+                word = res
+
+    # Шаг 2: и
+    if word[rv:].endswith("и"):
+        word = word[:-1]
+    # Шаг 3: словообразовательные окончания в R2
+    word = _strip(word, r2, _DERIVATIONAL) or word
+    # Шаг 4: нн → н, превосходная степень, ь
+    if word[rv:].endswith("нн"):
+        word = word[:-1]
+    else:
+        res = _strip(word, rv, _SUPERLATIVE)
+        if res is not None:
+            word = res
+            if word[rv:].endswith("нн"):
+                word = word[:-1]
+        elif word[rv:].endswith("ь"):
+            word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста → основы (нижний регистр, ё → е)."""
+    return [stem_ru(t) for t in _TOKEN_RE.findall(text or "")]
+
+
+def collect_strings(value) -> Iterable[str]:
+    """Все строки из вложенных dict/list (поля анализа в details)."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from collect_strings(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from collect_strings(v)
+
+
+def fts_query(query: str) -> str:
+    """Запрос пользователя → выражение FTS5: все основы обязательны, последняя — как префикс."""
+    terms = tokenize(query)
+    if not terms:
+        return ""
+    parts = [f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*']
+    return " AND ".join(parts)
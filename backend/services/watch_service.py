@@ -0,0 +1,307 @@
+"""
+Мониторинг конкурентов: список отслеживаемых URL (SQLite) и фоновый планировщик проверок.
+Каждый URL проверяется со своим интервалом (с разбросом); в LLM и в историю попадают только изменившиеся страницы.
+"""
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, List, Optional, Set
+
+from backend.config import settings
+from backend.models.schemas import WatchItem
+from backend.services.parser_service import parser_service
+from backend.services.pipeline import analyze_fetched
+
+# Окно, за которое считается пропускная способность (проверок в минуту)
+THROUGHPUT_WINDOW = 300.0
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+class WatchStore:
+    """Список отслеживаемых URL и результат последней проверки (SQLite в data/)."""
+
+    def __init__(self):
+        self.db_path: Path = settings.watch_db_path
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS watch (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    interval_minutes INTEGER NOT NULL,
+                    enabled INTEGER NOT NULL DEFAULT 1,
+                    created_at TEXT NOT NULL,
+                    next_check REAL NOT NULL,
+                    last_checked REAL,
+                    last_status TEXT,
+                    last_error TEXT,
+                    last_changed REAL,
+                    checks INTEGER NOT NULL DEFAULT 0,
+                    changes INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_watch_due ON watch(enabled, next_check)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение для текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> WatchItem:
+        return WatchItem(
+            id=row["id"],
+            url=row["url"],
+            interval_minutes=row["interval_minutes"],
+            enabled=bool(row["enabled"]),
+            created_at=row["created_at"],
+            next_check=_iso(row["next_check"]) if row["enabled"] else None,
+            last_checked=_iso(row["last_checked"]),
+            last_status=row["last_status"],
+            last_error=row["last_error"],
+            last_changed=_iso(row["last_changed"]),
+            checks=row["checks"],
+            changes=row["changes"],
+        )
+
+    def list(self) -> List[WatchItem]:
+        rows = self._conn().execute("SELECT * FROM watch ORDER BY created_at").fetchall()
+        return [self._row_to_item(r) for r in rows]
+
+    def get(self, watch_id: str) -> Optional[WatchItem]:
+        row = self._conn().execute("SELECT * FROM watch WHERE id = ?", (watch_id,)).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def add(self, url: str, interval_minutes: int) -> Optional[WatchItem]:
+        """Добавить URL (первая проверка — сразу). None, если URL уже отслеживается."""
+        watch_id = str(uuid.uuid4())
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO watch (id, url, interval_minutes, created_at, next_check) VALUES (?, ?, ?, ?, ?)",
+                    (watch_id, url, interval_minutes, datetime.now().isoformat(timespec="seconds"), time.time()),
+                )
+        except sqlite3.IntegrityError:
+            return None
+        return self.get(watch_id)
+
+    def update(
+        self, watch_id: str, interval_minutes: Optional[int] = None, enabled: Optional[bool] = None
+    ) -> Optional[WatchItem]:
+        """
+        Изменить интервал и/или включённость. Новый интервал отсчитывается от текущего момента
+        (если так выходит раньше), включённый URL проверяется сразу.
+        """
+        now = time.time()
+        sets, params = [], []
+        if interval_minutes is not None:
+            sets.append("interval_minutes = ?, next_check = MIN(next_check, ?)")
+            params += [interval_minutes, now + interval_minutes * 60]
+        if enabled is not None:
+            sets.append("enabled = ?")
+            params.append(int(enabled))
+            if enabled:
+                sets.append("next_check = ?")
+                params.append(now)
+        if sets:
+            with self._conn() as conn:
+                conn.execute(f"UPDATE watch SET {', '.join(sets)} WHERE id = ?", (*params, watch_id))
+        return self.get(watch_id)
+
+    def delete(self, watch_id: str) -> bool:
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM watch WHERE id = ?", (watch_id,)).rowcount > 0
+
+    def check_now(self, watch_id: str) -> Optional[WatchItem]:
+        """Поставить проверку в начало очереди."""
+        with self._conn() as conn:
+            conn.execute("UPDATE watch SET next_check = ? WHERE id = ?", (time.time(), watch_id))
+        return self.get(watch_id)
+
+    def due(self, now: float, limit: int) -> List[sqlite3.Row]:
+        """Просроченные проверки, самые давние первыми."""
+        return self._conn().execute(
+            "SELECT id, url, interval_minutes, next_check, checks FROM watch"
+            " WHERE enabled = 1 AND next_check <= ? ORDER BY next_check LIMIT ?",
+            (now, limit),
+        ).fetchall()
+
+    def next_due(self) -> Optional[float]:
+        row = self._conn().execute("SELECT MIN(next_check) FROM watch WHERE enabled = 1").fetchone()
+        return row[0]
+
+    def reschedule(self, watch_id: str, next_check: float):
+        with self._conn() as conn:
+            conn.execute("UPDATE watch SET next_check = ? WHERE id = ?", (next_check, watch_id))
+
+    def record(self, watch_id: str, status: str, error: Optional[str], checked_at: float):
+        """Результат проверки: changed / unchanged / error."""
+        changed = status == "changed"
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE watch SET last_checked = ?, last_status = ?, last_error = ?, checks = checks + 1,"
+                " changes = changes + ?, last_changed = CASE WHEN ? THEN ? ELSE last_changed END WHERE id = ?",
+                (checked_at, status, error, int(changed), int(changed), checked_at, watch_id),
+            )
+
+    def demand_per_minute(self) -> float:
+        """Сколько проверок в минуту требует текущий список (сумма 1/интервал)."""
+        row = self._conn().execute("SELECT SUM(1.0 / interval_minutes) FROM watch WHERE enabled = 1").fetchone()
+        return row[0] or 0.0
+
+
+class WatchMonitor:
+    """
+    Фоновый планировщик (запускается в lifespan). Берёт просроченные URL, не больше
+    WATCH_CONCURRENCY одновременно, и переносит следующую проверку на интервал ± WATCH_JITTER.
+    """
+
+    def __init__(self, store: WatchStore):
+        self.store = store
+        self.concurrency = max(1, settings.watch_concurrency)
+        self.jitter = min(max(0.0, settings.watch_jitter), 0.5)
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Метрики: задержка старта относительно плана и завершённые проверки за окно
+        self._finished: Deque[float] = deque()
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+        self._lag_avg = 0.0
+        self._started = 0
+        self._checks = 0
+        self._changes = 0
+        self._errors = 0
+
+    def _next_interval(self, interval_minutes: int) -> float:
+        """Интервал в секундах со случайным разбросом — чтобы проверки не собирались в пачки."""
+        return interval_minutes * 60 * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить планировщик и незавершённые проверки."""
+        tasks = [t for t in (self._task, *self._tasks) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._tasks.clear()
+        self._running.clear()
+
+    def wake(self):
+        """Список изменился — пересчитать ближайшую проверку."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self._launch_due()
+                next_due = await asyncio.to_thread(self.store.next_due)
+            except Exception:
+                # Ошибка БД не должна останавливать мониторинг — повторим на следующем такте
+                next_due = None
+            timeout = settings.watch_tick
+            if next_due is not None and len(self._running) < self.concurrency:
+                timeout = min(timeout, max(0.0, next_due - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _launch_due(self):
+        """Запустить просроченные проверки на свободные места и сразу назначить им следующую."""
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return
+        now = time.time()
+        for row in await asyncio.to_thread(self.store.due, now, free + len(self._running)):
+            if row["id"] in self._running or len(self._running) >= self.concurrency:
+                continue
+            await asyncio.to_thread(self.store.reschedule, row["id"], now + self._next_interval(row["interval_minutes"]))
+            self._note_lag(now - row["next_check"])
+            self._running.add(row["id"])
+            task = asyncio.create_task(self._check(row["id"], row["url"], first=row["checks"] == 0))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _note_lag(self, lag: float):
+        lag = max(0.0, lag)
+        self._lag_last = lag
+        self._lag_max = max(self._lag_max, lag)
+        self._lag_avg = lag if not self._started else 0.9 * self._lag_avg + 0.1 * lag
+        self._started += 1
+
+    async def _check(self, watch_id: str, url: str, first: bool):
+        """Одна проверка: загрузка, и только если страница изменилась (или проверка первая) — анализ и история."""
+        status, error = "unchanged", None
+        try:
+            fetch = await parser_service.fetch_page(url)
+            if fetch.error:
+                status, error = "error", fetch.error
+            elif not fetch.not_modified or fetch.previous_analysis is None or first:
+                content = await analyze_fetched(fetch)
+                status, error = ("error", content.error) if content.error else ("changed", None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, error = "error", str(e)
+        finally:
+            self._running.discard(watch_id)
+            self.wake()
+        now = time.time()
+        await asyncio.to_thread(self.store.record, watch_id, status, error, now)
+        self._checks += 1
+        self._changes += status == "changed"
+        self._errors += status == "error"
+        self._finished.append(now)
+        while self._finished and self._finished[0] < now - THROUGHPUT_WINDOW:
+            self._finished.popleft()
+
+    async def stats(self) -> dict:
+        """
+        Для /health: отставание старта проверок от плана (сек) и пропускная способность.
+        demand_per_min > throughput_per_min или растущий lag — интервалы слишком короткие для мощности.
+        """
+        now = time.time()
+        recent = sum(1 for t in self._finished if t >= now - THROUGHPUT_WINDOW)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "active_checks": len(self._running),
+            "concurrency": self.concurrency,
+            "checks": self._checks,
+            "changes": self._changes,
+            "errors": self._errors,
+            "lag_last": round(self._lag_last, 1),
+            "lag_avg": round(self._lag_avg, 1),
+            "lag_max": round(self._lag_max, 1),
+            "throughput_per_min": round(recent * 60 / THROUGHPUT_WINDOW, 2),
+            "demand_per_min": round(await asyncio.to_thread(self.store.demand_per_minute), 2),
+        }
+
+
+watch_store = WatchStore()
+watch_monitor = WatchMonitor(watch_store)
@@ -0,0 +1,3 @@
+"""
+Нагрузочные тесты и бенчмарки без внешних API: поддельный LLM, поддельные сайты конкурентов, драйвер нагрузки.
+"""
@@ -0,0 +1,187 @@
+"""
+Поддельный OpenAI-совместимый сервер (POST /v1/chat/completions, в т.ч. stream=True) для бенчмарков.
+Приложение направляется на него через OPENAI_BASE_URL / DEEPSEEK_BASE_URL.
+
+Настройки (переменные окружения):
+    FAKE_LLM_LATENCY          — задержка до первого токена, сек (по умолчанию 0.3)
+    FAKE_LLM_TOKENS_PER_SEC   — скорость генерации ответа, токенов/сек (0 — мгновенно; по умолчанию 200)
+    FAKE_LLM_ERROR_RATE       — доля запросов, завершающихся ошибкой (0..1, по умолчанию 0)
+    FAKE_LLM_ERROR_STATUS     — HTTP-статус такой ошибки (по умолчанию 500; 429 — имитация лимита)
+
+Кэш префикса имитируется как у DeepSeek: если системный промпт уже приходил, его токены
+возвращаются в usage.prompt_cache_hit_tokens. При stream_options.include_usage последний кусок
+потока несёт usage.
+
+Запуск: python -m uvicorn benchmarks.fake_llm:app --port 9100
+"""
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.3"))
+TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "200"))
+ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.getenv("FAKE_LLM_ERROR_STATUS", "500"))
+
+# Ответ на анализ текста/страницы: все поля CompetitorAnalysis (лишние приложение игнорирует)
+ANALYSIS = {
+    "strengths": [
+        "Понятное описание услуг по корпоративному праву",
+        "Указаны сроки и стоимость первичной консультации",
+        "Есть кейсы с результатами в арбитражных судах",
+    ],
+    "weaknesses": [
+        "Нет отзывов клиентов с подтверждением",
+        "Не раскрыт состав команды и опыт юристов",
+        "Сложные формулировки без пояснений для клиента",
+    ],
+    "unique_offers": ["Фиксированная цена сопровождения сделки", "Онлайн-консультация в течение часа"],
+    "recommendations": [
+        "Добавить отзывы и ссылки на решения судов",
+        "Разместить профили ведущих юристов",
+        "Упростить текст оффера на первом экране",
+    ],
+    "summary": "Лендинг юрфирмы с сильным оффером по цене и срокам, но слабыми доказательствами экспертизы.",
+    "news_highlights": [],
+    "attention_points": [],
+    "key_topics": ["корпоративное право", "арбитраж"],
+}
+
+IMAGE_ANALYSIS = {
+    "description": "Баннер юридической фирмы: заголовок с оффером, фото офиса, кнопка записи на консультацию.",
+    "marketing_insights": [
+        "Оффер читается за 2-3 секунды",
+        "Синяя гамма создаёт ощущение надёжности",
+        "Кнопка действия контрастна фону",
+    ],
+    "visual_style_score": 7,
+    "visual_style_analysis": "Сдержанный деловой стиль, уместный для юруслуг; перегружен мелким текстом внизу.",
+    "recommendations": ["Убрать мелкий текст", "Добавить логотип крупнее", "Показать лицо юриста"],
+}
+
+app = FastAPI(title="Fake LLM")
+STATS = {"requests": 0, "errors": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+# Системные промпты, уже приходившие (кэш префикса)
+_SEEN_PREFIXES: set = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка: ~4 символа на токен (для русского текста модели считают иначе, но для нагрузки хватает)."""
+    return max(1, len(text) // 4)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content
+
+
+def _reply(messages: list, json_mode: bool) -> str:
+    """
+    Текст ответа под тип запроса: изображение, пакет страниц (анализы по id) или одиночный анализ.
+    В JSON-режиме (response_format json_object) — голый JSON-объект, иначе — в блоке ```json.
+    """
+    system = _message_text(messages[0]) if messages else ""
+    last = messages[-1].get("content") if messages else ""
+    data = ANALYSIS
+    if isinstance(last, list) or "visual_style_score" in system:
+        data = IMAGE_ANALYSIS
+    elif isinstance(last, str) and "\n\n" in last:
+        try:
+            items = json.loads(last.split("\n\n", 1)[1])
+        except ValueError:
+            items = None
+        if isinstance(items, list) and all(isinstance(i, dict) and "id" in i for i in items):
+            data = {"items": [dict(ANALYSIS, id=i["id"]) for i in items]}
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text if json_mode else "```json\n" + text + "\n```"
+
+
+def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": cached_tokens,
+        "prompt_cache_miss_tokens": prompt_tokens - cached_tokens,
+    }
+
+
+def _cached_tokens(messages: list) -> int:
+    """Токены системного промпта, если он уже приходил (иначе запоминаем его)."""
+    if not messages or messages[0].get("role") != "system":
+        return 0
+    system = _message_text(messages[0])
+    if system in _SEEN_PREFIXES:
+        return estimate_tokens(system)
+    _SEEN_PREFIXES.add(system)
+    return 0
+
+
+@app.get("/stats")
+async def stats():
+    """Сколько запросов обработано (для проверки, что нагрузка дошла до LLM)."""
+    return STATS
+
+
+@app.post("/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    STATS["requests"] += 1
+    await asyncio.sleep(LATENCY)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        STATS["errors"] += 1
+        return JSONResponse(
+            {"error": {"message": "injected error", "type": "server_error"}}, status_code=ERROR_STATUS
+        )
+
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+    text = _reply(messages, json_mode)
+    prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+    completion_tokens = estimate_tokens(text)
+    cached_tokens = _cached_tokens(messages)
+    STATS["prompt_tokens"] += prompt_tokens
+    STATS["cached_tokens"] += cached_tokens
+    STATS["completion_tokens"] += completion_tokens
+    model = body.get("model", "fake")
+    created = int(time.time())
+
+    if body.get("stream"):
+        async def chunks():
+            step = 16  # символов на кусок ≈ 4 токена
+            for i in range(0, len(text), step):
+                if TOKENS_PER_SEC:
+                    await asyncio.sleep(estimate_tokens(text[i:i + step]) / TOKENS_PER_SEC)
+                chunk = {
+                    "id": "fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": _usage(prompt_tokens, completion_tokens, cached_tokens),
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    if TOKENS_PER_SEC:
+        await asyncio.sleep(completion_tokens / TOKENS_PER_SEC)
+    return {
+        "id": "fake",
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": _usage(prompt_tokens, completion_tokens, cached_tokens),
+    }
@@ -0,0 +1,87 @@
+"""
+Поддельные сайты конкурентов для бенчмарков: синтетические HTML-страницы правового портала от 10 КБ до 5 МБ.
+
+    GET /page/{kb}.html              — страница размером ~kb КБ
+    GET /page/{kb}.html?layout=head  — контент (h1, абзац) в начале страницы: парсер может остановиться рано
+    GET /page/{kb}.html?layout=tail  — контент в конце, после меню и блоков новостей (по умолчанию, худший случай)
+
+Любые другие параметры запроса (например, ?n=17) игнорируются — ими делают URL уникальными,
+чтобы одинаковые одновременные загрузки не объединялись.
+
+Запуск: python -m uvicorn benchmarks.fake_sites:app --port 9200
+"""
+import random
+from functools import lru_cache
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+
+MIN_KB, MAX_KB = 1, 5 * 1024
+
+WORDS = (
+    "постановление пленума верховного суда разъяснение налоговый кодекс статья пункт арбитражный "
+    "суд договор поставки неустойка ответственность сторон закон изменения вступают в силу "
+    "федеральный юридическое лицо индивидуальный предприниматель трудовой споры практика "
+    "консультация обзор комментарий законодательства министерство письмо разъясняет порядок"
+).split()
+
+app = FastAPI(title="Fake competitor sites")
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def _block(rng: random.Random) -> str:
+    """Кусок «шума»: меню, карточки новостей, скрипты — то, что парсер должен пропустить."""
+    kind = rng.randrange(3)
+    if kind == 0:
+        links = "".join(f'<li><a href="/doc/{rng.randrange(10**6)}">{_sentence(rng)}</a></li>' for _ in range(8))
+        return f"<nav><ul>{links}</ul></nav>\n"
+    if kind == 1:
+        return (
+            f'<div class="news-card"><span class="date">{rng.randrange(1, 29)}.0{rng.randrange(1, 10)}.2024</span>'
+            f"<h3>{_sentence(rng)}</h3><p>{_sentence(rng)} {_sentence(rng)}</p></div>\n"
+        )
+    payload = ",".join(str(rng.randrange(10**6)) for _ in range(40))
+    return f"<script>window.__data = [{payload}];</script>\n"
+
+
+@lru_cache(maxsize=64)
+def render_page(kb: int, layout: str) -> bytes:
+    """Детерминированная страница ~kb КБ (одинаковая от запуска к запуску)."""
+    rng = random.Random(kb * 31 + len(layout))
+    title = f"Обзор изменений законодательства — выпуск {kb}"
+    main = (
+        "<main><article>"
+        f"<h1>Что изменилось в налоговом и корпоративном праве: выпуск {kb}</h1>"
+        f"<p>{_sentence(rng)} {_sentence(rng)} {_sentence(rng)}</p>"
+        f"<p>{_sentence(rng)} {_sentence(rng)}</p>"
+        "</article></main>\n"
+    )
+    head = f'<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8"><title>{title}</title></head><body>\n'
+    tail = "</body></html>\n"
+    target = kb * 1024
+    filler = []
+    size = len((head + main + tail).encode("utf-8"))
+    while size < target:
+        block = _block(rng)
+        filler.append(block)
+        size += len(block.encode("utf-8"))
+    body = main + "".join(filler) if layout == "head" else "".join(filler) + main
+    return (head + body + tail).encode("utf-8")
+
+
+@app.get("/page/{kb}.html")
+async def page(kb: int, layout: str = "tail"):
+    if not MIN_KB <= kb <= MAX_KB:
+        raise HTTPException(status_code=404)
+    if layout not in ("head", "tail"):
+        raise HTTPException(status_code=400, detail="layout: head или tail")
+    return Response(render_page(kb, layout), media_type="text/html; charset=utf-8")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
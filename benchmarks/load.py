@@ -0,0 +1,442 @@
+"""
+Нагрузочный прогон без внешних API: поднимает поддельный LLM (fake_llm), поддельные сайты (fake_sites)
+и само приложение (uvicorn) отдельными процессами, гоняет сценарии на нескольких уровнях
+параллельности и сохраняет результат в benchmarks/results/<время>.json.
+
+    python -m benchmarks.load                                # все сценарии, параллельность 1, 8, 32
+    python -m benchmarks.load --scenarios parse_demo --concurrency 4,16 --requests 100
+    python -m benchmarks.load --llm-latency 1.0 --llm-error-rate 0.05 --compare
+    python -m benchmarks.load --env LLM_MAX_CONCURRENCY=32 --label llm32
+
+Сценарии:
+    analyze_text   — POST /analyze_text (уникальный текст, без кэша)
+    parse_demo     — POST /parse_demo по страницам 10 КБ … 5 МБ (уникальный URL, без кэша)
+    analyze_image  — POST /analyze_image (сгенерированная картинка 1600×1200, без кэша)
+    history        — GET /history?limit=50
+
+Для каждой пары (сценарий, параллельность): p50/p95/p99 и среднее время ответа, запросов в секунду,
+ошибки (статус не 2xx или success=false), память процесса приложения (RSS: в начале, пик, в конце)
+и среднее время этапов из заголовка Server-Timing.
+
+Весь LLM-трафик идёт в поддельный сервер как в провайдера OpenAI (OPENAI_BASE_URL); ключ DeepSeek
+пустой, чтобы маршрутизатор не ушёл на настоящий api.deepseek.com. История, состояние страниц и
+расписание — во временной папке, наблюдение за страницами отключено.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SCENARIOS = ("analyze_text", "parse_demo", "analyze_image", "history")
+PAGE_SIZES_KB = (10, 100, 1024, 5 * 1024)
+
+TEXT = (
+    "Юридическая фирма «Право и Дело» оказывает услуги по корпоративному праву, сопровождению сделок M&A "
+    "и арбитражным спорам. Первичная консультация — бесплатно, договор за один день, фиксированная цена "
+    "сопровождения. Более 300 выигранных дел в арбитражных судах, средний срок — 4 месяца. "
+)
+
+
+# --- процессы ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(module: str, port: int, env: dict, log_path: Path) -> subprocess.Popen:
+    """uvicorn в отдельном процессе; вывод — в файл (смотреть при ошибке запуска)."""
+    log = open(log_path, "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Процесс для {url} завершился с кодом {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} не ответил за {timeout:g} с")
+
+
+def stop(proc: subprocess.Popen):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Резидентная память процесса, МБ: psutil, если установлен, иначе /proc (Linux); иначе None."""
+    try:
+        import psutil
+
+        return round(psutil.Process(pid).memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+# --- нагрузка ---
+
+def make_image() -> bytes:
+    """Картинка 1600×1200 с градиентом и шумом (PNG): реалистичная работа для уменьшения и пересжатия."""
+    from PIL import Image, ImageDraw
+
+    image = Image.radial_gradient("L").resize((1600, 1200)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 1600, 40):
+        draw.rectangle([i, (i * 7) % 1100, i + 30, (i * 7) % 1100 + 90], fill=(i % 256, 80, 200))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for part in header.split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        try:
+            stages[name] = float(rest)
+        except ValueError:
+            continue
+    return stages
+
+
+class Scenario:
+    """Один вид запроса: build(i) — аргументы httpx для i-го запроса."""
+
+    def __init__(self, name: str, sites_url: str, image: Optional[bytes]):
+        self.name = name
+        self.sites_url = sites_url
+        self.image = image
+
+    def build(self, i: int) -> dict:
+        if self.name == "analyze_text":
+            return {"method": "POST", "url": "/analyze_text",
+                    "json": {"text": f"{TEXT}Запрос №{i}.", "bypass_cache": True}}
+        if self.name == "parse_demo":
+            kb = PAGE_SIZES_KB[i % len(PAGE_SIZES_KB)]
+            return {"method": "POST", "url": "/parse_demo",
+                    "json": {"url": f"{self.sites_url}/page/{kb}.html?n={i}", "bypass_cache": True}}
+        if self.name == "analyze_image":
+            return {"method": "POST", "url": "/analyze_image",
+                    "files": {"file": ("banner.png", self.image, "image/png")},
+                    "data": {"bypass_cache": "true"}}
+        return {"method": "GET", "url": "/history", "params": {"limit": 50}}
+
+
+async def run_level(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, requests: int, pid: int, offset: int
+) -> dict:
+    """Замкнутая нагрузка: concurrency воркеров, каждый шлёт следующий запрос сразу после ответа."""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    stages: Dict[str, List[float]] = {}
+    counter = iter(range(requests))
+    rss = [rss_mb(pid)]
+    done = asyncio.Event()
+
+    async def sample_memory():
+        while not done.is_set():
+            rss.append(rss_mb(pid))
+            await asyncio.sleep(0.2)
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            error = None
+            try:
+                response = await client.request(**scenario.build(offset + i))
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}"
+                elif response.headers.get("content-type", "").startswith("application/json"):
+                    body = response.json()
+                    if isinstance(body, dict) and body.get("success") is False:
+                        error = (body.get("error") or "success=false")[:80]
+                for name, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stages.setdefault(name, []).append(ms)
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+    rss.append(rss_mb(pid))
+
+    ordered = sorted(latencies)
+    known_rss = [v for v in rss if v is not None]
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": _round(percentile(ordered, 50)),
+            "p95": _round(percentile(ordered, 95)),
+            "p99": _round(percentile(ordered, 99)),
+            "mean": _round(sum(ordered) / len(ordered)) if ordered else None,
+            "max": _round(ordered[-1]) if ordered else None,
+        },
+        "rss_mb": {
+            "start": rss[0],
+            "peak": max(known_rss) if known_rss else None,
+            "end": rss[-1],
+        },
+        "stages_ms": {name: _round(sum(v) / len(v)) for name, v in sorted(stages.items())},
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+# --- отчёт ---
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "backend"))}
+
+
+def print_table(results: List[dict]):
+    print(f"{'сценарий':<14} {'паралл.':>7} {'запр.':>6} {'ошиб.':>6} {'rps':>8} "
+          f"{'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'RSS пик':>8}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['scenario']:<14} {r['concurrency']:>7} {r['requests']:>6} {r['errors']:>6} {r['rps'] or 0:>8.1f} "
+              f"{lat['p50'] or 0:>9.1f} {lat['p95'] or 0:>9.1f} {lat['p99'] or 0:>9.1f} "
+              f"{r['rss_mb']['peak'] or 0:>8.1f}")
+
+
+def previous_result(current: Path) -> Optional[Path]:
+    files = sorted(p for p in RESULTS_DIR.glob("[0-9]*.json") if p != current)
+    return files[-1] if files else None
+
+
+def print_comparison(results: List[dict], baseline_path: Path):
+    """Изменение p50/p95/rps относительно прошлого прогона по совпадающим (сценарий, параллельность)."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    before = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+
+    def delta(new, old) -> str:
+        if new is None or not old:
+            return "—"
+        return f"{(new - old) / old * 100:+.0f}%"
+
+    print(f"\nСравнение с {baseline_path.name} ({baseline.get('meta', {}).get('git', {}).get('commit')}):")
+    print(f"{'сценарий':<14} {'паралл.':>7} {'p50':>14} {'p95':>14} {'rps':>14}")
+    for r in results:
+        old = before.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        p50, p95 = r["latency_ms"]["p50"], r["latency_ms"]["p95"]
+        print(f"{r['scenario']:<14} {r['concurrency']:>7} "
+              f"{delta(p50, old['latency_ms']['p50']):>14} {delta(p95, old['latency_ms']['p95']):>14} "
+              f"{delta(r['rps'], old['rps']):>14}")
+
+
+# --- запуск ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон с поддельным LLM и сайтами")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="через запятую: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="уровни параллельности через запятую")
+    parser.add_argument("--requests", type=int, default=64, help="запросов на каждый уровень")
+    parser.add_argument("--warmup", type=int, default=4, help="прогревочных запросов перед сценарием")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="задержка поддельного LLM, сек")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=200, help="скорость генерации, 0 — мгновенно")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="доля ошибок LLM (0..1)")
+    parser.add_argument("--llm-error-status", type=int, default=500, help="статус ошибки LLM (500 или 429)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="настройка приложения (можно несколько раз), например LLM_MAX_CONCURRENCY=32")
+    parser.add_argument("--label", default="", help="метка прогона (в имени файла результата)")
+    parser.add_argument("--compare", nargs="?", const="", default=None, metavar="FILE",
+                        help="сравнить с прошлым прогоном (или с указанным файлом)")
+    parser.add_argument("--no-save", action="store_true", help="не сохранять результат")
+    return parser.parse_args(argv)
+
+
+async def run_all(args, app_url: str, sites_url: str, pid: int) -> List[dict]:
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    image = make_image() if "analyze_image" in names else None
+
+    results = []
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    async with httpx.AsyncClient(base_url=app_url, timeout=300.0, limits=limits) as client:
+        offset = 0
+        for name in names:
+            scenario = Scenario(name, sites_url, image)
+            if args.warmup:
+                await run_level(client, scenario, 1, args.warmup, pid, offset)
+                offset += args.warmup
+            for level in levels:
+                result = await run_level(client, scenario, level, args.requests, pid, offset)
+                offset += args.requests
+                results.append(result)
+                print(f"  {name} ×{level}: {result['rps']} rps, p95 {result['latency_ms']['p95']} мс, "
+                      f"ошибок {result['errors']}", flush=True)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = Path(tempfile.mkdtemp(prefix="competitor-bench-"))
+    llm_port, sites_port, app_port = free_port(), free_port(), free_port()
+    llm_url, sites_url, app_url = (f"http://127.0.0.1:{p}" for p in (llm_port, sites_port, app_port))
+
+    base_env = dict(os.environ, PYTHONPATH=str(ROOT))
+    llm_env = dict(
+        base_env,
+        FAKE_LLM_LATENCY=str(args.llm_latency),
+        FAKE_LLM_TOKENS_PER_SEC=str(args.llm_tokens_per_sec),
+        FAKE_LLM_ERROR_RATE=str(args.llm_error_rate),
+        FAKE_LLM_ERROR_STATUS=str(args.llm_error_status),
+    )
+    app_env = dict(
+        base_env,
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=f"{llm_url}/v1",
+        DEEPSEEK_API_KEY="",
+        HISTORY_DB_FILE=str(workdir / "history.db"),
+        PAGE_STATE_FILE=str(workdir / "page_state.db"),
+        WATCH_DB_FILE=str(workdir / "watch.db"),
+        JOB_DB_FILE=str(workdir / "jobs.db"),
+        LLM_CACHE_DIR=str(workdir / "llm_cache"),
+        WATCH_ENABLED="false",
+        USE_SELENIUM="false",
+        PARSER_RESPECT_ROBOTS="false",
+        PARSER_HOST_RATE="100000",
+        PARSER_HOST_BURST="100000",
+        PARSER_PER_HOST_CONCURRENCY="1000",
+    )
+    overrides = {}
+    for item in args.env:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--env ожидает KEY=VALUE, получено: {item}")
+        overrides[key] = value
+    app_env.update(overrides)
+
+    procs = []
+    try:
+        procs.append(start_server("benchmarks.fake_llm:app", llm_port, llm_env, workdir / "fake_llm.log"))
+        procs.append(start_server("benchmarks.fake_sites:app", sites_port, base_env, workdir / "fake_sites.log"))
+        app = start_server("backend.main:app", app_port, app_env, workdir / "app.log")
+        procs.append(app)
+        wait_ready(f"{llm_url}/stats", procs[0])
+        wait_ready(f"{sites_url}/health", procs[1])
+        wait_ready(f"{app_url}/health", app)
+        print(f"Приложение {app_url}, LLM {llm_url}, сайты {sites_url}, логи в {workdir}", flush=True)
+
+        results = asyncio.run(run_all(args, app_url, sites_url, app.pid))
+        llm_stats = httpx.get(f"{llm_url}/stats", timeout=5).json()
+    finally:
+        for proc in reversed(procs):
+            stop(proc)
+
+    print()
+    print_table(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "label": args.label,
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "llm_latency": args.llm_latency,
+                "llm_tokens_per_sec": args.llm_tokens_per_sec,
+                "llm_error_rate": args.llm_error_rate,
+                "llm_error_status": args.llm_error_status,
+                "env": overrides,
+            },
+            "fake_llm": llm_stats,
+        },
+        "results": results,
+    }
+
+    saved = None
+    if not args.no_save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        saved = RESULTS_DIR / (f"{stamp}-{args.label}.json" if args.label else f"{stamp}.json")
+        saved.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nРезультат: {saved}")
+
+    if args.compare is not None:
+        baseline = Path(args.compare) if args.compare else previous_result(saved)
+        if baseline is None or not baseline.exists():
+            print("\nНет прошлого прогона для сравнения")
+        else:
+            print_comparison(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
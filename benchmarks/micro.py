@@ -0,0 +1,326 @@
+"""
+Микробенчмарки CPU-горячих мест без сети: извлечение title/h1/абзаца из больших страниц
+(потоковый lxml и эталонный BeautifulSoup), разбор JSON из ответа модели, запись и чтение истории.
+
+    python -m benchmarks.micro                          # всё; результат в benchmarks/results/micro-<время>.json
+    python -m benchmarks.micro -k extract --quick       # только извлечение, меньше повторов и размеров
+    python -m benchmarks.micro --json -                 # JSON в stdout (для CI)
+    python -m benchmarks.micro --compare --threshold 0.25   # сравнить с прошлым прогоном, код 1 при замедлении
+
+Замер — как в pytest-benchmark: число вызовов в раунде подбирается так, чтобы раунд длился
+не меньше --min-time; раундов --rounds; в отчёте min/median/mean/stddev на один вызов.
+Регрессия — медиана выросла больше чем на threshold относительно базового файла.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from benchmarks.fake_sites import render_page
+from benchmarks.load import RESULTS_DIR, git_revision
+
+PAGE_SIZES_KB = (10, 100, 1024, 5 * 1024)
+QUICK_PAGE_SIZES_KB = (10, 1024)
+HISTORY_SIZES = (10, 1000, 10000)
+QUICK_HISTORY_SIZES = (10, 1000)
+CHUNK = 64 * 1024
+
+
+class Bench:
+    """Один бенчмарк: setup() готовит данные (не замеряется) и возвращает вызываемый без аргументов объект."""
+
+    def __init__(self, group: str, name: str, setup: Callable[[], Callable[[], object]], **params):
+        self.group = group
+        self.name = f"{group}[{name}]"
+        self.setup = setup
+        self.params = params
+
+
+def measure(fn: Callable[[], object], rounds: int, min_time: float) -> dict:
+    """Подобрать число вызовов на раунд (не меньше min_time), затем rounds раундов; время — на один вызов."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or iterations >= 1 << 20:
+            break
+        iterations *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        samples.append((time.perf_counter() - started) / iterations)
+    median = statistics.median(samples)
+    return {
+        "min": min(samples),
+        "max": max(samples),
+        "mean": statistics.fmean(samples),
+        "median": median,
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": rounds,
+        "iterations": iterations,
+        "ops": 1 / median if median else None,
+    }
+
+
+# --- фикстуры ---
+
+def model_reply(fenced: bool = True, truncated: bool = False) -> str:
+    """Ответ модели на ~2000 токенов: развёрнутый анализ страницы, в ```json или с пояснениями вокруг."""
+    point = "Подробное наблюдение о подаче юридических услуг и доверии клиента, с примером формулировки «{}»"
+    data = {
+        key: [point.format(f"{key} {i}") for i in range(12)]
+        for key in ("strengths", "weaknesses", "unique_offers", "recommendations", "news_highlights")
+    }
+    data["summary"] = " ".join(point.format(i) for i in range(6))
+    data["key_topics"] = ["налоговое право", "арбитраж", "корпоративные споры", "банкротство"]
+    body = json.dumps(data, ensure_ascii=False, indent=2)
+    if truncated:
+        body = body[: len(body) * 9 // 10]
+    if fenced:
+        return f"Вот результат анализа страницы:\n\n```json\n{body}\n```\n\nЕсли нужно, уточню отдельные пункты."
+    return f"Результат анализа {{по запросу}}: {body}\nПримечание: оценки субъективны {{см. выше}}."
+
+
+def batch_reply(items: int = 5) -> str:
+    analysis = json.loads(model_reply().split("```json\n", 1)[1].split("\n```", 1)[0])
+    return "```json\n" + json.dumps([dict(analysis, id=f"p{i}") for i in range(items)], ensure_ascii=False) + "\n```"
+
+
+def history_details(i: int) -> dict:
+    """details записи истории, как у парсинга страницы: ParsedContent с анализом."""
+    return {
+        "url": f"https://law-portal.example/news/{i}",
+        "title": f"Обзор изменений законодательства — выпуск {i}",
+        "h1": "Что изменилось в налоговом и корпоративном праве",
+        "first_paragraph": "Постановление пленума верховного суда разъясняет порядок применения неустойки. " * 4,
+        "analysis": json.loads(model_reply().split("```json\n", 1)[1].split("\n```", 1)[0]),
+    }
+
+
+def history_service_with(entries: int, workdir: Path):
+    """
+    HistoryService на отдельной базе с entries записями. Заполняется одной транзакцией
+    (строки и полнотекстовый индекс готовятся один раз): через add_entry 10k записей шли бы минуты.
+    """
+    from backend.config import settings
+    from backend.services.history_service import HistoryService
+    from backend.services.text_search import collect_strings, tokenize
+
+    settings.history_db_file = str(workdir / f"history-{entries}.db")
+    settings.history_file = str(workdir / "history.json")
+    settings.max_history_items = max(settings.max_history_items, entries * 2)
+    service = HistoryService()
+    service.compact_every = 1 << 30  # уплотнение в фоне исказило бы замер
+    details = history_details(0)
+    dumped = HistoryService._dump_details(details)
+    summary = " ".join(tokenize("https://law-portal.example/news Анализ страницы"))
+    body = " ".join(tokenize(" ".join(collect_strings(details))))
+    rows = [
+        (str(uuid.uuid4()), f"2024-01-01T00:00:{i % 60:02d}.{i:06d}", "parse",
+         f"https://law-portal.example/news/{i}", "Анализ страницы", dumped)
+        for i in range(entries)
+    ]
+    with service._conn() as conn:
+        conn.executemany(
+            "INSERT INTO history (id, timestamp, request_type, request_summary, response_summary, details)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        if service.search_enabled:
+            conn.execute(
+                "INSERT INTO history_fts (rowid, summary, body) SELECT seq, ?, ? FROM history", (summary, body)
+            )
+    return service
+
+
+# --- набор ---
+
+def build_benches(quick: bool, workdir: Path) -> List[Bench]:
+    from bs4 import BeautifulSoup
+
+    from backend.services.history_service import HistoryService
+    from backend.services.html_extract import StreamingExtractor
+    from backend.services.openai_service import openai_service
+    from backend.services.parser_service import _extract_from_soup
+
+    benches: List[Bench] = []
+    sizes = QUICK_PAGE_SIZES_KB if quick else PAGE_SIZES_KB
+    for kb in sizes:
+        for layout in ("head", "tail"):
+            def setup(kb=kb, layout=layout):
+                page = render_page(kb, layout)
+                chunks = [page[i:i + CHUNK] for i in range(0, len(page), CHUNK)]
+
+                def run():
+                    extractor = StreamingExtractor()
+                    for chunk in chunks:
+                        if extractor.feed(chunk):
+                            break
+                    return extractor.finish()
+
+                return run
+
+            benches.append(Bench("extract_stream", f"{kb}kb-{layout}", setup, kb=kb, layout=layout))
+        if kb <= 1024:
+            def setup(kb=kb):
+                html = render_page(kb, "tail").decode("utf-8")
+                return lambda: _extract_from_soup(BeautifulSoup(html, "lxml"))
+
+            benches.append(Bench("extract_soup", f"{kb}kb-tail", setup, kb=kb, layout="tail"))
+
+    replies = {
+        "fenced": model_reply(),
+        "prose": model_reply(fenced=False),
+        "truncated": model_reply(truncated=True),
+    }
+    for name, reply in replies.items():
+        benches.append(Bench(
+            "parse_json_response", name,
+            lambda reply=reply: (lambda: openai_service._parse_json_response(reply)),
+            chars=len(reply),
+        ))
+    batch = batch_reply()
+    benches.append(Bench(
+        "parse_json_array", "batch-5", lambda: (lambda: openai_service._parse_json_array(batch)), chars=len(batch)
+    ))
+
+    details = history_details(0)
+    benches.append(Bench("history_dump_details", "parse", lambda: (lambda: HistoryService._dump_details(details))))
+    services = {}
+
+    def history(entries: int):
+        if entries not in services:
+            services[entries] = history_service_with(entries, workdir)
+        return services[entries]
+
+    for entries in QUICK_HISTORY_SIZES if quick else HISTORY_SIZES:
+        def setup_page(entries=entries):
+            service = history(entries)
+            return lambda: service.get_page(limit=50)
+
+        def setup_add(entries=entries):
+            service = history(entries)
+            return lambda: service.add_entry("parse", "https://law-portal.example/new", "Анализ", details)
+
+        # Сначала чтение: add_entry дописывает записи в ту же базу
+        benches.append(Bench("history_get_page", f"{entries}", setup_page, entries=entries))
+        benches.append(Bench("history_add_entry", f"{entries}", setup_add, entries=entries))
+    return benches
+
+
+# --- отчёт и сравнение ---
+
+def previous_result(current: Optional[Path]) -> Optional[Path]:
+    files = sorted(p for p in RESULTS_DIR.glob("micro-*.json") if p != current)
+    return files[-1] if files else None
+
+
+def compare(results: List[dict], baseline_path: Path, threshold: float) -> List[dict]:
+    """Строки сравнения медиан; regression=True, если медиана выросла больше чем на threshold."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    before = {b["name"]: b for b in baseline.get("benchmarks", [])}
+    rows = []
+    for bench in results:
+        old = before.get(bench["name"])
+        if old is None:
+            continue
+        change = bench["stats"]["median"] / old["stats"]["median"] - 1
+        rows.append({"name": bench["name"], "change": round(change, 4), "regression": change > threshold})
+    return rows
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки CPU-горячих мест")
+    parser.add_argument("-k", dest="keyword", default="", help="только бенчмарки, в имени которых есть подстрока")
+    parser.add_argument("--quick", action="store_true", help="меньше размеров и повторов")
+    parser.add_argument("--rounds", type=int, default=None, help="раундов на бенчмарк (по умолчанию 7, --quick — 3)")
+    parser.add_argument("--min-time", type=float, default=None, help="минимум секунд на раунд (0.1, --quick — 0.02)")
+    parser.add_argument("--json", dest="json_path", default=None, metavar="PATH",
+                        help="куда записать JSON (- — stdout); по умолчанию benchmarks/results/micro-<время>.json")
+    parser.add_argument("--compare", nargs="?", const="", default=None, metavar="FILE",
+                        help="сравнить с прошлым прогоном (или с указанным файлом)")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="допустимый рост медианы при --compare (0.25 = +25%%); больше — код выхода 1")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    rounds = args.rounds or (3 if args.quick else 7)
+    min_time = args.min_time if args.min_time is not None else (0.02 if args.quick else 0.1)
+    to_stdout = args.json_path == "-"
+    log = sys.stderr if to_stdout else sys.stdout
+
+    workdir = Path(tempfile.mkdtemp(prefix="competitor-micro-"))
+    # Синглтоны сервисов создаются при импорте — их базы тоже во временной папке, не в проекте
+    os.environ["HISTORY_DB_FILE"] = str(workdir / "history.db")
+    os.environ["PAGE_STATE_FILE"] = str(workdir / "page_state.db")
+    os.environ["WATCH_DB_FILE"] = str(workdir / "watch.db")
+    os.environ["JOB_DB_FILE"] = str(workdir / "jobs.db")
+    results = []
+    for bench in build_benches(args.quick, workdir):
+        if args.keyword and args.keyword not in bench.name:
+            continue
+        stats = measure(bench.setup(), rounds, min_time)
+        results.append({"name": bench.name, "group": bench.group, "params": bench.params, "stats": stats})
+        print(f"{bench.name:<42} median {_ms(stats['median']):>10} мс   min {_ms(stats['min']):>10} мс   "
+              f"×{stats['iterations']}", file=log, flush=True)
+
+    report = {
+        "machine_info": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "commit_info": git_revision(),
+        "datetime": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "options": {"quick": args.quick, "rounds": rounds, "min_time": min_time, "keyword": args.keyword},
+        "benchmarks": results,
+    }
+
+    saved = None
+    if to_stdout:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        if args.json_path:
+            saved = Path(args.json_path)
+        else:
+            RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+            saved = RESULTS_DIR / f"micro-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+        saved.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nРезультат: {saved}", file=log)
+
+    if args.compare is None:
+        return 0
+    baseline = Path(args.compare) if args.compare else previous_result(saved)
+    if baseline is None or not baseline.exists():
+        print("Нет прошлого прогона для сравнения", file=log)
+        return 0
+    rows = compare(results, baseline, args.threshold)
+    print(f"\nСравнение медиан с {baseline.name} (порог +{args.threshold:.0%}):", file=log)
+    for row in rows:
+        mark = "  РЕГРЕССИЯ" if row["regression"] else ""
+        print(f"{row['name']:<42} {row['change']:+8.1%}{mark}", file=log)
+    regressions = [row for row in rows if row["regression"]]
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
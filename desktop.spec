@@ -24,8 +24,13 @@ hidden = [
     'uvicorn.lifespan', 'uvicorn.lifespan.on',
     'backend', 'backend.main', 'backend.config', 'backend.models', 'backend.models.schemas',
     'backend.services', 'backend.services.openai_service', 'backend.services.parser_service', 'backend.services.history_service',
+    'backend.services.llm_clients', 'backend.services.llm_router', 'backend.services.cache_service',
+    'backend.services.singleflight', 'backend.services.batcher', 'backend.services.text_search',
+    'backend.services.pipeline', 'backend.services.page_state', 'backend.services.html_extract',
+    'backend.services.selenium_pool', 'backend.services.host_scheduler',
+    'backend.services.watch_service', 'backend.services.job_service', 'backend.services.json_stream', 'backend.services.json_extract', 'backend.services.prompts', 'backend.services.llm_usage', 'backend.services.image_service', 'backend.services.metrics',
     'fastapi', 'starlette', 'starlette.routing', 'starlette.responses', 'starlette.staticfiles',
-    'pydantic', 'openai', 'httpx', 'bs4', 'dotenv', 'python_dotenv',
+    'pydantic', 'openai', 'httpx', 'h2', 'bs4', 'lxml', 'lxml.etree', 'PIL', 'PIL.Image', 'dotenv', 'python_dotenv',
 ]
 if fapi_hidden:
     hidden = list(fapi_hidden) + hidden
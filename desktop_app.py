@@ -17,7 +17,7 @@ else:
     PROJECT_ROOT = Path(__file__).resolve().parent
     if str(PROJECT_ROOT) not in sys.path:
         sys.path.insert(0, str(PROJECT_ROOT))
-os.chdir(PROJECT_ROOT)  # чтобы load_dotenv() и history находили .env и history.json рядом с exe
+os.chdir(PROJECT_ROOT)  # чтобы load_dotenv() и history находили .env и history.db рядом с exe
 
 # Порты и хост для десктопа — только localhost
 DESKTOP_HOST = "127.0.0.1"
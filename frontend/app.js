@@ -36,6 +36,47 @@ function formatAnalysis(analysis) {
   return s || JSON.stringify(analysis, null, 2);
 }
 
+// POST с ответом text/event-stream: onEvent(имя, данные) для каждого события по мере прихода
+async function postSSE(path, body, onEvent) {
+  const res = await fetch(API + path, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  });
+  if (!res.ok || !res.body) {
+    let data = {};
+    try { data = await res.json(); } catch (_) {}
+    throw new Error(res.status === 404
+      ? 'Сервер вернул 404. Убедитесь, что сервер запущен (python run.py) и откройте http://127.0.0.1:8000'
+      : (data.detail || data.error || `Ошибка ${res.status}`));
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const chunk = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = 'message', data = '';
+      chunk.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      onEvent(event, data ? JSON.parse(data) : null);
+    }
+  }
+}
+
+// Частичный анализ из событий item/field: элементы массивов появляются по одному
+function applyAnalysisEvent(partial, event, data) {
+  if (event === 'item') (partial[data.field] = partial[data.field] || []).push(data.value);
+  else if (event === 'field') partial[data.field] = data.value;
+}
+
 document.querySelectorAll('.tab').forEach(btn => {
   btn.addEventListener('click', () => {
     document.querySelectorAll('.tab').forEach(b => b.classList.remove('active'));
@@ -52,23 +93,18 @@ document.getElementById('btn-analyze-text').addEventListener('click', async () =
   const text = document.getElementById('text-input').value.trim();
   if (text.length < 10) { showError('Введите минимум 10 символов'); return; }
   show(document.getElementById('loading'), true);
+  const partial = {};
+  let failed = false;
   try {
-    const url = API + '/analyze_text';
-    const res = await fetch(url, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ text })
+    await postSSE('/analyze_text/stream', { text }, (event, data) => {
+      if (event === 'item' || event === 'field') {
+        applyAnalysisEvent(partial, event, data);
+        showResult(formatAnalysis(partial));
+        show(document.getElementById('loading'), true);
+      } else if (event === 'result') showResult(formatAnalysis(data.analysis));
+      else if (event === 'error') { failed = true; showError(data.error || 'Ошибка анализа'); }
     });
-    let data = {};
-    try { data = await res.json(); } catch (_) {}
-    if (!res.ok) {
-      showError(res.status === 404
-        ? `Сервер вернул 404. Убедитесь, что сервер запущен (python run.py) и откройте http://127.0.0.1:8000`
-        : (data.detail || data.error || `Ошибка ${res.status}`));
-      return;
-    }
-    if (data.success) showResult(formatAnalysis(data.analysis));
-    else showError(data.error || 'Ошибка анализа');
+    if (!failed) show(document.getElementById('loading'), false);
   } catch (err) { showError(err.message || 'Ошибка сети'); }
 });
 
@@ -77,34 +113,61 @@ document.getElementById('btn-analyze-image').addEventListener('click', async ()
   if (!input.files?.length) { showError('Выберите файл изображения'); return; }
   show(document.getElementById('loading'), true);
   const form = new FormData();
-  form.append('file', input.files[0]);
+  const many = input.files.length > 1;
+  if (many) for (const f of input.files) form.append('files', f);
+  else form.append('file', input.files[0]);
   try {
-    const res = await fetch(API + '/analyze_image', { method: 'POST', body: form });
+    const res = await fetch(API + (many ? '/analyze_images' : '/analyze_image'), { method: 'POST', body: form });
     const data = await res.json();
-    if (data.success) showResult(formatAnalysis(data.analysis));
+    if (!res.ok) showError(data.detail || 'Ошибка анализа');
+    else if (data.success) showResult(many ? formatImageBatch(data.results, data.visual_style) : formatAnalysis(data.analysis));
     else showError(data.error || 'Ошибка анализа');
   } catch (err) { showError(err.message); }
 });
 
+function formatImageBatch(results, style) {
+  let s = '';
+  if (style && style.count) {
+    s += 'Оценка визуального стиля: средняя ' + style.mean + ', медиана ' + style.median + ', от ' + style.min + ' до ' + style.max + '\n';
+    s += Object.entries(style.histogram).map(([score, n]) => score + '/10: ' + n).join(', ') + '\n\n';
+  }
+  for (const r of results || []) {
+    s += '=== ' + r.filename + ' ===\n';
+    s += r.success ? formatAnalysis(r.analysis) : 'Ошибка: ' + r.error + '\n\n';
+  }
+  return s;
+}
+
+function formatParsed(d, analysis) {
+  let s = 'URL: ' + d.url + '\n';
+  if (d.not_modified) s += 'Страница не изменилась с прошлой проверки — показан прошлый анализ\n';
+  if (d.title) s += 'Title: ' + d.title + '\n';
+  if (d.h1) s += 'H1: ' + d.h1 + '\n';
+  if (analysis) s += '\n' + formatAnalysis(analysis);
+  return s;
+}
+
 document.getElementById('btn-parse').addEventListener('click', async () => {
   const url = document.getElementById('parse-input').value.trim();
   if (!url) { showError('Введите URL'); return; }
   show(document.getElementById('loading'), true);
+  let page = null;
+  const partial = {};
+  let failed = false;
   try {
-    const res = await fetch(API + '/parse_demo', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ url })
+    await postSSE('/parse_demo/stream', { url }, (event, data) => {
+      if (event === 'page') {
+        page = data;
+        showResult(formatParsed(page, null));
+        show(document.getElementById('loading'), true);
+      } else if (event === 'item' || event === 'field') {
+        applyAnalysisEvent(partial, event, data);
+        showResult(formatParsed(page, partial));
+        show(document.getElementById('loading'), true);
+      } else if (event === 'result') showResult(formatParsed(data.data, data.data.analysis));
+      else if (event === 'error') { failed = true; showError(data.error || 'Ошибка парсинга'); }
     });
-    const data = await res.json();
-    if (data.success && data.data) {
-      const d = data.data;
-      let s = 'URL: ' + d.url + '\n';
-      if (d.title) s += 'Title: ' + d.title + '\n';
-      if (d.h1) s += 'H1: ' + d.h1 + '\n';
-      if (d.analysis) s += '\n' + formatAnalysis(d.analysis);
-      showResult(s);
-    } else showError(data.error || 'Ошибка парсинга');
+    if (!failed) show(document.getElementById('loading'), false);
   } catch (err) { showError(err.message); }
 });
 
@@ -113,6 +176,7 @@ function formatHistoryDetails(item) {
   const d = item.details;
   if (item.request_type === 'parse') {
     let s = 'URL: ' + (d.url || '') + '\n';
+    if (d.not_modified) s += 'Страница не изменилась с прошлой проверки\n';
     if (d.title) s += 'Title: ' + d.title + '\n';
     if (d.h1) s += 'H1: ' + d.h1 + '\n';
     if (d.first_paragraph) s += 'Первый абзац: ' + (d.first_paragraph || '').slice(0, 300) + (d.first_paragraph && d.first_paragraph.length > 300 ? '…' : '') + '\n\n';
@@ -120,37 +184,73 @@ function formatHistoryDetails(item) {
     return s;
   }
   if (d.analysis) return formatAnalysis(d.analysis);
+  if (d.images) return formatImageBatch(d.images, d.visual_style);
   return JSON.stringify(d, null, 2);
 }
 
-let historyItems = [];
+let historyCursor = null;
+
+function openHistoryItem(id) {
+  document.getElementById('error').style.display = 'none';
+  fetch(API + '/history/' + encodeURIComponent(id))
+    .then(r => r.ok ? r.json() : Promise.reject(new Error('Запись не найдена')))
+    .then(item => showResult(formatHistoryDetails(item)))
+    .catch(err => showError(err.message));
+}
+
+function renderHistoryItem(item) {
+  const div = document.createElement('div');
+  div.className = 'history-item';
+  div.innerHTML = '<span class="type">' + item.request_type + '</span> ' + (item.timestamp || '').slice(0, 19) + '<br>' + (item.request_summary || '').slice(0, 80) + (item.request_summary && item.request_summary.length > 80 ? '…' : '') + '<br><span class="time">' + (item.response_summary || '').slice(0, 100) + '</span><br><span class="open-hint">Клик — открыть полную информацию</span>';
+  div.style.cursor = 'pointer';
+  div.addEventListener('click', () => openHistoryItem(item.id));
+  return div;
+}
+
+function loadHistory(append) {
+  const list = document.getElementById('history-list');
+  let url = API + '/history?limit=50';
+  if (append && historyCursor) url += '&cursor=' + encodeURIComponent(historyCursor);
+  fetch(url)
+    .then(r => r.json())
+    .then(data => {
+      if (!append) list.innerHTML = '';
+      const more = document.getElementById('btn-history-more');
+      if (more) more.remove();
+      (data.items || []).forEach(item => list.appendChild(renderHistoryItem(item)));
+      historyCursor = data.next_cursor || null;
+      if (historyCursor) {
+        const btn = document.createElement('button');
+        btn.id = 'btn-history-more';
+        btn.textContent = 'Показать ещё';
+        btn.addEventListener('click', () => loadHistory(true));
+        list.appendChild(btn);
+      }
+    })
+    .catch(() => {});
+}
 
-function loadHistory() {
-  fetch(API + '/history')
+function searchHistory() {
+  const q = document.getElementById('history-search-input').value.trim();
+  if (!q) { loadHistory(); return; }
+  fetch(API + '/history/search?q=' + encodeURIComponent(q))
     .then(r => r.json())
     .then(data => {
-      historyItems = data.items || [];
       const list = document.getElementById('history-list');
       list.innerHTML = '';
-      historyItems.forEach((item, index) => {
-        const div = document.createElement('div');
-        div.className = 'history-item';
-        div.dataset.index = index;
-        const hasDetails = item.details && (item.request_type === 'parse' || item.details.analysis);
-        div.innerHTML = '<span class="type">' + item.request_type + '</span> ' + (item.timestamp || '').slice(0, 19) + '<br>' + (item.request_summary || '').slice(0, 80) + (item.request_summary && item.request_summary.length > 80 ? '…' : '') + '<br><span class="time">' + (item.response_summary || '').slice(0, 100) + '</span>' + (hasDetails ? '<br><span class="open-hint">Клик — открыть полную информацию</span>' : '');
-        if (hasDetails) {
-          div.style.cursor = 'pointer';
-          div.addEventListener('click', () => {
-            document.getElementById('error').style.display = 'none';
-            showResult(formatHistoryDetails(item));
-          });
-        }
-        list.appendChild(div);
-      });
+      historyCursor = null;
+      const items = data.items || [];
+      if (!items.length) list.textContent = 'Ничего не найдено';
+      items.forEach(item => list.appendChild(renderHistoryItem(item)));
     })
-    .catch(() => {});
+    .catch(err => showError(err.message));
 }
 
+document.getElementById('btn-history-search').addEventListener('click', searchHistory);
+document.getElementById('history-search-input').addEventListener('keydown', e => {
+  if (e.key === 'Enter') searchHistory();
+});
+
 document.getElementById('btn-clear-history').addEventListener('click', async () => {
   try {
     await fetch(API + '/history', { method: 'DELETE' });
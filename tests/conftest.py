@@ -0,0 +1,21 @@
+"""
+Общие настройки тестов: синглтоны сервисов создаются при импорте — их базы во временной папке, не в проекте.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+_workdir = Path(tempfile.mkdtemp(prefix="competitor-tests-"))
+for name, filename in (
+    ("HISTORY_DB_FILE", "history.db"),
+    ("PAGE_STATE_FILE", "page_state.db"),
+    ("WATCH_DB_FILE", "watch.db"),
+    ("JOB_DB_FILE", "jobs.db"),
+):
+    os.environ.setdefault(name, str(_workdir / filename))
+os.environ.setdefault("LLM_CACHE_DIR", str(_workdir / "llm_cache"))
@@ -0,0 +1,52 @@
+"""
+Кэш ответов LLM: асинхронные get/set — память сразу, дисковый уровень в потоке, не в цикле событий.
+"""
+import asyncio
+import threading
+
+from backend.services.cache_service import AnalysisCache
+
+
+def _disk_cache(tmp_path, calls: list) -> AnalysisCache:
+    cache = AnalysisCache()
+    cache.enabled = True
+    cache.disk_dir = tmp_path
+    for name in ("_read_disk", "_write_disk"):
+        method = getattr(cache, name)
+
+        def traced(*args, _method=method, _name=name):
+            calls.append((_name, threading.get_ident()))
+            return _method(*args)
+
+        setattr(cache, name, traced)
+    return cache
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path):
+    calls = []
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        writer = _disk_cache(tmp_path, calls)
+        await writer.set_async("k" * 64, {"summary": "s"})
+        assert await writer.get_async("k" * 64) == {"summary": "s"}
+
+        reader = _disk_cache(tmp_path, calls)
+        assert await reader.get_async("k" * 64) == {"summary": "s"}
+        assert await reader.get_async("m" * 64) is None
+        return loop_thread, writer.stats(), reader.stats()
+
+    loop_thread, writer_stats, reader_stats = asyncio.run(scenario())
+    # Попадание в память диск не читает; остальное — в рабочем потоке
+    assert [name for name, _ in calls] == ["_write_disk", "_read_disk", "_read_disk"]
+    assert all(thread != loop_thread for _, thread in calls)
+    assert writer_stats["hits"] == 1
+    assert (reader_stats["disk_hits"], reader_stats["misses"]) == (1, 1)
+
+
+def test_sync_and_async_share_entries(tmp_path):
+    cache = _disk_cache(tmp_path, [])
+    cache.set("a" * 64, {"v": 1})
+    assert asyncio.run(cache.get_async("a" * 64)) == {"v": 1}
+    asyncio.run(cache.set_async("b" * 64, {"v": 2}))
+    assert cache.get("b" * 64) == {"v": 2}
@@ -0,0 +1,32 @@
+"""
+Курсор пагинации истории: испорченный или вне диапазона seq — ValueError (в /history это 400, а не 500).
+"""
+import base64
+
+import pytest
+
+from backend.services.history_service import MAX_SEQ, _decode_cursor, _encode_cursor, history_service
+
+
+def _raw_cursor(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("seq", [1, 42, MAX_SEQ])
+def test_round_trip(seq):
+    assert _decode_cursor(_encode_cursor(seq)) == seq
+
+
+@pytest.mark.parametrize("cursor", [
+    "%%%",
+    _raw_cursor("abc"),
+    _raw_cursor("0"),
+    _raw_cursor("-5"),
+    _raw_cursor(str(MAX_SEQ + 1)),
+    _raw_cursor("9" * 40),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor)
+    with pytest.raises(ValueError):
+        history_service.get_page(limit=10, cursor=cursor)
@@ -0,0 +1,144 @@
+"""
+Паритет потокового извлечения (html_extract) с эталонным _extract_from_soup: одинаковые
+title, h1 и первый абзац при любой нарезке байтов, плюс ранняя остановка и лимит PARSER_MAX_BYTES.
+"""
+import asyncio
+
+import httpx
+import pytest
+from bs4 import BeautifulSoup
+
+from backend.config import settings
+from backend.services.html_extract import StreamingExtractor, extract_from_html
+from backend.services.parser_service import ParserService, _extract_from_soup
+
+LONG = "Юридическая фирма сопровождает сделки и споры в арбитражных судах по всей России"
+LONG_EN = "Our law firm represents clients in commercial disputes before arbitration courts"
+
+DOCUMENTS = {
+    "main": f"""<html><head><title>Юрфирма «Право»</title></head><body>
+        <p>{LONG_EN} — вне main</p>
+        <main><h1>Корпоративное право</h1><p>Коротко</p><p>{LONG}</p></main></body></html>""",
+    "article": f"""<html><head><title>Новости</title></head><body><h1>Изменения</h1>
+        <article><p>{LONG}</p></article><main><p>{LONG_EN}</p></main></body></html>""",
+    "body_fallback": f"""<html><head><title>T</title></head><body><div><h1>H</h1>
+        <p>short</p><div><p>{LONG}</p></div></div></body></html>""",
+    "main_without_long_paragraph": f"""<html><head><title>T</title></head><body>
+        <p>{LONG}</p><main><h1>H</h1><p>Коротко</p></main><p>{LONG_EN}</p></body></html>""",
+    "main_after_body_paragraphs": f"""<html><head><title>T</title></head><body><p>{LONG_EN}</p>
+        <h1>H</h1><main><p>{LONG}</p></main></body></html>""",
+    "nested_paragraphs": f"""<html><head><title>T</title></head><body><main><h1>H</h1>
+        <p>Внешний <span>абзац <p>{LONG}</p> хвост</span> конец</p><p>{LONG_EN}</p></main></body></html>""",
+    "paragraph_length_boundary": f"""<html><head><title>T</title></head><body><main><h1>H</h1>
+        <p>{"а" * 50}</p><p>{"б" * 51}</p></main></body></html>""",
+    "paragraph_truncated": f"""<html><head><title>T</title></head><body><main><h1>H</h1>
+        <p>{"Длинный текст абзаца. " * 40}</p></main></body></html>""",
+    "script_and_style_skipped": f"""<html><head><title>Заголовок<script>var t = 1;</script></title>
+        <style>p {{ color: red }}</style></head><body><main>
+        <h1>Услуги <style>.x{{}}</style>юриста</h1>
+        <p><script>document.write("{LONG_EN}")</script>Коротко</p>
+        <p>{LONG}<script>track();</script> <b>и</b> консультации</p></main></body></html>""",
+    "markup_inside_text": f"""<html><head><title> Пробелы   вокруг </title></head><body><main>
+        <h1><a href="/">Главная</a> <em>страница</em></h1>
+        <p>{LONG[:30]}<!-- комментарий --><b>{LONG[30:]}</b></p></main></body></html>""",
+    "missing_title_and_h1": f"""<html><body><main><p>{LONG}</p></main></body></html>""",
+    "empty_title_and_h1": f"""<html><head><title></title></head><body><h1></h1><p>{LONG}</p></body></html>""",
+    "no_body_paragraphs": """<html><head><title>T</title></head><body><h1>H</h1><div>текст</div></body></html>""",
+    "second_h1_and_title_ignored": f"""<html><head><title>Первый</title><title>Второй</title></head>
+        <body><h1>Один</h1><h1>Два</h1><main><p>{LONG}</p></main></body></html>""",
+    "broken_markup": f"""<title>Без head<h1>Незакрытый h1<main><p>{LONG}<p>{LONG_EN}""",
+}
+
+
+def soup_result(html: str):
+    return _extract_from_soup(BeautifulSoup(html, "lxml"))
+
+
+def feed_chunks(data: bytes, size: int, encoding=None):
+    """Подавать кусками по size байт до ранней остановки; результат finish()."""
+    extractor = StreamingExtractor(encoding)
+    for i in range(0, len(data), size):
+        if extractor.feed(data[i:i + size]):
+            break
+    return extractor.finish()
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_text_parity(name):
+    html = DOCUMENTS[name]
+    assert extract_from_html(html) == soup_result(html)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 4096, 1 << 20])
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_byte_chunk_parity(name, size):
+    """Куски режут теги и многобайтовые символы UTF-8; кодировка — из заголовка или по умолчанию."""
+    html = DOCUMENTS[name]
+    expected = soup_result(html)
+    data = html.encode("utf-8")
+    assert feed_chunks(data, size, encoding="utf-8") == expected
+    assert feed_chunks(data, size) == expected
+
+
+@pytest.mark.parametrize("size", [1, 5, 4096])
+def test_meta_charset(size):
+    """Кодировка из <meta charset> в начале документа (cp1251 — однобайтная, не UTF-8)."""
+    html = (
+        '<html><head><meta charset="windows-1251"><title>Юрфирма</title></head>'
+        f"<body><h1>Право</h1><main><p>{LONG}</p></main></body></html>"
+    )
+    assert feed_chunks(html.encode("cp1251"), size) == soup_result(html)
+
+
+def test_multibyte_split_inside_character():
+    """Граница куска посреди двухбайтового символа не портит текст."""
+    html = DOCUMENTS["main"]
+    data = html.encode("utf-8")
+    split = data.index("Юрфирма".encode("utf-8")) + 1
+    extractor = StreamingExtractor("utf-8")
+    extractor.feed(data[:split])
+    extractor.feed(data[split:])
+    assert extractor.finish() == soup_result(html)
+
+
+def _response(chunks, consumed: list) -> httpx.Response:
+    async def stream():
+        for chunk in chunks:
+            consumed.append(len(chunk))
+            yield chunk
+
+    return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, content=stream())
+
+
+def test_early_stop():
+    """Все поля найдены в начале — остаток страницы не читается, результат как у полного разбора."""
+    head = (
+        f"<html><head><title>T</title></head><body><main><h1>H</h1><p>{LONG}</p></main>"
+    ).encode("utf-8")
+    tail = [b"<div>" + b"x" * 1000 + b"</div>" for _ in range(100)]
+    consumed = []
+    result = asyncio.run(ParserService._read_and_extract(_response([head, *tail], consumed)))
+    full = head.decode("utf-8") + b"".join(tail).decode("ascii") + "</body></html>"
+    assert result == soup_result(full)
+    assert len(consumed) < 5
+
+
+def test_extractor_reports_complete_only_when_fields_final():
+    """Без <main>/<article> абзац из body может смениться на абзац из main позже — ранней остановки нет."""
+    extractor = StreamingExtractor("utf-8")
+    assert not extractor.feed(f"<html><head><title>T</title></head><body><h1>H</h1><p>{LONG}</p>".encode())
+    assert extractor.feed(f"<main><p>{LONG_EN}</p></main>".encode())
+    assert extractor.finish() == ("T", "H", LONG_EN)
+
+
+def test_max_bytes_cutoff(monkeypatch):
+    """После PARSER_MAX_BYTES чтение прекращается; поля — по прочитанной части."""
+    monkeypatch.setattr(settings, "parser_max_bytes", 2048)
+    head = b"<html><head><title>T</title></head><body><h1>H</h1>"
+    filler = [b"<div>" + b"y" * 500 + b"</div>" for _ in range(20)]
+    late = f"<p>{LONG}</p></body></html>".encode("utf-8")
+    consumed = []
+    result = asyncio.run(ParserService._read_and_extract(_response([head, *filler, late], consumed)))
+    assert result == ("T", "H", None)
+    assert sum(consumed) >= 2048
+    assert sum(consumed) < 2048 + 600
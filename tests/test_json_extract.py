@@ -0,0 +1,54 @@
+"""
+Разбор JSON из ответа модели (json_extract): починка типичных ошибок, обрыв на max_tokens,
+время на больших и глубоко вложенных ответах.
+"""
+import time
+
+import pytest
+
+from backend.services.json_extract import extract_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('Вот анализ:\n```json\n{"a": [1, 2]}\n```\nГотово.', {"a": [1, 2]}),
+    ('{по запросу} {"a": "}"}', {"a": "}"}),
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{“a”: “цитата \\"в\\" тексте”}', {"a": 'цитата "в" тексте'}),
+])
+def test_extract_and_repair(text, expected):
+    assert extract_json(text)[0] == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a": "обрыв строки', {"a": "обрыв строки"}),
+    ('{"a": 1, "b": {"c": [1, {"d": ', {"a": 1, "b": {"c": [1, {}]}}),
+    ('{"a": 1, "b": 12.', {"a": 1}),
+])
+def test_truncated_reply(text, expected):
+    assert extract_json(text) == (expected, True)
+
+
+def test_list_from_wrapper_object():
+    assert extract_json('{"items": [{"a": 1}]}', expect=list)[0] == [{"a": 1}]
+
+
+@pytest.mark.parametrize("depth", [2000, 50_000])
+def test_deeply_nested_reply_is_rejected(depth):
+    """Вложенность глубже предела рекурсии json — не JSON, а не RecursionError."""
+    assert extract_json('{"a":' + "[" * depth) == (None, False)
+    assert extract_json("[" * depth + "]" * depth, expect=list) == (None, False)
+
+
+def test_large_truncated_reply_is_linear():
+    """Обрыв длинного глубоко вложенного ответа: точки обрыва не копируют стек скобок — время линейно."""
+    text = '{"a": ' + "[" * 900 + "1, " * 300_000
+    started = time.perf_counter()
+    value, repaired = extract_json(text)
+    assert time.perf_counter() - started < 2
+    assert repaired and len(value["a"]) == 1
+
+    item = '{"k": [1, 2], "v": "x"}, '
+    value, repaired = extract_json('{"items": [' + item * 20_000 + '{"k": [1')
+    assert repaired and len(value["items"]) == 20_001
@@ -0,0 +1,44 @@
+"""
+Пакетный конвейер: обрыв потребителя (клиент отключился) отменяет и загрузку, и начатые анализы.
+"""
+import asyncio
+
+from backend.models.schemas import ParsedContent
+from backend.services import pipeline
+from backend.services.parser_service import PageFetch
+
+URLS = [f"https://example.com/{i}" for i in range(5)]
+
+
+def test_disconnect_cancels_pending_analyses(monkeypatch):
+    started, cancelled = [], []
+
+    async def parse_many(urls):
+        for url in urls:
+            yield PageFetch(url=url, title="T")
+        await asyncio.sleep(3600)
+
+    async def analyze(url, fetch, bypass_cache, **kwargs):
+        started.append(url)
+        if url != URLS[0]:
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+        return ParsedContent(url=url, title="T")
+
+    monkeypatch.setattr(pipeline.parser_service, "parse_many", parse_many)
+    monkeypatch.setattr(pipeline, "_analyze", analyze)
+
+    async def consume_first():
+        stream = pipeline.parse_and_analyze_many(URLS)
+        first = await stream.__anext__()
+        await stream.aclose()
+        # К концу aclose() анализы уже отменены, а не висят до остановки цикла событий
+        assert sorted(cancelled) == sorted(URLS[1:])
+        return first
+
+    first = asyncio.run(asyncio.wait_for(consume_first(), 5))
+    assert first.url == URLS[0]
+    assert sorted(started) == sorted(URLS)